@@ -1,4 +1,5 @@
 """ Contains functions to fetch info from different simple online APIs."""
+import util.executor
 import util.web
 from bs4 import BeautifulSoup
 import goslate
@@ -23,6 +24,9 @@ def urbandictionary_search(search):
     else:
         return None
 
+
+urbandictionary_search_async = util.executor.background(urbandictionary_search)
+
     
 def whois(ip):
     """
@@ -49,6 +53,9 @@ def whois(ip):
         return None
 
 
+whois_async = util.executor.background(whois)
+
+
 def chuck_norris():
     """
     Finds a random Chuck Norris joke/quote.
@@ -63,6 +70,9 @@ def chuck_norris():
         return None
 
 
+chuck_norris_async = util.executor.background(chuck_norris)
+
+
 def advice():
     """
     Random sentences of advice.
@@ -77,6 +87,9 @@ def advice():
         return None
 
 
+advice_async = util.executor.background(advice)
+
+
 def time_is(location):
     """
     Retrieves the time in a location by parsing the time element in the html from Time.is .
@@ -111,8 +124,14 @@ def time_is(location):
         return None
 
 
+time_is_async = util.executor.background(time_is)
+
+
 def translate(query, en=True):
     if en is True:
         return str(gs.translate(str(query), 'en'))
     else:
         pass
+
+
+translate_async = util.executor.background(translate)
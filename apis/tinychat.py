@@ -1,49 +1,153 @@
 """ Contains functions to fetch info from tinychat's API. """
+import collections
+import logging
 import time
 
+import util.cache
+import util.executor
 import util.web
 
+log = logging.getLogger(__name__)
 
-def user_info(tc_account):
+# Account and room info (tcinfo) lookups, shared by user_info and room_info.
+TCINFO_CACHE = util.cache.Cache('tcinfo', max_size=2000, ttl=300, negative_ttl=60)
+# Spy info lookups, room user counts change fast so keep them briefly.
+SPY_CACHE = util.cache.Cache('spy', max_size=200, ttl=30, negative_ttl=10)
+
+
+def _tcinfo(name):
+    """
+    Fetch the raw tcinfo for a account or room name.
+    :param name: str the account or room name.
+    :return: dict the tcinfo json or None on error.
+    """
+    url = 'https://tinychat.com/api/tcinfo?username=%s' % name
+    response = util.web.http_get(url=url, json=True)
+    if response['json'] is not None and 'error' not in response['json']:
+        return response['json']
+    return None
+
+
+def tcinfo(name, use_cache=True):
+    """
+    Get the raw tcinfo for a account or room name, from the cache if possible.
+
+    Concurrent lookups of the same name are coalesced in to a single request.
+    :param name: str the account or room name.
+    :param use_cache: bool False to always make a new request (the result is still cached).
+    :return: dict the tcinfo json or None on error.
+    """
+    if not use_cache:
+        info = _tcinfo(name)
+        TCINFO_CACHE.put(name.lower(), info)
+        return info
+    return TCINFO_CACHE.get_or_fetch(name.lower(), _tcinfo, name)
+
+
+def user_info(tc_account, use_cache=True):
     """
     Finds info for a given tinychat account name.
     :param tc_account: str the account name.
+    :param use_cache: bool False to bypass the tcinfo cache.
     :return: dict {'username', 'tinychat_id', 'last_active', 'name', 'location', 'biography'} or None on error.
     """
-    url = 'https://tinychat.com/api/tcinfo?username=%s' % tc_account
-    response = util.web.http_get(url=url, json=True)
-    if response['json'] is not None:
-        if 'error' not in response['json']:
-            username = response['json']['username']
-            user_id = response['json']['id']
-            last_active = time.ctime(int(response['json']['last_active']))
-            name = response['json']['name']
-            location = response['json']['location']
-            biography = response['json']['biography']
-            website = response['json']['website']
-
-            return {
-                'username': username,
-                'tinychat_id': user_id,
-                'last_active': last_active,
-                'name': name,
-                'location': location,
-                'biography': biography,
-                'website': website
-            }
+    info = tcinfo(tc_account, use_cache=use_cache)
+    if info is not None:
+        username = info['username']
+        user_id = info['id']
+        last_active = time.ctime(int(info['last_active']))
+        name = info['name']
+        location = info['location']
+        biography = info['biography']
+        website = info['website']
+
+        return {
+            'username': username,
+            'tinychat_id': user_id,
+            'last_active': last_active,
+            'name': name,
+            'location': location,
+            'biography': biography,
+            'website': website
+        }
+
+
+user_info_async = util.executor.background(user_info)
+
+
+def prefetch_user_info(accounts, workers=8, callback=None, group=None):
+    """
+    Look up a batch of accounts concurrently, filling the tcinfo cache.
+
+    The lookups run in the default executor, at most workers at a time, this function returns right away.
+    Accounts already cached are not requested again. Once the group is cancelled
+    with util.executor.cancel_group, e.g when the client disconnects, no more lookups are started.
+    :param accounts: list of account names.
+    :param workers: int the maximum amount of concurrent requests.
+    :param callback: function called with the account name and the user_info dict (or None) for each account.
+    :param group: the group the lookups belong to, e.g a client.
+    :return: int the amount of accounts requested.
+    """
+    jobs = collections.deque()
+    seen = set()
+    for account in accounts:
+        if account.lower() in seen:
+            continue
+        seen.add(account.lower())
+        if account.lower() in TCINFO_CACHE:
+            if callback is not None:
+                callback(account, user_info(account))
         else:
-            return None
+            jobs.append(account)
 
+    def submit_next():
+        try:
+            _account = jobs.popleft()
+        except IndexError:
+            return
+        future = util.executor.submit(user_info, (_account,), group=group)
+        future.add_done_callback(lambda f: done(f, _account))
 
-def spy_info(room):
+    def done(future, _account):
+        if future.cancelled():
+            return
+        submit_next()
+        try:
+            info = future.result()
+        except Exception as e:
+            log.error('prefetch error for %s: %s' % (_account, e))
+            return
+        if callback is not None:
+            callback(_account, info)
+
+    requested = len(jobs)
+    for _ in xrange(min(workers, requested)):
+        submit_next()
+    log.debug('prefetching info for %s accounts, %s cached', requested, len(seen) - requested)
+    return requested
+
+
+def spy_info(room, use_cache=True):
     """
     Finds info for a given room name.
 
     The info shows how many mods, broadcasters and total users(list)
 
     :param room: str the room name to get spy info for.
+    :param use_cache: bool False to bypass the spy cache.
     :return: dict{'mod_count', 'broadcaster_count', 'total_count', list('users')} or {'error'}.
     """
+    if not use_cache:
+        info = _spy_info(room)
+        SPY_CACHE.put(room.lower(), info)
+        return info
+    return SPY_CACHE.get_or_fetch(room.lower(), _spy_info, room)
+
+
+spy_info_async = util.executor.background(spy_info)
+
+
+def _spy_info(room):
     url = 'https://api.tinychat.com/%s.json' % room
     response = util.web.http_get(url, json=True)
     if response['json'] is not None:
@@ -63,19 +167,19 @@ def spy_info(room):
             return {'error': response['json']['error']}
 
 
-def room_info(tc_room):
+def room_info(tc_room, use_cache=True):
     """
     Finds info for a given tinychat room name.
     :param tc_room: str the room name.
+    :param use_cache: bool False to bypass the tcinfo cache.
     :return: dict {'tinychat_id'} or None on error.
     """
-    url = 'https://tinychat.com/api/tcinfo?username=%s' % tc_room
-    response = util.web.http_get(url=url, json=True)
-    if response['json'] is not None:
-        if 'error' not in response['json']:
-            room_id = response['json']['id']
-            return {
-                'tinychat_id': room_id
-            }
-        else:
-            return None
+    info = tcinfo(tc_room, use_cache=use_cache)
+    if info is not None:
+        room_id = info['id']
+        return {
+            'tinychat_id': room_id
+        }
+
+
+room_info_async = util.executor.background(room_info)
@@ -115,6 +115,12 @@ def main():
                             bot.send_ban_msg(_user.nick, _user.id)
                     else:
                         print ('No user named: %s' % msg_parts[1])
+            elif cmd == '/s':
+                for line in tinybot.pinylib.metrics.report():
+                    print (line)
+            elif cmd == '/t':
+                for timer in tinybot.pinylib.timer_wheel.pending():
+                    print (timer)
             elif cmd == '/k':
                 if len(msg_parts) is 2:
                     _user = bot.users.search(msg_parts[1])
@@ -13,6 +13,13 @@ DEBUG_MODE = False
 DEBUG_TO_FILE = False
 # Logging level for the debug file.
 DEBUG_LEVEL = 30
+# Log every RTMP header and message sent and received at debug level, this slows the bot down.
+TRACE_PACKETS = False
+# The amount of the last RTMP headers and messages kept, and written to the flight recorder file on
+# a read error, reconnect or crash. 0 disables the flight recorder.
+FLIGHT_RECORDER_SIZE = 0
+# The name of the flight recorder file, in the logs folder of the room.
+FLIGHT_RECORDER_FILE_NAME = 'flight_recorder.log'
 # Use colors for the console.
 CONSOLE_COLORS = True
 # Enable auto job (recommended)
@@ -21,10 +28,82 @@ ENABLE_AUTO_JOB = True
 USE_24HOUR = True
 # Reset the run time after a reconnect.
 RESET_INIT_TIME = False
-# Reconnect delay in seconds.
+# Reconnect delay in seconds, the delay doubles (with a random part) for every failed attempt.
 RECONNECT_DELAY = 10
+# The maximum reconnect delay in seconds.
+RECONNECT_MAX_DELAY = 900
+# The maximum delay before the first reconnect attempt in seconds.
+RECONNECT_FIRST_DELAY = 1
+# Seconds the RTMP parameters are reused when reconnecting.
+RECONNECT_PARAMS_TTL = 300
+# Seconds a broadcast (bauth) key is reused.
+BAUTH_KEY_TTL = 600
+# Keep a standby connection to the server, to fail over to without delay when the connection is lost.
+STANDBY_ENABLED = False
+# Seconds between replacing the standby connection with a new one.
+STANDBY_REFRESH_INTERVAL = 45
+# Seconds a standby connection is considered usable.
+STANDBY_MAX_AGE = 60
+# The average amount of messages sent to the server per second.
+OUTBOUND_RATE = 3
+# The maximum amount of messages sent to the server at once.
+OUTBOUND_BURST = 6
+# The amount of queued messages before new chat messages are dropped, other messages are never dropped.
+OUTBOUND_MAX_SIZE = 200
+# The maximum amount of bytes held per recording while the disk catches up, frames are dropped beyond it.
+RECORD_MAX_BUFFER = 8388608
+# Seconds to wait for the server to create the stream of a recording, before the recording is dropped.
+RECORD_STREAM_TIMEOUT = 30
+# Seconds to wait for the cam playlist to stop sending before the stream is closed.
+PUBLISH_STOP_TIMEOUT = 2
+# Seconds a connection is idle before keepalive probes are sent.
+SOCKET_KEEPALIVE_IDLE = 10
+# Seconds between keepalive probes.
+SOCKET_KEEPALIVE_INTERVAL = 3
+# The amount of unanswered keepalive probes before the connection is dropped (not on windows).
+SOCKET_KEEPALIVE_COUNT = 3
+# Send small chat messages right away instead of batching them (disables Nagle's algorithm).
+SOCKET_NODELAY = True
+# The socket send buffer size in bytes, 0 for the system default.
+SOCKET_SEND_BUFFER = 0
+# The socket receive buffer size in bytes, 0 for the system default.
+SOCKET_RECV_BUFFER = 0
+# Seconds sent data may stay unacknowledged before the connection is dropped, 0 for the system default (linux only).
+SOCKET_USER_TIMEOUT = 30
+# Ping the server, and reconnect when nothing is read for too long.
+WATCHDOG_ENABLED = True
+# Seconds between pings.
+WATCHDOG_PING_INTERVAL = 15
+# Seconds without reading anything before the connection is considered stalled.
+WATCHDOG_STALL_TIMEOUT = 60
 # Auto job interval in seconds.
 AUTO_JOB_INTERVAL = 300
+# Seconds account and room info lookups are cached.
+API_CACHE_TTL = 300
+# Seconds failed account and room info lookups are cached.
+API_CACHE_NEGATIVE_TTL = 60
+# The maximum amount of cached account and room info lookups.
+API_CACHE_SIZE = 2000
+# The maximum amount of concurrent account info lookups when joining a room.
+API_PREFETCH_WORKERS = 8
+# Seconds before a background API request is given up on.
+API_TIMEOUT = 30
+# The amount of hosts a HTTP client keeps a connection pool for.
+HTTP_POOL_CONNECTIONS = 10
+# The maximum amount of connections a HTTP client keeps per host.
+HTTP_POOL_MAXSIZE = 20
+# Keep the login cookies and the room config in a encrypted file, for a faster startup.
+SESSION_CACHE_ENABLED = True
+# The name of the session cache file, in the config folder.
+SESSION_CACHE_FILE_NAME = 'session.cache'
+# The secret the session cache is encrypted with, leave empty to use a random key file.
+SESSION_CACHE_SECRET = ''
+# The name of the random key file, in the config folder.
+SESSION_CACHE_KEY_FILE_NAME = 'session.key'
+# Seconds a cached room config is used.
+SESSION_CACHE_PARAMS_TTL = 3600
+# The maximum seconds login cookies are cached, they are never kept past their own expiry.
+SESSION_CACHE_LOGIN_TTL = 604800
 # The name of pinylib's debug log file.
 DEBUG_FILE_NAME = 'pinylib_debug.log'
 # The path to the config folder.
@@ -56,15 +135,48 @@ B_ALLOW_GUESTS_NICKS = True
 B_FORGIVE_AUTO_BANS = True
 # The file name of nick bans.
 B_NICK_BANS_FILE_NAME = 'nick_bans.txt'
-# A list of all the nick bans.
-B_NICK_BANS = []
 # The file name of account bans.
 B_ACCOUNT_BANS_FILE_NAME = 'account_bans.txt'
-# A list of account bans.
-B_ACCOUNT_BANS = []
 # The file name of string(words) bans.
 B_STRING_BANS_FILE_NAME = 'string_bans.txt'
-# A list of string bans.
-B_STRING_BANS = []
+# Fold the ban journals in to the ban files after this many changes.
+B_BAN_COMPACT_OPS = 200
+# Seconds between checks for changes to the ban files and the config overlay. 0 disables the checks.
+B_WATCH_INTERVAL = 5
+# The file name of the config overlay, holding KEY = value lines that override this file at runtime.
+B_CONFIG_OVERLAY_FILE_NAME = 'config_overlay.txt'
+# Check chat messages for flooding and act against the flooding user. Off by default.
+B_FLOOD_ENABLED = False
+# The maximum amount of messages a user can send within the flood window.
+B_FLOOD_MAX_MSGS = 6
+# The flood window in seconds.
+B_FLOOD_WINDOW = 5
+# The amount of identical messages among a user's recent messages considered a flood.
+B_FLOOD_MAX_DUPLICATES = 3
+# The amount of recent messages per user checked for duplicates.
+B_FLOOD_HISTORY = 10
+# The maximum amount of users to keep a message history for.
+B_FLOOD_MAX_USERS = 1000
+# The action to take against a flooding user, 'warn', 'kick' or 'ban'.
+B_FLOOD_ACTION = 'kick'
+# Detect raids (join storms) and act against the guests joining during one. Off by default,
+# a busy room can reach the join rate below, set the thresholds for your room before enabling it.
+B_RAID_ENABLED = False
+# The maximum amount of joins within the raid window.
+B_RAID_MAX_JOINS = 10
+# The raid window in seconds.
+B_RAID_WINDOW = 10
+# The amount of joins with similar nicks within the raid window considered a raid.
+B_RAID_MAX_SIMILAR = 5
+# Seconds without raid activity before raid mode ends.
+B_RAID_CALM_TIME = 30
+# The action taken against guests joining during a raid, 'kick' or 'ban'. Bans are not forgiven.
+B_RAID_ACTION = 'kick'
+# The maximum amount of raid actions sent per second.
+B_RAID_ACTION_RATE = 2
+# Paths to FLV files the bot plays on its cam when it cams up, leave empty for a blank cam.
+B_CAM_PLAYLIST = []
+# Start the cam playlist over when it ends.
+B_CAM_PLAYLIST_LOOP = True
 # The name of the bot's debug file.
 B_DEBUG_FILE_NAME = 'tinybot_debug.log'
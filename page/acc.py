@@ -4,7 +4,7 @@ import util.web
 
 class Account:
     """ This class contains methods to do login/logout and check if logged in or not. """
-    def __init__(self, account, password, proxy=None):
+    def __init__(self, account, password, proxy=None, client=None):
         """ Create a instance of the Account class.
 
         :param account: Tinychat account name.
@@ -13,10 +13,13 @@ class Account:
         :type password: str
         :param proxy: A proxy in the format IP:PORT
         :type proxy: str
+        :param client: The http client holding the login cookies, defaults to the default client.
+        :type client: util.web.HttpClient | None
         """
         self.account = account
         self.password = password
         self._proxy = proxy
+        self._client = client
         self._token = None
 
     def _parse_token(self, response=None):
@@ -27,7 +30,7 @@ class Account:
         """
         token_url = 'https://tinychat.com/start?#signin'
         if response is None:
-            response = util.web.http_get(url=token_url, referer=token_url, proxy=self._proxy)
+            response = util.web.http_get(url=token_url, referer=token_url, proxy=self._proxy, client=self._client)
 
         if response is not None and response['content'] is not None:
             soup = BeautifulSoup(response['content'], 'html.parser')
@@ -35,23 +38,21 @@ class Account:
             token = soup.find(attrs={'name': 'csrf-token'})
             self._token = token['content']
 
-    @staticmethod
-    def logout():
+    def logout(self):
         """ Log out of tinychat. """
         _cookies = ['user', 'pass', 'hash']
         for cookie in _cookies:
-            util.web.delete_cookie(cookie)
+            util.web.delete_cookie(cookie, client=self._client)
 
-    @staticmethod
-    def is_logged_in():
+    def is_logged_in(self):
         """ Check if logged in to tinychat.
 
         :return True if logged in, else False.
         :rtype: bool
         """
-        _has_cookie = util.web.has_cookie('pass')
+        _has_cookie = util.web.has_cookie('pass', client=self._client)
         if _has_cookie:
-            _is_expired = util.web.is_cookie_expired('pass')
+            _is_expired = util.web.is_cookie_expired('pass', client=self._client)
             if _is_expired:
                 return False
             return True
@@ -73,7 +74,7 @@ class Account:
         }
 
         login_response = util.web.http_post(post_url=_post_url, post_data=form_data,
-                                            follow_redirect=True, proxy=self._proxy)
+                                            follow_redirect=True, proxy=self._proxy, client=self._client)
         self._parse_token(response=login_response)
 
         # return login_response
@@ -20,7 +20,7 @@ class Params(object):
     _captcha_key_url = 'https://tinychat.com/api/captcha/check.php?room=tinychat^{0}&guest_id={1}'
     _broadcast_token_url = 'https://tinychat.com/api/broadcast.pw?site=tinychat&name={0}&nick={1}&id={2}'
 
-    def __init__(self, room_name, room_pass, swf_version, proxy=None):
+    def __init__(self, room_name, room_pass, swf_version, proxy=None, client=None):
         """ Create a instance of the Params class.
 
         :param room_name: The name of the tinychat room.
@@ -31,10 +31,13 @@ class Params(object):
         :type swf_version: str
         :param proxy: Proxy and port in the format IP:PORT
         :type proxy: str
+        :param client: The http client to use, the same as used to login.
+        :type client: util.web.HttpClient | None
         """
         self.room_name = room_name
         self.room_pass = room_pass
         self.proxy = proxy
+        self.client = client
         self.swf_version = swf_version
 
         self._config_status = None
@@ -50,7 +53,7 @@ class Params(object):
         else:
             _url = self._config_url.format(self.room_name)
 
-        _response = util.web.http_get(url=_url, proxy=self.proxy)
+        _response = util.web.http_get(url=_url, proxy=self.proxy, client=self.client)
         log.debug('room config response: %s' % _response)
         if _response['content'] is not None:
             try:
@@ -76,6 +79,32 @@ class Params(object):
                         # set the bpassword property.
                         self._bpassword = root.getAttribute('bpassword')
 
+    def dump_config(self):
+        """ The config as set by get_config, e.g to be cached.
+
+        :return: The raw config values.
+        :rtype: dict
+        """
+        return {
+            'result': self._config_status,
+            'roomtype': self._roomtype,
+            'rtmp': self._tc_url,
+            'greenroom': self._greenroom,
+            'bpassword': self._bpassword
+        }
+
+    def load_config(self, config):
+        """ Set the config from values returned by dump_config, instead of requesting it.
+
+        :param config: The raw config values.
+        :type config: dict
+        """
+        self._config_status = config['result']
+        self._roomtype = config['roomtype']
+        self._tc_url = config['rtmp']
+        self._greenroom = config['greenroom']
+        self._bpassword = config['bpassword']
+
     @property
     def config_status(self):
         """ This method can be called to check if the RTMP properties were set successfully.
@@ -218,7 +247,7 @@ class Params(object):
         ts = int(round(time.time() * 1000))
         _url = 'https://tinychat.com/cauth?room={0}&t={1}'.format(self.room_name, ts)
 
-        _response = util.web.http_get(url=_url, json=True, proxy=self.proxy)
+        _response = util.web.http_get(url=_url, json=True, proxy=self.proxy, client=self.client)
         log.debug('cauth cookie response: %s' % _response)
         if _response['json'] is not None:
             if 'cookie' in _response['json']:
@@ -237,7 +266,7 @@ class Params(object):
         t = str(random.uniform(0.9, 0.10))
         _url = 'https://tinychat.com/cauth/captcha?{0}'.format(t)
 
-        _response = util.web.http_get(url=_url, json=True, proxy=self.proxy)
+        _response = util.web.http_get(url=_url, json=True, proxy=self.proxy, client=self.client)
         log.debug('recaptcha response: %s' % _response)
         if _response['json'] is not None:
             if _response['json']['need_to_solve_captcha'] == 1:
@@ -255,7 +284,7 @@ class Params(object):
         :rtype: str | None
         """
         _url = self._captcha_key_url.format(self.room_name, uid)
-        _response = util.web.http_get(url=_url, json=True, proxy=self.proxy)
+        _response = util.web.http_get(url=_url, json=True, proxy=self.proxy, client=self.client)
 
         log.debug('captcha key response: %s' % _response)
         if _response['json'] is not None:
@@ -277,7 +306,7 @@ class Params(object):
         if self.is_greenroom:
             _url.replace('site=tinychat', 'site=greenroom')
 
-        _response = util.web.http_get(url=_url, proxy=self.proxy)
+        _response = util.web.http_get(url=_url, proxy=self.proxy, client=self.client)
         log.debug('broadcast token response: %s' % _response)
         if _response['content'] is not None:
             _xml = parseString(_response['content'])
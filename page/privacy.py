@@ -1,19 +1,32 @@
-from bs4 import BeautifulSoup
+import re
+import time
+
 import util.web
 
+# The attributes of the input and meta tags of a page.
+_TAG_PATTERN = re.compile(r'<(?:input|meta)\s([^>]*)>', re.IGNORECASE)
+# A attribute, without a value for e.g checked.
+_ATTR_PATTERN = re.compile(r'([\w:.-]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+_MODERATORS_PATTERN = re.compile(r"var moderators = '([^']*)'")
+
 
 class Privacy:
     """
     This class represents tinychat's privacy page for a room,
     it contains methods to change a rooms privacy settings.
     """
-    def __init__(self, proxy):
+    def __init__(self, proxy, client=None, settings_ttl=300):
         """ Create a instance of the Privacy class.
 
         :param proxy: A proxy in the format IP:PORT
         :type proxy: str | None
+        :param client: The http client holding the login cookies.
+        :type client: util.web.HttpClient | None
+        :param settings_ttl: Seconds the parsed settings are used, before the page is fetched again.
+        :type settings_ttl: int
         """
         self._proxy = proxy
+        self._client = client
         self._privacy_url = 'https://tinychat.com/settings/privacy'
         self._csrf_token = ''
         self._room_password = None
@@ -22,6 +35,10 @@ class Privacy:
         self._broadcast_pass_enabled = 0
         self.room_moderators = list()
         self._form_data = dict()
+        self.settings_ttl = settings_ttl
+        # The settings returned by current_settings, and the time the page was last parsed.
+        self._settings = None
+        self._parse_time = None
 
     @staticmethod
     def _is_tc_account(account_name):
@@ -52,7 +69,7 @@ class Privacy:
         }
         form_data = {'_token': self._csrf_token}
         response = util.web.http_post(post_url=url, post_data=form_data, header=header,
-                                      json=True, proxy=self._proxy)
+                                      json=True, proxy=self._proxy, client=self._client)
         if response['json']['error'] is False:
             if response['json']['response'] == 'Bans cleared':
                 return True
@@ -65,74 +82,52 @@ class Privacy:
         :type response: dict
         """
         if response is None:
-            response = util.web.http_get(url=self._privacy_url, referer=self._privacy_url, proxy=self._proxy)
+            response = util.web.http_get(url=self._privacy_url, referer=self._privacy_url,
+                                         proxy=self._proxy, client=self._client)
 
         if response is not None and response['content'] is not None:
-            soup = BeautifulSoup(response['content'], 'html.parser')
-            # csrf-token
-            token = soup.find(attrs={'name': 'csrf-token'})
-            self._csrf_token = token['content']
+            token, checked, values = _parse_page(response['content'])
+            self._csrf_token = token
             # guest settings
-            guest_settings = soup.find('input', {'name': 'allow_guest', 'checked': True})
-            if guest_settings is not None:
+            if 'allow_guest' in checked:
                 self._form_data['allow_guest'] = 1
-                twitter = soup.find('input', {'name': 'require_twitter', 'checked': True})
-                if twitter is not None:
-                    self._form_data['require_twitter'] = 1
-                else:
-                    self._form_data['require_twitter'] = 0
-                facebook = soup.find('input', {'name': 'require_facebook', 'checked': True})
-                if facebook is not None:
-                    self._form_data['require_facebook'] = 1
-                else:
-                    self._form_data['require_facebook'] = 0
+                self._form_data['require_twitter'] = int('require_twitter' in checked)
+                self._form_data['require_facebook'] = int('require_facebook' in checked)
             else:
                 self._form_data['allow_guest'] = 0
                 self._form_data['require_twitter'] = 0
                 self._form_data['require_facebook'] = 0
-            # directory setting
-            dir_settings = soup.find('input', {'name': 'public_directory', 'checked': True})
-            if dir_settings is not None:
-                self._form_data['public_directory'] = 1
-            else:
-                self._form_data['public_directory'] = 0
-            # push2talk setting
-            push2talk = soup.find('input', {'name': 'push2talk', 'checked': True})
-            if push2talk is not None:
-                self._form_data['push2talk'] = 1
-            else:
-                self._form_data['push2talk'] = 0
-            # greenroom setting
-            greenroom = soup.find('input', {'name': 'greenroom', 'checked': True})
-            if greenroom is not None:
-                self._form_data['greenroom'] = 1
-            else:
-                self._form_data['greenroom'] = 0
+            self._form_data['public_directory'] = int('public_directory' in checked)
+            self._form_data['push2talk'] = int('push2talk' in checked)
+            self._form_data['greenroom'] = int('greenroom' in checked)
             # room password
-            roompass = soup.find(attrs={'name': 'roomPassword'})
-            if roompass['value']:
+            if values.get('roomPassword'):
                 self._roompass_enabled = 1
             else:
                 self._roompass_enabled = 0
             # TODO:make sure this works as expected
             if not self._form_data['greenroom']:
                 # broadcast password
-                broadcast_pass = soup.find(attrs={'name': 'broadcastPassword'})
-                if broadcast_pass['value']:
+                if values.get('broadcastPassword'):
                     self._broadcast_pass_enabled = 1
                 else:
                     self._broadcast_pass_enabled = 0
             # moderators
-            # There has to be a more elegant way of doing this..
-            pattern = 'var moderators = \''
-            if pattern in response['content']:
-                mod_str = str(response['content']).split(pattern)[2].split('\'')[0].replace('"', '\'')
-                mod_str_replaced = mod_str.replace('[', '').replace(']', '').replace('\'', '')
-                mods = mod_str_replaced.split(',')
-                if len(mods) > 0:
-                    for mod in mods:
-                        if mod != '' and mod not in self.room_moderators:
-                            self.room_moderators.append(mod)
+            mod_lists = _MODERATORS_PATTERN.findall(response['content'])
+            if mod_lists:
+                # The page holds the list twice, the second one is used.
+                mod_str = mod_lists[1] if len(mod_lists) > 1 else mod_lists[0]
+                for mod in re.sub('[\\[\\]"\']', '', mod_str).split(','):
+                    if mod != '' and mod not in self.room_moderators:
+                        self.room_moderators.append(mod)
+            # The settings are built from this parse when next asked for.
+            self._settings = None
+            self._parse_time = time.time()
+
+    def invalidate(self):
+        """ Forget the parsed settings, so the page is fetched again when the settings are next asked for. """
+        self._settings = None
+        self._parse_time = None
 
     def set_room_password(self, password=None):
         """ Set a room password or clear the password.
@@ -154,7 +149,8 @@ class Privacy:
             '_token': self._csrf_token
         }
         res = util.web.http_post(post_url=self._privacy_url, post_data=form_data,
-                                 referer=self._privacy_url, follow_redirect=True)
+                                 referer=self._privacy_url, follow_redirect=True, client=self._client)
+        self.invalidate()
         self.parse_privacy_settings(response=res)
 
     def set_broadcast_password(self, password=None):
@@ -177,7 +173,8 @@ class Privacy:
             '_token': self._csrf_token
         }
         res = util.web.http_post(post_url=self._privacy_url, post_data=form_data,
-                                 referer=self._privacy_url, follow_redirect=True)
+                                 referer=self._privacy_url, follow_redirect=True, client=self._client)
+        self.invalidate()
         self.parse_privacy_settings(response=res)
 
     def make_moderator(self, account):
@@ -196,7 +193,8 @@ class Privacy:
                     '_token': self._csrf_token,
                     'name': account
                 }
-                response = util.web.http_post(post_url=url, post_data=form_data, json=True, proxy=self._proxy)
+                response = util.web.http_post(post_url=url, post_data=form_data, json=True,
+                                              proxy=self._proxy, client=self._client)
                 if response['json']['error'] is False and response['json']['response'] == 'Data added':
                     self.parse_privacy_settings()
                     if account in self.room_moderators:
@@ -218,7 +216,8 @@ class Privacy:
                 '_token': self._csrf_token,
                 'name': account
             }
-            response = util.web.http_post(post_url=url, post_data=form_data, json=True, proxy=self._proxy)
+            response = util.web.http_post(post_url=url, post_data=form_data, json=True,
+                                          proxy=self._proxy, client=self._client)
             if response['json']['error'] is False and response['json']['response'] == 'Data removed':
                 self.room_moderators.remove(account)
                 return True
@@ -335,11 +334,17 @@ class Privacy:
     def current_settings(self):
         """ Returns a dictionary of the current room settings.
 
+        The page is only fetched when it was not parsed within settings_ttl seconds,
+        or the settings were invalidated, see invalidate.
+
         :return A dictionary with the following keys: 'broadcast_pass', 'room_pass', 'allow_guest',
         'show_on_directory', 'push2talk', 'greenroom'
         :rtype: dict
         """
-        self.parse_privacy_settings()
+        if self._parse_time is None or time.time() - self._parse_time > self.settings_ttl:
+            self.parse_privacy_settings()
+        if self._settings is not None:
+            return dict(self._settings)
 
         settings = dict()
         if self._broadcast_password or self._broadcast_pass_enabled:
@@ -375,7 +380,8 @@ class Privacy:
         else:
             settings['greenroom'] = 'Disabled'
 
-        return settings
+        self._settings = settings
+        return dict(settings)
 
     def _update(self):
         """ Update the privacy page with the current settings.
@@ -399,5 +405,33 @@ class Privacy:
             del self._form_data['greenroom']
 
         pr = util.web.http_post(post_url=self._privacy_url, post_data=self._form_data, referer=self._privacy_url,
-                                proxy=self._proxy, follow_redirect=True)
+                                proxy=self._proxy, client=self._client, follow_redirect=True)
+        # The page is fetched again if the response does not hold it.
+        self.invalidate()
         self.parse_privacy_settings(response=pr)
+
+
+def _parse_page(content):
+    """ Find the csrf token, the checked inputs and the input values of the privacy page in a single pass.
+
+    :param content: The html of the page.
+    :type content: str
+    :return: The csrf token, the names of the checked inputs and input name -> value.
+    :rtype: tuple
+    """
+    token = ''
+    checked = set()
+    values = dict()
+    for tag in _TAG_PATTERN.finditer(content):
+        attrs = dict()
+        for name, double_quoted, single_quoted, unquoted in _ATTR_PATTERN.findall(tag.group(1)):
+            attrs[name.lower()] = double_quoted or single_quoted or unquoted
+        name = attrs.get('name')
+        if name == 'csrf-token':
+            token = attrs.get('content', '')
+        elif name is not None:
+            if 'checked' in attrs:
+                checked.add(name)
+            if name not in values:
+                values[name] = attrs.get('value', '')
+    return token, checked, values
@@ -3,14 +3,16 @@ import logging
 import threading
 import time
 import traceback
+from collections import OrderedDict
 from colorama import init, Fore, Style
 import config
 import user
 import sys
 import apis.tinychat
-from rtmplib import rtmp
+from rtmplib import rtmp, flv, recorder, trace
 from page import acc, params
-from util import string_util, file_handler
+from util import string_util, file_handler, metrics, web, executor, session_cache, backoff, outbound, \
+    timer_wheel
 
 __version__ = '7.0.1.1'
 
@@ -81,15 +83,81 @@ class TinychatRTMPClient(object):
         self.green_connection = None
         self.is_connected = False
         self.is_green_connected = False
+        self.flv_publisher = None
+        self.stream_recorder = None
         self.users = user.Users()
         self.active_user = None
         self.param = None
         self._proxy = proxy
         self._client_id = None
         self._bauth_key = None
+        # The nick, client id and time the bauth key was issued for.
+        self._bauth_key_info = None
         self._is_reconnected = False
-        self._reconnect_delay = config.RECONNECT_DELAY
+        self._backoff = backoff.Backoff(base=config.RECONNECT_DELAY, cap=config.RECONNECT_MAX_DELAY,
+                                        first_delay=config.RECONNECT_FIRST_DELAY)
+        self._green_backoff = backoff.Backoff(base=config.RECONNECT_DELAY, cap=config.RECONNECT_MAX_DELAY,
+                                              first_delay=config.RECONNECT_FIRST_DELAY)
+        # The time the connection was lost, while reconnecting.
+        self._disconnect_time = None
+        # The time the current RTMP parameters were set.
+        self._param_time = None
+        # A opened connection and a cauth cookie kept ready to fail over to, with the time it was opened.
+        self._standby = None
+        self._standby_lock = threading.Lock()
+        # True while reconnecting with the standby connection.
+        self._is_failover = False
+        # The connection the watchdog closed last.
+        self._stalled_connection = None
+        # Messages to the server are sent from a single thread, by priority and rate limited.
+        self.outbound = outbound.OutboundQueue(self._call, rate=config.OUTBOUND_RATE, burst=config.OUTBOUND_BURST,
+                                               max_size=config.OUTBOUND_MAX_SIZE)
         self._init_time = time.time()
+        self._connect_time = None
+        apis.tinychat.TCINFO_CACHE.ttl = config.API_CACHE_TTL
+        apis.tinychat.TCINFO_CACHE.negative_ttl = config.API_CACHE_NEGATIVE_TTL
+        apis.tinychat.TCINFO_CACHE.max_size = config.API_CACHE_SIZE
+        web.POOL_CONNECTIONS = config.HTTP_POOL_CONNECTIONS
+        web.POOL_MAXSIZE = config.HTTP_POOL_MAXSIZE
+        # startup phase -> milliseconds, for the current (re)connect.
+        self.phase_times = OrderedDict()
+        self._bringup_start = None
+        self._phase_lock = threading.Lock()
+        self.session_cache = None
+        if config.SESSION_CACHE_ENABLED:
+            secret = config.SESSION_CACHE_SECRET or session_cache.load_or_create_secret(
+                config.CONFIG_PATH, config.SESSION_CACHE_KEY_FILE_NAME)
+            self.session_cache = session_cache.get_cache(config.CONFIG_PATH, config.SESSION_CACHE_FILE_NAME, secret)
+
+    @property
+    def http_client(self):
+        """ The http client for this client's account, or for the room when not using a account.
+
+        :rtype: util.web.HttpClient
+        """
+        return web.get_client(self.account or self.roomname)
+
+    def when_done(self, future, callback, *args):
+        """ Call a function with the result of a future once it is done.
+
+        Nothing is called if the future was cancelled, e.g because the client disconnected.
+        Errors, including timeouts, are logged.
+
+        :param future: The future.
+        :type future: util.executor.Future
+        :param callback: The function to call with the result and args.
+        :param args: Extra arguments for the function.
+        """
+        def done(f):
+            if f.cancelled():
+                return
+            try:
+                result = f.result()
+            except Exception as e:
+                log.error('async error: %s' % e, exc_info=True)
+            else:
+                callback(result, *args)
+        future.add_done_callback(done)
 
     def console_write(self, color, message):
         """ Writes message to console.
@@ -116,12 +184,98 @@ class TinychatRTMPClient(object):
         if config.CHAT_LOGGING:
             write_to_log('[' + ts + '] ' + message, self.roomname)
 
+    def record_phase(self, name, start_time, cached=False):
+        """ Record the time a startup phase took.
+
+        :param name: The name of the phase.
+        :type name: str
+        :param start_time: The time the phase started.
+        :type start_time: float
+        :param cached: True if the phase was served from the session cache.
+        :type cached: bool
+        """
+        ms = (time.time() - start_time) * 1000
+        if cached:
+            name += '_cached'
+        with self._phase_lock:
+            self.phase_times[name] = ms
+            if self._bringup_start is None or start_time < self._bringup_start:
+                self._bringup_start = start_time
+        metrics.histogram('startup.%s_ms' % name).observe(ms)
+
+    def report_phases(self):
+        """ Write the startup phase times to the console and log, and start over.
+
+        Phases can overlap, the total is the time from the start of the first phase until now.
+        """
+        with self._phase_lock:
+            if not self.phase_times:
+                return
+            phases = ', '.join('%s: %dms' % (name, ms) for name, ms in self.phase_times.items())
+            total = (time.time() - self._bringup_start) * 1000
+            self.phase_times.clear()
+            self._bringup_start = None
+        metrics.histogram('startup.total_ms').observe(total)
+        log.info('startup phases: %s, total: %dms' % (phases, total))
+        self.console_write(COLOR['white'], 'Startup %s, total: %dms' % (phases, total))
+
+    def prepare_connect(self, reuse_params=False):
+        """ Login and set the RTMP parameters.
+
+        The room config does not depend on the login, so both are done at the same time.
+
+        :param reuse_params: Keep the current RTMP parameters if they are
+        younger than RECONNECT_PARAMS_TTL seconds.
+        :type reuse_params: bool
+        :return: The config status, see page.params.Params.config_status
+        :rtype: int
+        """
+        login_future = None
+        if self.account and self.password:
+            login_future = executor.submit(self.login, group=self)
+        if reuse_params and self.param is not None and self.param.config_status == 3 and \
+                self._param_time is not None and time.time() - self._param_time < config.RECONNECT_PARAMS_TTL:
+            log.info('reusing rtmp parameters from %ds ago.' % (time.time() - self._param_time))
+            self.record_phase('params', time.time(), cached=True)
+            status = self.param.config_status
+        else:
+            status = self.set_rtmp_parameters()
+        if login_future is not None:
+            try:
+                is_logged_in = login_future.result()
+            except Exception as e:
+                log.error('login error: %s' % e, exc_info=True)
+                is_logged_in = False
+            if not is_logged_in:
+                self.console_write(COLOR['bright_red'], 'Failed to login.')
+            else:
+                self.console_write(COLOR['bright_green'], 'Login okay.')
+        return status
+
     def set_rtmp_parameters(self):
-        """ Set the RTMP parameters before making a connect. """
+        """ Set the RTMP parameters before making a connect.
+
+        A room config found in the session cache is used instead of requesting it.
+        """
+        ts = time.time()
         self.param = params.Params(room_name=self.roomname, room_pass=self.room_pass,
-                                   swf_version=config.SWF_VERSION, proxy=self._proxy)
-        self.param.get_config()
+                                   swf_version=config.SWF_VERSION, proxy=self._proxy, client=self.http_client)
+        cache_key = 'params:' + self.roomname.lower()
+        cached = None
+        if self.session_cache is not None:
+            cached = self.session_cache.get(cache_key)
+            if cached is not None and cached['room_pass'] != self.room_pass:
+                cached = None
+        if cached is not None:
+            self.param.load_config(cached['config'])
+        else:
+            self.param.get_config()
+            if self.param.config_status == 3 and self.session_cache is not None:
+                self.session_cache.put(cache_key, {'room_pass': self.room_pass, 'config': self.param.dump_config()},
+                                       config.SESSION_CACHE_PARAMS_TTL)
+        self.record_phase('params', ts, cached=cached is not None)
         if self.param.config_status == 3:
+            self._param_time = time.time()
             if config.DEBUG_MODE:
                 for k in self.param.config_dict:
                     self.console_write(COLOR['white'], '%s: %s' % (k, self.param.config_dict[k]))
@@ -135,43 +289,93 @@ class TinychatRTMPClient(object):
         :return: True if logged in, else False.
         :rtype: bool
         """
-        account = acc.Account(account=self.account, password=self.password, proxy=self._proxy)
+        account = acc.Account(account=self.account, password=self.password, proxy=self._proxy,
+                              client=self.http_client)
         if self.account and self.password:
+            ts = time.time()
+            cache_key = 'login:' + self.account.lower()
+            if self.session_cache is not None and not account.is_logged_in():
+                cookies = self.session_cache.get(cache_key)
+                if cookies is not None:
+                    self.http_client.import_cookies(cookies)
+                    if account.is_logged_in():
+                        self.record_phase('login', ts, cached=True)
+                        return True
             if account.is_logged_in():
                 return True
             account.login()
+            if account.is_logged_in():
+                self.record_phase('login', ts)
+                if self.session_cache is not None:
+                    self._cache_login(cache_key)
         return account.is_logged_in()
 
-    def connect(self):
-        """ Make a connection with the remote RTMP server. """
+    def _cache_login(self, cache_key):
+        """ Store the login cookies in the session cache, until the first of them expires. """
+        cookies = self.http_client.export_cookies(['pass', 'user', 'hash'])
+        ttl = config.SESSION_CACHE_LOGIN_TTL
+        for cookie in cookies:
+            if cookie['expires'] is not None:
+                ttl = min(ttl, cookie['expires'] - time.time())
+        if cookies and ttl > 0:
+            self.session_cache.put(cache_key, cookies, ttl)
+
+    def connect(self, standby=None):
+        """ Make a connection with the remote RTMP server.
+
+        :param standby: A standby connection and cauth cookie to use, see prepare_standby.
+        :type standby: tuple | None
+        """
         if not self.is_connected:
             log.info('connecting to: %s' % self.roomname)
+            cauth_future = None
+            if standby is not None and standby[0].tc_url != self.param.tc_url:
+                # The room moved to another server since the standby connection was opened.
+                self._close_standby(standby)
+                standby = None
             try:
-                self.param.recaptcha()
-                self.connection = rtmp.RtmpClient(
-                    ip=self.param.ip,
-                    port=self.param.port,
-                    tc_url=self.param.tc_url,
-                    app=self.param.app,
-                    page_url=self.param.embed_url,
-                    swf_url=self.param.swf_url,
-                    proxy=self._proxy,
-                    is_win=True
-                )
-                self.connection.connect(
+                # Users from before a reconnect are kept, and reconciled with the joins snapshot.
+                self.users.begin_snapshot()
+                if standby is not None:
+                    log.info('failing over to the standby connection.')
+                    self.connection, cauth_cookie = standby[0], standby[1]
+                else:
+                    # The captcha may wait for the user to solve it, so it is done before the socket is opened,
+                    # a idle connection would time out meanwhile.
+                    ts = time.time()
+                    self.param.recaptcha()
+                    self.record_phase('recaptcha', ts)
+                    # The cauth cookie request runs while the socket connects and handshakes.
+                    cauth_future = executor.submit(self._get_cauth_cookie, group=self)
+                    ts = time.time()
+                    self.connection = self._new_connection()
+                    self.connection.open()
+                    self.record_phase('rtmp_open', ts)
+                    cauth_cookie = cauth_future.result()
+                self.connection.on_ping_response = self._on_ping_response
+                ts = time.time()
+                self.connection.connect_rtmp(
                     {
                         'account': self.account,
                         'type': self.param.roomtype,
                         'prefix': u'tinychat',
                         'room': self.roomname,
                         'version': self.param.desktop_version,
-                        'cookie': self.param.cauth_cookie()
+                        'cookie': cauth_cookie
                     }
                 )
+                self.record_phase('rtmp_connect', ts)
+                self._connect_time = time.time()
                 self.is_connected = True
             except Exception as e:
                 log.critical('connect error: %s' % e, exc_info=True)
+                if cauth_future is not None:
+                    cauth_future.cancel()
                 self.is_connected = False
+                # The cached room config may be stale.
+                self._param_time = None
+                if self.session_cache is not None:
+                    self.session_cache.delete('params:' + self.roomname.lower())
                 self.reconnect()
                 if config.DEBUG_MODE:
                     traceback.print_exc()
@@ -182,20 +386,146 @@ class TinychatRTMPClient(object):
                     threading.Thread(target=self.__connect_green).start()
                 self.__callback()
 
+    def _new_connection(self):
+        """ Create a connection to the room application from the RTMP parameters.
+
+        :rtype: rtmp.RtmpClient
+        """
+        return rtmp.RtmpClient(
+            ip=self.param.ip,
+            port=self.param.port,
+            tc_url=self.param.tc_url,
+            app=self.param.app,
+            page_url=self.param.embed_url,
+            swf_url=self.param.swf_url,
+            proxy=self._proxy,
+            socket_options={
+                'keepalive_idle': config.SOCKET_KEEPALIVE_IDLE,
+                'keepalive_interval': config.SOCKET_KEEPALIVE_INTERVAL,
+                'keepalive_count': config.SOCKET_KEEPALIVE_COUNT,
+                'nodelay': config.SOCKET_NODELAY,
+                'send_buffer': config.SOCKET_SEND_BUFFER,
+                'recv_buffer': config.SOCKET_RECV_BUFFER,
+                'user_timeout': config.SOCKET_USER_TIMEOUT
+            },
+            recorder=self._new_recorder()
+        )
+
+    def _new_recorder(self):
+        """ Create the packet tracer and flight recorder of a new connection, if enabled in the config.
+
+        :rtype: trace.Recorder | None
+        """
+        if config.TRACE_PACKETS or config.FLIGHT_RECORDER_SIZE:
+            return trace.Recorder(size=config.FLIGHT_RECORDER_SIZE, log_packets=config.TRACE_PACKETS,
+                                  dump_path=config.CONFIG_PATH + self.roomname + '/logs/' +
+                                  config.FLIGHT_RECORDER_FILE_NAME)
+        return None
+
+    @staticmethod
+    def _dump_flight_recorder(connection, reason):
+        """ Write the flight recorder of a connection to the flight recorder file.
+
+        :param connection: The connection.
+        :type connection: rtmp.RtmpClient | None
+        :param reason: Why the flight recorder is dumped.
+        :type reason: str
+        """
+        if connection is not None and connection.recorder is not None:
+            connection.recorder.dump(reason)
+
+    def prepare_standby(self):
+        """ Open a standby connection to fail over to when the connection is lost.
+
+        The standby connection is connected and handshaken, and has a cauth cookie ready.
+        It is not connected to the room application, since a second session
+        for the same account would be seen as a double sign on.
+        A previous standby connection is closed.
+        """
+        ts = time.time()
+        connection = self._new_connection()
+        try:
+            connection.open()
+            cauth_cookie = self.param.cauth_cookie()
+        except Exception as e:
+            log.warning('standby connection error: %s' % e)
+            self._close_standby((connection, None, ts))
+            return
+        with self._standby_lock:
+            previous, self._standby = self._standby, (connection, cauth_cookie, time.time())
+        self._close_standby(previous)
+        log.debug('standby connection ready in %dms' % ((time.time() - ts) * 1000))
+
+    def _take_standby(self):
+        """ Take the standby connection, if there is one that is not too old.
+
+        :return: The connection, cauth cookie and the time it was opened, or None.
+        :rtype: tuple | None
+        """
+        with self._standby_lock:
+            standby, self._standby = self._standby, None
+        if standby is not None and time.time() - standby[2] > config.STANDBY_MAX_AGE:
+            self._close_standby(standby)
+            return None
+        return standby
+
+    @staticmethod
+    def _close_standby(standby):
+        if standby is not None and standby[0].socket is not None:
+            standby[0].shutdown()
+
+    def _watchdog(self):
+        """ Ping the server, and force a reconnect if nothing was read for too long.
+
+        Runs every WATCHDOG_PING_INTERVAL seconds while connected.
+        A half open connection does not fail the read in the callback loop,
+        shutting the socket down does, and the callback loop then reconnects.
+        """
+        connection = self.connection
+        if not self.is_connected or connection is self._stalled_connection:
+            return
+        metrics.gauge('rtmp.bytes_in').set(connection.bytes_in)
+        metrics.gauge('rtmp.bytes_out').set(connection.bytes_out)
+        silence = time.time() - connection.last_read_time
+        if silence > config.WATCHDOG_STALL_TIMEOUT:
+            self._stalled_connection = connection
+            metrics.counter('watchdog.stalls').inc()
+            log.warning('nothing read for %ds, closing the connection.' % silence)
+            self.console_write(COLOR['bright_red'], 'Connection stalled for %ds.' % silence)
+            connection.shutdown()
+        else:
+            try:
+                connection.ping_request()
+                metrics.counter('watchdog.pings').inc()
+            except Exception as e:
+                log.warning('ping request error: %s' % e)
+
+    @staticmethod
+    def _on_ping_response(rtt):
+        """ Record the round trip time of a ping.
+
+        :param rtt: The round trip time in milliseconds.
+        :type rtt: int
+        """
+        metrics.histogram('rtmp.rtt_ms').observe(rtt)
+        metrics.gauge('rtmp.last_rtt_ms').set(rtt)
+
+    def _get_cauth_cookie(self):
+        """ Get the cauth cookie, the captcha check must be done first.
+
+        :return: The cauth cookie.
+        :rtype: str | None
+        """
+        ts = time.time()
+        cauth_cookie = self.param.cauth_cookie()
+        self.record_phase('cauth', ts)
+        return cauth_cookie
+
     def __connect_green(self):
         """ Make a connection to the greenroom application. """
         if not self.is_green_connected:
             try:
-                self.green_connection = rtmp.RtmpClient(
-                    ip=self.param.ip,
-                    port=self.param.port,
-                    tc_url=self.param.tc_url,
-                    app=self.param.app,
-                    page_url=self.param.embed_url,
-                    swf_url=self.param.swf_url,
-                    proxy=self._proxy,
-                    is_win=True
-                )
+                self.green_connection = self._new_connection()
                 self.green_connection.connect(
                     {
                         'account': '',
@@ -207,6 +537,7 @@ class TinychatRTMPClient(object):
                     }
                 )
                 self.is_green_connected = True
+                self._green_backoff.reset()
             except Exception as e:
                 log.critical('greenroom connect error: %s' % e, exc_info=True)
                 self.is_green_connected = False
@@ -231,8 +562,17 @@ class TinychatRTMPClient(object):
                 self.green_connection.shutdown()
             else:
                 self.is_connected = False
-                self._bauth_key = None
-                self.users.clear()
+                timer_wheel.cancel_owner(self)
+                executor.cancel_group(self)
+                # Queued messages were meant for the lost connection.
+                self.outbound.clear()
+                # A snapshot without joinsdone would otherwise stay open until the next connect.
+                self.users.cancel_snapshot()
+                self.stop_publishing()
+                if self.stream_recorder is not None:
+                    self.stream_recorder.close()
+                    self.stream_recorder = None
+                self._close_standby(self._take_standby())
                 self.connection.shutdown()
         except Exception as e:
             log.error('disconnect error, greenroom: %s, error: %s' % (greenroom, e), exc_info=True)
@@ -246,32 +586,37 @@ class TinychatRTMPClient(object):
         reconnect to the normal application(room)
         :type greenroom: bool
         """
+        self._dump_flight_recorder(self.green_connection if greenroom else self.connection,
+                                   'reconnect, greenroom: %s' % greenroom)
         if greenroom:
             log.info('reconnecting to the greenroom application.')
             self.disconnect(greenroom=True)
-            time.sleep(config.RECONNECT_DELAY)
+            time.sleep(self._green_backoff.next_delay())
             self.__connect_green()
         else:
-            reconnect_msg = '============ RECONNECTING IN %s SECONDS ============' % self._reconnect_delay
-            log.info('reconnecting: %s' % reconnect_msg)
+            if self._disconnect_time is None:
+                self._disconnect_time = time.time()
+            standby = None
+            if config.STANDBY_ENABLED and self._backoff.attempts == 0:
+                # Only the first attempt fails over, the standby connection may share the fate of the connection.
+                standby = self._take_standby()
+            delay = self._backoff.next_delay()
+            if standby is not None:
+                delay = 0
+                metrics.counter('failover.attempts').inc()
+            self._is_failover = standby is not None
+            reconnect_msg = '============ RECONNECTING IN %.1f SECONDS ============' % delay
+            log.info('reconnecting: %s (attempt %s)' % (reconnect_msg, self._backoff.attempts))
             self.console_write(COLOR['bright_cyan'], reconnect_msg)
+            metrics.counter('reconnect.attempts').inc()
             self._is_reconnected = True
             self.disconnect()
-            time.sleep(self._reconnect_delay)
+            time.sleep(delay)
 
-            # increase reconnect_delay after each reconnect.
-            self._reconnect_delay *= 2
-            if self._reconnect_delay > 900:
-                self._reconnect_delay = config.RECONNECT_DELAY
-
-            if self.account and self.password:
-                if not self.login():
-                    self.console_write(COLOR['bright_red'], 'Failed to login.')
-                else:
-                    self.console_write(COLOR['bright_green'], 'Login okay.')
-            self.set_rtmp_parameters()
+            # The parameters are only fetched again if they are old, or a connect with them failed.
+            self.prepare_connect(reuse_params=True)
             if self.param.config_status == 3:
-                self.connect()
+                self.connect(standby)
             else:
                 msg = 'failed to set rtmp parameters, %s' % self.param.config_status
                 log.error(msg)
@@ -291,6 +636,7 @@ class TinychatRTMPClient(object):
             except rtmp.AmfDataReadError as e:
                 fails += 1
                 log.error('greenroom amf read error: %s %s' % (fails, e), exc_info=True)
+                self._dump_flight_recorder(self.green_connection, 'greenroom amf read error: %s' % e)
                 if fails == 2:
                     if config.DEBUG_MODE:
                         traceback.print_exc()
@@ -339,6 +685,7 @@ class TinychatRTMPClient(object):
             except rtmp.AmfDataReadError as e:
                 fails += 1
                 log.error('amf data read error count: %s %s' % (fails, e), exc_info=True)
+                self._dump_flight_recorder(self.connection, 'amf read error: %s' % e)
                 if fails == 2:
                     if config.DEBUG_MODE:
                         traceback.print_exc()
@@ -376,6 +723,24 @@ class TinychatRTMPClient(object):
 
                     elif cmd == 'registered':
                         client_info_dict = amf0_cmd[3]
+                        self.record_phase('registered', self._connect_time)
+                        self.report_phases()
+                        self._backoff.reset()
+                        if self._disconnect_time is not None:
+                            reconnect_ms = (time.time() - self._disconnect_time) * 1000
+                            metrics.histogram('reconnect.time_ms').observe(reconnect_ms)
+                            if self._is_failover:
+                                metrics.histogram('failover.time_ms').observe(reconnect_ms)
+                                self._is_failover = False
+                            log.info('reconnected in %dms' % reconnect_ms)
+                            self._disconnect_time = None
+                        # The timers of the connection are cancelled on disconnect.
+                        if config.STANDBY_ENABLED:
+                            timer_wheel.schedule_periodic(config.STANDBY_REFRESH_INTERVAL, self.prepare_standby,
+                                                          owner=self, name='standby', first_delay=0)
+                        if config.WATCHDOG_ENABLED:
+                            timer_wheel.schedule_periodic(config.WATCHDOG_PING_INTERVAL, self._watchdog,
+                                                          owner=self, name='watchdog')
                         self.on_registered(client_info_dict)
 
                     elif cmd == 'join':
@@ -388,8 +753,13 @@ class TinychatRTMPClient(object):
                             while iparam0 < len(current_room_users_info_list):
                                 self.on_joins(current_room_users_info_list[iparam0])
                                 iparam0 += 1
+                            self.prefetch_account_info(current_room_users_info_list)
 
                     elif cmd == 'joinsdone':
+                        removed = self.users.end_snapshot()
+                        if removed:
+                            log.info('removed %s users no longer in the room: %s' %
+                                     (len(removed), ', '.join(_user.nick for _user in removed)))
                         self.on_joinsdone()
 
                     elif cmd == 'oper':
@@ -550,12 +920,70 @@ class TinychatRTMPClient(object):
                         self.console_write(COLOR['white'], k + ': ' + str(list_item[k]))
                 else:
                     self.console_write(COLOR['white'], str(list_item))
+        for list_item in status_info:
+            if type(list_item) is rtmp.pyamf.ASObject and list_item.get('code') == 'NetStream.Publish.Start':
+                self.on_publish_start()
+
+    def on_publish_start(self):
+        """ Our stream was published, media can be sent on it now. """
+        log.info('stream published, stream_id: %s' % self.connection.stream_id)
+
+    def start_publishing(self, playlist, loop=False):
+        """ Publish the audio and video of FLV files on our stream.
+
+        The stream must be published, see on_publish_start.
+
+        :param playlist: Paths to FLV files.
+        :type playlist: list
+        :param loop: Start the playlist over when it ends.
+        :type loop: bool
+        """
+        self.stop_publishing()
+        self.flv_publisher = flv.FlvPublisher(self.connection, playlist, loop=loop)
+        self.flv_publisher.start()
+
+    def stop_publishing(self):
+        """ Stop publishing FLV files.
+
+        The publisher thread is waited for, so no media is sent after the stream is closed.
+        """
+        if self.flv_publisher is not None:
+            if not self.flv_publisher.stop(config.PUBLISH_STOP_TIMEOUT):
+                log.warning('flv publisher did not stop within %s seconds' % config.PUBLISH_STOP_TIMEOUT)
+            self.flv_publisher = None
+
+    def start_recording(self, stream_name):
+        """ Record a broadcast to a FLV file in the recordings folder of the room.
+
+        :param stream_name: The stream name of the broadcast, the Id of the broadcasting user.
+        :type stream_name: str | int
+        :return: The recording, or None if the broadcast is already being recorded.
+        :rtype: rtmplib.recorder.Recording | None
+        :raises IOError: If the file can not be created.
+        """
+        if self.stream_recorder is None:
+            path = config.CONFIG_PATH + self.roomname + '/recordings/'
+            self.stream_recorder = recorder.StreamRecorder(self.connection, path, config.RECORD_MAX_BUFFER,
+                                                           config.RECORD_STREAM_TIMEOUT)
+        return self.stream_recorder.record(stream_name)
+
+    def stop_recording(self, stream_name):
+        """ Stop recording a broadcast.
+
+        :param stream_name: The stream name of the broadcast.
+        :type stream_name: str | int
+        :return: The recording, or None if the broadcast was not being recorded.
+        :rtype: rtmplib.recorder.Recording | None
+        """
+        if self.stream_recorder is None:
+            return None
+        return self.stream_recorder.stop(stream_name)
 
     def on_bwdone(self):
         """ Application specific message. """
-        if not self._is_reconnected:
-            if config.ENABLE_AUTO_JOB:
-                self.start_auto_job_timer()
+        # The auto job timer is cancelled on disconnect, so it is started on every connect.
+        if config.ENABLE_AUTO_JOB:
+            self.start_auto_job_timer()
 
     def on_registered(self, client_info):
         """ Application message containing client info.
@@ -641,6 +1069,36 @@ class TinychatRTMPClient(object):
         if self.is_client_mod:
             self.send_banlist_msg()
 
+    def prefetch_account_info(self, users_info):
+        """ Look up the account info for a batch of users concurrently.
+
+        The results fill the account info cache, and the tinychat id
+        and last login of the users are set as the results come in.
+
+        :param users_info: A list of user info dicts, as received with joins.
+        :type users_info: list
+        """
+        nicks = dict()
+        for info in users_info:
+            if info.get('account'):
+                _user = self.users.search(info['nick'])
+                if _user is not None and _user.tinychat_id is not None:
+                    # Kept from before a reconnect.
+                    continue
+                nicks.setdefault(info['account'], []).append(info['nick'])
+
+        def set_account_info(account, tc_info):
+            if tc_info is not None:
+                for nick in nicks[account]:
+                    _user = self.users.search(nick)
+                    if _user is not None and _user.account == account:
+                        _user.tinychat_id = tc_info['tinychat_id']
+                        _user.last_login = tc_info['last_active']
+
+        if nicks:
+            apis.tinychat.prefetch_user_info(nicks.keys(), workers=config.API_PREFETCH_WORKERS,
+                                             callback=set_account_info, group=self)
+
     def on_oper(self, uid, nick):
         """ Application message received when a user is oper(moderator)
 
@@ -873,15 +1331,41 @@ class TinychatRTMPClient(object):
         self.console_write(COLOR['white'], 'Private message from %s: %s' % (self.active_user.nick, private_msg))
 
     # Message Methods.
+    def queue_call(self, priority, process_name, parameters=None, coalesce=True):
+        """ Queue a remote procedure call, see util.outbound.OutboundQueue
+
+        :param priority: util.outbound.MODERATION, SYSTEM or CHAT.
+        :type priority: int
+        :param process_name: The name of the remote method.
+        :type process_name: str
+        :param parameters: The parameters for the remote method.
+        :type parameters: list | None
+        :param coalesce: Drop the call if the same call is still queued.
+        :type coalesce: bool
+        """
+        self.outbound.put(priority, process_name, parameters, coalesce)
+
+    def _call(self, process_name, parameters):
+        """ Send a queued call on the current connection, from the outbound queue's writer thread. """
+        self.connection.call(process_name, parameters)
+
     def send_bauth_msg(self):
-        """ Get and send the bauth key needed before we can start a broadcast. """
-        if self._bauth_key is not None:
-            self.connection.call('bauth', [u'' + self._bauth_key])
-        else:
-            _token = self.param.get_broadcast_token(self.nickname, self._client_id)
-            if _token != 'PW':
-                self._bauth_key = _token
-                self.connection.call('bauth', [u'' + _token])
+        """ Get and send the bauth key needed before we can start a broadcast.
+
+        The key is sent right away, not queued, the createStream and
+        publish messages that follow it must not reach the server before it.
+        """
+        if self._bauth_key is not None and self._bauth_key_info is not None:
+            nick, client_id, ts = self._bauth_key_info
+            # The key is issued for a nick and client id, and is only reused for those.
+            if nick == self.nickname and client_id == self._client_id and time.time() - ts < config.BAUTH_KEY_TTL:
+                self.connection.call('bauth', [u'' + self._bauth_key])
+                return
+        _token = self.param.get_broadcast_token(self.nickname, self._client_id)
+        if _token != 'PW':
+            self._bauth_key = _token
+            self._bauth_key_info = (self.nickname, self._client_id, time.time())
+            self.connection.call('bauth', [u'' + _token])
 
     def send_cauth_msg(self, cauthkey):
         """ Send the cauth message, we need to send this before we can chat.
@@ -889,17 +1373,19 @@ class TinychatRTMPClient(object):
         :param cauthkey: The cauth key.
         :type cauthkey: str
         """
-        self.connection.call('cauth', [u'' + cauthkey])
+        self.queue_call(outbound.SYSTEM, 'cauth', [u'' + cauthkey])
 
-    def send_owner_run_msg(self, msg):
+    def send_owner_run_msg(self, msg, coalesce=True):
         """ Send owner run message.
 
         :param msg: The message to send.
         :type msg: str
+        :param coalesce: Drop the message if the same message is still waiting to be sent.
+        :type coalesce: bool
         """
         if self.is_client_mod:
             msg = string_util.quote_str(msg)
-            self.connection.call('owner_run', [u'notice' + msg])
+            self.queue_call(outbound.CHAT, 'owner_run', [u'notice' + msg], coalesce)
 
     def send_cam_approve_msg(self, nick, uid=None):
         """ Send cam approval message.
@@ -915,11 +1401,11 @@ class TinychatRTMPClient(object):
             if uid is None:
                 _user = self.users.search(nick)
                 if _user is not None:
-                    self.connection.call('privmsg', [u'' + self._encode_msg(msg), u'#0,en',
-                                                     u'n' + str(_user.id) + '-' + nick])
+                    self.queue_call(outbound.MODERATION, 'privmsg', [u'' + self._encode_msg(msg), u'#0,en',
+                                                                     u'n' + str(_user.id) + '-' + nick])
             else:
-                self.connection.call('privmsg',
-                                     [u'' + self._encode_msg(msg), u'#0,en', u'n' + str(uid) + '-' + nick])
+                self.queue_call(outbound.MODERATION, 'privmsg',
+                                [u'' + self._encode_msg(msg), u'#0,en', u'n' + str(uid) + '-' + nick])
 
     def send_chat_msg(self, msg):
         """  Send a chat room message.
@@ -927,7 +1413,7 @@ class TinychatRTMPClient(object):
         :param msg: The message to send.
         :type msg: str
         """
-        self.connection.call('privmsg', [u'' + self._encode_msg(msg), u'#262626,en'])
+        self.queue_call(outbound.CHAT, 'privmsg', [u'' + self._encode_msg(msg), u'#262626,en'])
 
     def send_private_msg(self, msg, nick):
         """ Send a private message.
@@ -939,10 +1425,10 @@ class TinychatRTMPClient(object):
         """
         _user = self.users.search(nick)
         if _user is not None:
-            self.connection.call('privmsg', [u'' + self._encode_msg('/msg ' + nick + ' ' + msg),
-                                             u'#262626,en', u'n' + str(_user.id) + '-' + nick])
-            self.connection.call('privmsg', [u'' + self._encode_msg('/msg ' + nick + ' ' + msg),
-                                             u'#262626,en', u'b' + str(_user.id) + '-' + nick])
+            self.queue_call(outbound.CHAT, 'privmsg', [u'' + self._encode_msg('/msg ' + nick + ' ' + msg),
+                                                       u'#262626,en', u'n' + str(_user.id) + '-' + nick])
+            self.queue_call(outbound.CHAT, 'privmsg', [u'' + self._encode_msg('/msg ' + nick + ' ' + msg),
+                                                       u'#262626,en', u'b' + str(_user.id) + '-' + nick])
 
     def send_userinfo_request_msg(self, user_id):
         """ Send user info request to a user.
@@ -950,7 +1436,7 @@ class TinychatRTMPClient(object):
         :param user_id: User id of the user we want info from.
         :type user_id: str
         """
-        self.connection.call('account', [u'' + str(user_id)])
+        self.queue_call(outbound.SYSTEM, 'account', [u'' + str(user_id)])
 
     def send_undercover_msg(self, nick, msg, use_b=True, use_n=True):
         """ Send a 'undercover' message.
@@ -968,18 +1454,18 @@ class TinychatRTMPClient(object):
         _user = self.users.search(nick)
         if _user is not None:
             if use_b:
-                self.connection.call('privmsg', [u'' + self._encode_msg(msg),
-                                                 '#0,en', u'b' + str(_user.id) + '-' + nick])
+                self.queue_call(outbound.CHAT, 'privmsg', [u'' + self._encode_msg(msg),
+                                                           '#0,en', u'b' + str(_user.id) + '-' + nick])
             if use_n:
-                self.connection.call('privmsg', [u'' + self._encode_msg(msg),
-                                                 '#0,en', u'n' + str(_user.id) + '-' + nick])
+                self.queue_call(outbound.CHAT, 'privmsg', [u'' + self._encode_msg(msg),
+                                                           '#0,en', u'n' + str(_user.id) + '-' + nick])
 
     def set_nick(self):
         """ Send the nick message. """
         if not self.nickname:
             self.nickname = string_util.create_random_string(5, 25)
         self.console_write(COLOR['bright_magenta'], 'Setting nick: %s' % self.nickname)
-        self.connection.call('nick', [u'' + self.nickname])
+        self.queue_call(outbound.SYSTEM, 'nick', [u'' + self.nickname])
 
     def send_ban_msg(self, nick, uid=None):
         """ Send ban message.
@@ -993,9 +1479,9 @@ class TinychatRTMPClient(object):
             if uid is None:
                 _user = self.users.search(nick)
                 if _user is not None:
-                    self.connection.call('kick', [u'' + nick, str(_user.id)])
+                    self.queue_call(outbound.MODERATION, 'kick', [u'' + nick, str(_user.id)], coalesce=False)
             else:
-                self.connection.call('kick', [u'' + nick, str(uid)])
+                self.queue_call(outbound.MODERATION, 'kick', [u'' + nick, str(uid)], coalesce=False)
 
     def send_forgive_msg(self, uid):
         """ Send forgive message.
@@ -1004,14 +1490,15 @@ class TinychatRTMPClient(object):
         :type uid: int | str
         """
         if self.is_client_mod:
-            self.connection.call('forgive', [u'' + str(uid)])
+            # Kicks and forgives are never coalesced, a ban, forgive, ban must not end up a forgive.
+            self.queue_call(outbound.MODERATION, 'forgive', [u'' + str(uid)], coalesce=False)
             # get the updated ban list.
             self.send_banlist_msg()
 
     def send_banlist_msg(self):
         """ Send ban list message. """
         if self.is_client_mod:
-            self.connection.call('banlist')
+            self.queue_call(outbound.SYSTEM, 'banlist')
 
     def send_topic_msg(self, topic):
         """ Send a room topic message.
@@ -1020,7 +1507,7 @@ class TinychatRTMPClient(object):
         :type topic: str
         """
         if self.is_client_mod:
-            self.connection.call('topic', [u'' + topic])
+            self.queue_call(outbound.SYSTEM, 'topic', [u'' + topic])
 
     def send_close_user_msg(self, nick):
         """ Send close user broadcast message.
@@ -1029,7 +1516,7 @@ class TinychatRTMPClient(object):
         :type nick: str
         """
         if self.is_client_mod:
-            self.connection.call('owner_run', [u'_close' + nick])
+            self.queue_call(outbound.MODERATION, 'owner_run', [u'_close' + nick])
 
     # Helper Methods
     def get_runtime(self, milliseconds=True):
@@ -1088,7 +1575,6 @@ class TinychatRTMPClient(object):
                         # if it is not enabled anymore.
                         self.disconnect(greenroom=True)
             log.debug('recv configuration: %s' % self.param.config_dict)
-        self.start_auto_job_timer()
 
     def start_auto_job_timer(self):
         """
@@ -1096,4 +1582,4 @@ class TinychatRTMPClient(object):
         fetch the room config from tinychat API every 5 minute(300 seconds)(default).
         See line 228 at https://tinychat.com/embed/chat.js
         """
-        threading.Timer(config.AUTO_JOB_INTERVAL, self.auto_job_handler).start()
+        timer_wheel.schedule_periodic(config.AUTO_JOB_INTERVAL, self.auto_job_handler, owner=self, name='auto_job')
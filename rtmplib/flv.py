@@ -0,0 +1,320 @@
+""" Reading and writing FLV files, and publishing their audio and video on a RTMP stream. """
+import collections
+import logging
+import mmap
+import struct
+import threading
+import time
+
+from . import rtmp_type
+
+log = logging.getLogger(__name__)
+
+# FLV tag types.
+TAG_AUDIO = 8
+TAG_VIDEO = 9
+TAG_SCRIPT = 18
+
+# The chunk size used while publishing, media messages are much larger than the default 128 bytes.
+PUBLISH_CHUNK_SIZE = 4096
+
+# Milliseconds between the last tag of a file and the first tag of the next file in a playlist.
+FILE_GAP = 40
+
+# The default maximum amount of tag bytes a FlvWriter holds while the disk catches up.
+MAX_WRITE_BUFFER = 8 * 1024 * 1024
+
+
+class FlvError(Exception):
+    """ Raised when a file is not a FLV file. """
+    pass
+
+
+class FlvTag(object):
+    """ A FLV tag, the data is a buffer into the memory mapped file. """
+    __slots__ = ('tag_type', 'timestamp', 'data')
+
+    def __init__(self, tag_type, timestamp, data):
+        self.tag_type = tag_type
+        self.timestamp = timestamp
+        self.data = data
+
+    def __repr__(self):
+        return '<FlvTag type=%s timestamp=%s size=%s>' % (self.tag_type, self.timestamp, len(self.data))
+
+
+class FlvReader(object):
+    """
+    Reads the tags of a FLV file from a memory mapping of the file.
+
+    The tag data are buffer slices of the mapping, so nothing is copied
+    and the operating system only pages in the parts that are read.
+    The tags must not be used after the reader is closed.
+    """
+    def __init__(self, file_path):
+        """ Open and check a FLV file.
+
+        :param file_path: The path to the FLV file.
+        :type file_path: str
+        :raises FlvError: If the file is not a FLV file.
+        """
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error) as e:
+            self._file.close()
+            raise FlvError('can not map %s: %s' % (file_path, e))
+        if len(self._map) < 13 or self._map[:3] != 'FLV':
+            self.close()
+            raise FlvError('%s is not a FLV file.' % file_path)
+        self.has_audio = bool(ord(self._map[4]) & 4)
+        self.has_video = bool(ord(self._map[4]) & 1)
+        # The header size, followed by the size of the (non existing) previous tag.
+        self._data_offset = struct.unpack('>I', self._map[5:9])[0] + 4
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        """ The tags of the file, a truncated last tag is skipped. """
+        pos = self._data_offset
+        size = len(self._map)
+        while pos + 11 <= size:
+            tag_type = ord(self._map[pos]) & 0x1f
+            data_size = struct.unpack('>I', '\x00' + self._map[pos + 1:pos + 4])[0]
+            timestamp = struct.unpack('>I', self._map[pos + 7] + self._map[pos + 4:pos + 7])[0]
+            start = pos + 11
+            if start + data_size > size:
+                log.warning('truncated tag at %s in %s' % (pos, self.file_path))
+                return
+            yield FlvTag(tag_type, timestamp, buffer(self._map, start, data_size))
+            # Skip the tag data and the previous tag size that follows it.
+            pos = start + data_size + 4
+
+    def close(self):
+        """ Unmap and close the file. """
+        self._map.close()
+        self._file.close()
+
+
+class FlvWriter(object):
+    """
+    Writes tags to a FLV file from its own thread.
+
+    The tags are queued, so a slow disk does not hold up the thread reading
+    the connection. While more than max_buffer bytes are queued, new tags are
+    dropped, and video tags are dropped until the next key frame, so the file
+    stays playable. The timestamps are made relative to the first tag.
+    """
+    def __init__(self, file_path, max_buffer=MAX_WRITE_BUFFER):
+        """ Create the file and start the writer thread.
+
+        :param file_path: The path to the FLV file.
+        :type file_path: str
+        :param max_buffer: The maximum amount of tag bytes queued.
+        :type max_buffer: int
+        :raises IOError: If the file can not be created.
+        """
+        self.file_path = file_path
+        self.max_buffer = max_buffer
+        self.tags_written = 0
+        self.tags_dropped = 0
+        self._file = open(file_path, 'wb')
+        # Version 1, audio and video, a 9 byte header, the size of the (non existing) previous tag.
+        self._file.write('FLV\x01\x05' + struct.pack('>II', 9, 0))
+        self._queue = collections.deque()
+        self._queued_bytes = 0
+        self._first_timestamp = None
+        self._skip_video = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, tag_type, timestamp, data):
+        """ Queue a tag.
+
+        :param tag_type: TAG_AUDIO, TAG_VIDEO or TAG_SCRIPT
+        :type tag_type: int
+        :param timestamp: The stream timestamp in milliseconds.
+        :type timestamp: int
+        :param data: The tag data, it is not copied.
+        :type data: str | buffer
+        :return: True if queued, False if dropped.
+        :rtype: bool
+        """
+        with self._condition:
+            if self._closed:
+                return False
+            if tag_type == TAG_VIDEO and self._skip_video:
+                # The frame type is in the high bits of the first byte, 1 is a key frame.
+                if not len(data) or ord(data[0]) >> 4 != 1:
+                    self.tags_dropped += 1
+                    return False
+                self._skip_video = False
+            if self._queued_bytes + len(data) > self.max_buffer:
+                self.tags_dropped += 1
+                if tag_type == TAG_VIDEO:
+                    self._skip_video = True
+                log.debug('write buffer full, dropped a tag for %s' % self.file_path)
+                return False
+            if self._first_timestamp is None:
+                self._first_timestamp = timestamp
+            self._queue.append((tag_type, max(0, timestamp - self._first_timestamp), data))
+            self._queued_bytes += len(data)
+            self._condition.notify()
+            return True
+
+    def close(self):
+        """ Stop accepting tags, the queued tags are written before the file is closed. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._queue and not self._closed:
+                        self._condition.wait()
+                    if not self._queue:
+                        break
+                    tags = list(self._queue)
+                    self._queue.clear()
+                written = 0
+                for tag_type, timestamp, data in tags:
+                    size = len(data)
+                    self._file.write(chr(tag_type) + struct.pack('>I', size)[1:] +
+                                     struct.pack('>I', timestamp & 0xffffff)[1:] + chr(timestamp >> 24 & 0xff) +
+                                     '\x00\x00\x00')
+                    self._file.write(data)
+                    self._file.write(struct.pack('>I', 11 + size))
+                    written += size
+                self.tags_written += len(tags)
+                with self._condition:
+                    self._queued_bytes -= written
+        except (IOError, OSError) as e:
+            log.error('flv writer error for %s: %s' % (self.file_path, e))
+            with self._condition:
+                self._closed = True
+                self._queue.clear()
+        finally:
+            self._file.close()
+            log.info('closed %s, %s tags written, %s dropped' % (self.file_path, self.tags_written, self.tags_dropped))
+
+
+class FlvPublisher(object):
+    """
+    Sends the audio and video tags of FLV files on a published stream,
+    paced by the tag timestamps, from its own thread.
+
+    The files of the playlist are played one after the other, and the
+    playlist starts over if loop is set. The timestamps run on across files,
+    so the stream looks like one continuous stream to the viewers.
+    """
+    def __init__(self, client, playlist, loop=False, on_done=None):
+        """ Create a instance of the FlvPublisher class.
+
+        :param client: The client with a published stream.
+        :type client: rtmplib.rtmp.RtmpClient
+        :param playlist: Paths to FLV files.
+        :type playlist: list
+        :param loop: Start the playlist over when it ends.
+        :type loop: bool
+        :param on_done: Called without arguments when the publisher stops.
+        """
+        self.client = client
+        self.playlist = list(playlist)
+        self.loop = loop
+        self.on_done = on_done
+        self.current_file = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """ Start publishing. """
+        if not self.is_running:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """ Stop publishing, the current tag is finished first.
+
+        :param timeout: Seconds to wait for the publisher thread to end, None to not wait.
+        :type timeout: int | float | None
+        :return: True if the publisher thread has ended, else False.
+        :rtype: bool
+        """
+        self._stop_event.set()
+        thread = self._thread
+        if thread is None:
+            return True
+        if timeout is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        return not thread.is_alive()
+
+    def _run(self):
+        try:
+            self.client.set_chunk_size(PUBLISH_CHUNK_SIZE)
+            start_time = time.time()
+            offset = 0
+            while not self._stop_event.is_set():
+                sent = False
+                for file_path in self.playlist:
+                    if self._stop_event.is_set():
+                        break
+                    last = self._play(file_path, start_time, offset)
+                    if last is not None:
+                        sent = True
+                        offset = last + FILE_GAP
+                if not self.loop or not sent:
+                    break
+        except Exception as e:
+            log.error('flv publisher error: %s' % e, exc_info=True)
+        finally:
+            self.current_file = None
+            if self.on_done is not None:
+                self.on_done()
+
+    def _play(self, file_path, start_time, offset):
+        """ Send the audio and video tags of a file.
+
+        :return: The stream timestamp of the last tag sent, or None if nothing was sent.
+        :rtype: int | None
+        """
+        try:
+            reader = FlvReader(file_path)
+        except (IOError, FlvError) as e:
+            log.error('can not play %s: %s' % (file_path, e))
+            return None
+        self.current_file = file_path
+        log.info('publishing %s' % file_path)
+        first = None
+        last = None
+        with reader:
+            for tag in reader:
+                if tag.tag_type != TAG_AUDIO and tag.tag_type != TAG_VIDEO:
+                    continue
+                if first is None:
+                    first = tag.timestamp
+                timestamp = offset + tag.timestamp - first
+                wait = start_time + timestamp / 1000.0 - time.time()
+                if wait > 0 and self._stop_event.wait(wait):
+                    break
+                if self._stop_event.is_set():
+                    break
+                data_type = rtmp_type.DT_AUDIO_MESSAGE if tag.tag_type == TAG_AUDIO else rtmp_type.DT_VIDEO_MESSAGE
+                self.client.send_media(data_type, tag.data, timestamp)
+                last = timestamp
+        return last
@@ -66,8 +66,6 @@ def decode(stream):
     # if header.timestamp >= 0x00ffffff:
     #     self.stream.read_ulong()
 
-    log.info('header recv: %s' % header)
-
     return header
 
 
@@ -90,7 +88,6 @@ def encode(stream, header, previous=None):
     @param header: The L{Header} to encode.
     @param previous: The previous header (if any).
     """
-    log.debug('header send: %s' % header)
     if previous is None:
         size = 0
     else:
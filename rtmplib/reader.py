@@ -1,4 +1,5 @@
 import logging
+import struct
 
 from pyamf import amf0, amf3
 import pyamf.util.pure
@@ -14,12 +15,17 @@ class RtmpReader:
     # default chunk size
     chunk_size = 128
 
-    def __init__(self, stream):
+    def __init__(self, stream, recorder=None):
         """
         Initialize the RTMP reader and set it to read from the specified stream.
+
+        :param recorder: Traces the headers and messages read, None for no tracing.
+        :type recorder: rtmplib.trace.Recorder | None
         """
         self.stream = stream
-        self.prv_header = None
+        self.recorder = recorder
+        # chunk stream id -> _ChunkStream
+        self._channels = dict()
 
     def __iter__(self):
         # AttributeError: 'NoneType' object has no attribute 'next'
@@ -29,49 +35,83 @@ class RtmpReader:
             return self
 
     def next(self):
-        """ Read one RTMP message from the stream and return it. """
+        """ Read one RTMP message from the stream and return it.
+
+        A message may span a number of chunks, each with its own header, and
+        the chunks of messages on different chunk streams (e.g audio and video)
+        may be interleaved. So the last header and the partly read message are
+        kept per chunk stream, and chunks are read until a message is complete.
+        """
         if self.stream.at_eof():
             raise StopIteration
-        # Read the message into body_stream. The message may span a number of
-        # chunks (each one with its own header).
-        message_body = []
-        msg_body_len = 0
-        _header = header.decode(self.stream)
-        log.debug('header %s' % _header)
-
-        # FIXME: this should really be implemented inside header_decode
-        if _header.data_type == rtmp_type.DT_NONE:
-            _header = self.prv_header
-        self.prv_header = _header
-
         while True:
-            # NOTE: this whole loop section needs to be looked at.
-            read_bytes = min(_header.body_length - msg_body_len, self.chunk_size)
-
-            message_body.append(self.stream.read(read_bytes))
-            msg_body_len += read_bytes
-            if msg_body_len >= _header.body_length:
-                break
-            next_header = header.decode(self.stream)
-            # WORKAROUND: even though the RTMP specification states that the
-            # extended timestamp field DOES NOT follow type 3 chunks, it seems
-            # that Flash player 10.1.85.3 and Flash Media Server 3.0.2.217 send
-            # and expect this field here.
-            if _header.timestamp >= 0x00ffffff:
+            _header = header.decode(self.stream)
+            if self.recorder is not None:
+                self.recorder.record('header recv', _header)
+            channel = self._channels.get(_header.channel_id)
+            if channel is None:
+                channel = self._channels[_header.channel_id] = _ChunkStream()
+
+            if channel.parts is None:
+                channel.start(_header)
+            elif channel.extended:
+                # WORKAROUND: even though the RTMP specification states that the
+                # extended timestamp field DOES NOT follow type 3 chunks, it seems
+                # that Flash player 10.1.85.3 and Flash Media Server 3.0.2.217 send
+                # and expect this field here.
                 self.stream.read_ulong()
-            assert next_header.stream_id == -1, (_header, next_header)
-            assert next_header.data_type == -1, (_header, next_header)
-            assert next_header.timestamp == -1, (_header, next_header)
-            assert next_header.body_length == -1, (_header, next_header)
-        assert _header.body_length == msg_body_len, (_header, msg_body_len)
-        body_stream = pyamf.util.BufferedByteStream(''.join(message_body))
-
-        # Decode the message based on the datatype present in the header
+
+            _header = channel.header
+            read_bytes = min(_header.body_length - channel.received, self.chunk_size)
+            channel.parts.append(self.stream.read(read_bytes))
+            channel.received += read_bytes
+            if channel.received < _header.body_length:
+                continue
+            body = channel.finish()
+
+            ret = self._decode(_header, body)
+            if ret is not None:
+                if self.recorder is not None:
+                    self.recorder.record('recv', ret)
+                return ret
+
+    def _decode(self, _header, body):
+        """ Decode a message based on the datatype present in the header.
+
+        Audio, video and data messages are not decoded, they reference the message body.
+
+        :return: The message, or None if there is nothing to return.
+        :rtype: dict | None
+        """
         ret = {'msg': _header.data_type}
 
-        if ret['msg'] == rtmp_type.DT_NONE:
+        if ret['msg'] in (rtmp_type.DT_AUDIO_MESSAGE, rtmp_type.DT_VIDEO_MESSAGE,
+                          rtmp_type.DT_DATA_MESSAGE, rtmp_type.DT_AMF3_DATA_MESSAGE):
+            ret['stream_id'] = _header.stream_id
+            ret['timestamp'] = _header.timestamp
+            ret['body'] = body
+            return ret
+
+        elif ret['msg'] == rtmp_type.DT_AGGREGATE_MESSAGE:
+            ret['stream_id'] = _header.stream_id
+            ret['timestamp'] = _header.timestamp
+            ret['messages'] = AggregateMessages(body, _header.stream_id, _header.timestamp)
+            return ret
+
+        elif ret['msg'] == rtmp_type.DT_ABORT:
+            channel_id = struct.unpack('>I', body[:4])[0]
+            if channel_id in self._channels:
+                self._channels[channel_id].finish()
+            return None
+
+        elif ret['msg'] == rtmp_type.DT_NONE:
             log.warning('WARNING: message with datatype None received: %s' % _header)
-            return self.next()
+            return None
+
+        body_stream = pyamf.util.BufferedByteStream(body)
+
+        if ret['msg'] == rtmp_type.DT_ACKNOWLEDGEMENT:
+            ret['sequence_number'] = body_stream.read_ulong()
 
         elif ret['msg'] == rtmp_type.DT_USER_CONTROL:
             ret['event_type'] = body_stream.read_ushort()
@@ -132,10 +172,11 @@ class RtmpReader:
 
         elif ret['msg'] == rtmp_type.DT_SET_CHUNK_SIZE:
             ret['chunk_size'] = body_stream.read_ulong()
+
         else:
-            assert False, _header
+            log.warning('unknown message type: %s' % _header)
+            ret['body'] = body
 
-        log.debug('recv %r', ret)
         return ret
 
     @staticmethod
@@ -184,6 +225,14 @@ class RtmpReader:
         elif event['type'] == rtmp_type.SO_REMOVE:
             event['data'] = decoder.readString()
 
+        elif event['type'] == rtmp_type.SO_SUCCESS:
+            # The key of a requested change that was accepted.
+            event['data'] = decoder.readString()
+
+        elif event['type'] == rtmp_type.SO_STATUS:
+            # The code and the level.
+            event['data'] = (decoder.readString(), decoder.readString())
+
         elif event['type'] == rtmp_type.SO_USE_SUCCESS:
             assert so_body_size == 0, so_body_size
             event['data'] = ''
@@ -192,3 +241,117 @@ class RtmpReader:
             assert False, event['type']
 
         return event
+
+
+def decode_data(message):
+    """ Decode the values of a data message, e.g onMetaData.
+
+    :param message: A DT_DATA_MESSAGE or DT_AMF3_DATA_MESSAGE message.
+    :type message: dict
+    :return: The values.
+    :rtype: list
+    """
+    body = message['body']
+    if message['msg'] == rtmp_type.DT_AMF3_DATA_MESSAGE:
+        # Starts with a format byte, the values are amf0 encoded.
+        body = body[1:]
+    body_stream = pyamf.util.BufferedByteStream(body)
+    decoder = amf0.Decoder(body_stream)
+    values = []
+    while not body_stream.at_eof():
+        values.append(decoder.readElement())
+    return values
+
+
+class _ChunkStream(object):
+    """ The state of a chunk stream: the header of the last message and the message being read. """
+    __slots__ = ('header', 'delta', 'extended', 'parts', 'received')
+
+    def __init__(self):
+        self.header = None
+        self.delta = 0
+        self.extended = False
+        self.parts = None
+        self.received = 0
+
+    def start(self, chunk_header):
+        """ Start a message, filling in the fields missing from the chunk header from the previous header.
+
+        :param chunk_header: The header of the first chunk of the message.
+        :type chunk_header: header.Header
+        """
+        prev = self.header
+        if chunk_header.full:
+            # Type 0, a absolute timestamp.
+            new = chunk_header
+            self.delta = 0
+        else:
+            assert prev is not None, chunk_header
+            new = header.Header(chunk_header.channel_id, stream_id=prev.stream_id, data_type=prev.data_type,
+                                body_length=prev.body_length)
+            if chunk_header.data_type != -1:
+                # Type 1, a new data type and length.
+                new.data_type = chunk_header.data_type
+                new.body_length = chunk_header.body_length
+            if chunk_header.timestamp != -1:
+                # Type 1 and 2, a timestamp delta.
+                self.delta = chunk_header.timestamp
+            new.timestamp = prev.timestamp + self.delta
+        if chunk_header.timestamp != -1:
+            self.extended = chunk_header.timestamp >= 0x00ffffff
+        self.header = new
+        self.parts = []
+        self.received = 0
+
+    def finish(self):
+        """ End the current message.
+
+        :return: The message body.
+        :rtype: str
+        """
+        parts, self.parts = self.parts, None
+        if not parts:
+            return ''
+        if len(parts) == 1:
+            return parts[0]
+        return ''.join(parts)
+
+
+class AggregateMessages(object):
+    """
+    The audio, video and data messages of a aggregate message.
+
+    The messages are only split out when iterated, and their bodies are
+    buffer slices of the aggregate message body, so nothing is copied.
+    """
+    __slots__ = ('body', 'stream_id', 'timestamp')
+
+    def __init__(self, body, stream_id, timestamp):
+        self.body = body
+        self.stream_id = stream_id
+        self.timestamp = timestamp
+
+    def __iter__(self):
+        body = self.body
+        size = len(body)
+        pos = 0
+        first = None
+        while pos + 11 <= size:
+            data_type = ord(body[pos])
+            data_size = struct.unpack('>I', '\x00' + body[pos + 1:pos + 4])[0]
+            timestamp = struct.unpack('>I', body[pos + 7] + body[pos + 4:pos + 7])[0]
+            start = pos + 11
+            if start + data_size > size:
+                log.warning('truncated aggregate message at %s' % pos)
+                return
+            if first is None:
+                first = timestamp
+            # The timestamps are relative to the first message, which has the timestamp of the aggregate.
+            yield {
+                'msg': data_type,
+                'stream_id': self.stream_id,
+                'timestamp': self.timestamp + timestamp - first,
+                'body': buffer(body, start, data_size)
+            }
+            # Skip the message and the back pointer that follows it.
+            pos = start + data_size + 4
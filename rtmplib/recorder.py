@@ -0,0 +1,181 @@
+""" Recording the broadcasts played on a RTMP connection to FLV files. """
+import logging
+import os
+import threading
+import time
+
+from . import flv, rtmp_type
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait for the server to create the stream of a recording.
+STREAM_TIMEOUT = 30
+
+
+class Recording(object):
+    """ A broadcast being recorded to a FLV file. """
+    def __init__(self, stream_name, file_path, max_buffer=flv.MAX_WRITE_BUFFER):
+        """ Create a instance of the Recording class, the file is created.
+
+        :param stream_name: The name of the played stream.
+        :type stream_name: str
+        :param file_path: The path to the FLV file.
+        :type file_path: str
+        :param max_buffer: The maximum amount of bytes queued for the file.
+        :type max_buffer: int
+        :raises IOError: If the file can not be created.
+        """
+        self.stream_name = stream_name
+        self.file_path = file_path
+        self.start_time = time.time()
+        # Set when the stream has been created.
+        self.stream_id = None
+        self.writer = flv.FlvWriter(file_path, max_buffer)
+
+    def __repr__(self):
+        return '<Recording %s stream_id=%s %ds>' % (self.stream_name, self.stream_id, time.time() - self.start_time)
+
+    def on_message(self, message):
+        """ Write a audio, video or data message of the stream.
+
+        :param message: A message read from the stream.
+        :type message: dict
+        """
+        msg = message['msg']
+        if msg == rtmp_type.DT_AUDIO_MESSAGE:
+            self.writer.write(flv.TAG_AUDIO, message['timestamp'], message['body'])
+        elif msg == rtmp_type.DT_VIDEO_MESSAGE:
+            self.writer.write(flv.TAG_VIDEO, message['timestamp'], message['body'])
+        elif msg == rtmp_type.DT_DATA_MESSAGE:
+            # e.g onMetaData, the amf0 encoded values are a script tag as is.
+            self.writer.write(flv.TAG_SCRIPT, message['timestamp'], message['body'])
+        elif msg == rtmp_type.DT_AGGREGATE_MESSAGE:
+            for sub_message in message['messages']:
+                self.on_message(sub_message)
+
+    def close(self):
+        """ Close the file once the queued tags are written. """
+        self.writer.close()
+
+
+class StreamRecorder(object):
+    """
+    Records broadcasts played on a client's connection, several at once.
+
+    Each broadcast is played on a stream of its own, and the audio and
+    video messages of the stream are written to a FLV file by a FlvWriter.
+    """
+    def __init__(self, client, directory, max_buffer=flv.MAX_WRITE_BUFFER, stream_timeout=STREAM_TIMEOUT):
+        """ Create a instance of the StreamRecorder class.
+
+        :param client: The connected client.
+        :type client: rtmplib.rtmp.RtmpClient
+        :param directory: The directory the FLV files are written to.
+        :type directory: str
+        :param max_buffer: The maximum amount of bytes queued per file.
+        :type max_buffer: int
+        :param stream_timeout: Seconds to wait for the stream of a recording, before the recording is dropped.
+        :type stream_timeout: int | float
+        """
+        self.client = client
+        self.directory = directory
+        self.max_buffer = max_buffer
+        self.stream_timeout = stream_timeout
+        # stream name -> Recording
+        self.recordings = dict()
+        self._lock = threading.Lock()
+
+    def record(self, stream_name, file_name=None):
+        """ Start recording a broadcast.
+
+        :param stream_name: The name of the stream to play.
+        :type stream_name: str | int
+        :param file_name: The name of the FLV file, defaults to the stream name and the time.
+        :type file_name: str | None
+        :return: The recording, or None if the stream is already being recorded.
+        :rtype: Recording | None
+        :raises IOError: If the file can not be created.
+        :raises socket.error: If the createStream message can not be sent, the recording is dropped.
+        """
+        stream_name = str(stream_name)
+        with self._lock:
+            if stream_name in self.recordings:
+                return None
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            if file_name is None:
+                file_name = '%s_%s.flv' % (stream_name, time.strftime('%Y%m%d-%H%M%S'))
+            recording = Recording(stream_name, os.path.join(self.directory, file_name), self.max_buffer)
+            self.recordings[stream_name] = recording
+        try:
+            self.client.createstream(callback=lambda stream_id: self._on_stream(recording, stream_id))
+        except Exception:
+            self._drop(recording)
+            raise
+        timer = threading.Timer(self.stream_timeout, self._on_stream_timeout, (recording,))
+        timer.daemon = True
+        timer.start()
+        log.info('recording %s to %s' % (stream_name, recording.file_path))
+        return recording
+
+    def _on_stream(self, recording, stream_id):
+        """ The stream for a recording was created, play the broadcast on it. """
+        with self._lock:
+            if self.recordings.get(recording.stream_name) is not recording:
+                # Stopped before the stream was created.
+                self.client.deletestream(stream_id)
+                return
+            recording.stream_id = stream_id
+            self.client.media_listeners[stream_id] = recording.on_message
+        self.client.play(recording.stream_name, stream_id)
+
+    def _on_stream_timeout(self, recording):
+        """ Drop a recording if the server did not create its stream in time. """
+        if recording.stream_id is None and self._drop(recording):
+            log.warning('no stream created for recording %s within %s seconds' %
+                        (recording.stream_name, self.stream_timeout))
+
+    def _drop(self, recording):
+        """ Remove and close a recording that has no stream yet.
+
+        A stream created for it later is deleted by _on_stream.
+
+        :return: True if dropped, False if it was stopped or got its stream.
+        :rtype: bool
+        """
+        with self._lock:
+            if self.recordings.get(recording.stream_name) is not recording or recording.stream_id is not None:
+                return False
+            del self.recordings[recording.stream_name]
+        recording.close()
+        return True
+
+    def stop(self, stream_name):
+        """ Stop recording a broadcast.
+
+        :param stream_name: The name of the stream.
+        :type stream_name: str | int
+        :return: The recording, or None if the stream was not being recorded.
+        :rtype: Recording | None
+        """
+        with self._lock:
+            recording = self.recordings.pop(str(stream_name), None)
+        if recording is None:
+            return None
+        if recording.stream_id is not None:
+            self.client.media_listeners.pop(recording.stream_id, None)
+            self.client.closestream(recording.stream_id)
+            self.client.deletestream(recording.stream_id)
+        recording.close()
+        log.info('stopped recording %s' % stream_name)
+        return recording
+
+    def close(self):
+        """ Close all recordings without telling the server, e.g when the connection is lost. """
+        with self._lock:
+            recordings = self.recordings.values()
+            self.recordings.clear()
+        for recording in recordings:
+            if recording.stream_id is not None:
+                self.client.media_listeners.pop(recording.stream_id, None)
+            recording.close()
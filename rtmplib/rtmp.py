@@ -2,6 +2,8 @@ import logging
 import random
 import socket
 import struct
+import sys
+import threading
 import time
 
 import pyamf.util.pure
@@ -11,25 +13,96 @@ from . import packet, reader, writer, rtmp_type, socks
 
 log = logging.getLogger(__name__)
 
+# Missing from the socket module in python 2, the values are the linux and macOS ones.
+TCP_USER_TIMEOUT = getattr(socket, 'TCP_USER_TIMEOUT', 18)
+TCP_KEEPALIVE = getattr(socket, 'TCP_KEEPALIVE', 0x10)
+
+# The socket options used when none are given, see set_socket_options.
+DEFAULT_SOCKET_OPTIONS = {
+    'keepalive_idle': 10,
+    'keepalive_interval': 3,
+    'keepalive_count': 3,
+    'nodelay': True,
+    'send_buffer': 0,
+    'recv_buffer': 0,
+    'user_timeout': 30
+}
+
 
 class AmfDataReadError(Exception):
     """ Raised on failure to read next amf data packet. """
     pass
 
 
+def set_socket_options(sock, options):
+    """ Set the keepalive, nagle, buffer and timeout options of a TCP socket.
+
+    Options the platform does not support are skipped. On windows the keepalive
+    count can not be set, and the user timeout is linux only.
+
+    :param sock: The socket, before it connects.
+    :type sock: socket.socket
+    :param options: keepalive_idle and keepalive_interval in seconds, keepalive_count,
+    nodelay, send_buffer and recv_buffer in bytes (0 for the system default)
+    and user_timeout in seconds (0 for the system default).
+    :type options: dict
+    """
+    def _set(level, name, value):
+        try:
+            sock.setsockopt(level, name, value)
+        except (socket.error, AttributeError) as e:
+            log.debug('could not set socket option %s: %s' % (name, e))
+
+    idle = options.get('keepalive_idle', 0)
+    interval = options.get('keepalive_interval', 0)
+    _set(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, 'SIO_KEEPALIVE_VALS'):
+        # Windows.
+        if idle and interval:
+            try:
+                sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+            except (socket.error, AttributeError) as e:
+                log.debug('could not set keepalive values: %s' % e)
+    else:
+        if idle and sys.platform == 'darwin':
+            _set(socket.IPPROTO_TCP, TCP_KEEPALIVE, idle)
+        elif idle and hasattr(socket, 'TCP_KEEPIDLE'):
+            _set(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        if interval and hasattr(socket, 'TCP_KEEPINTVL'):
+            _set(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+        if options.get('keepalive_count') and hasattr(socket, 'TCP_KEEPCNT'):
+            _set(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, options['keepalive_count'])
+        if options.get('user_timeout') and sys.platform.startswith('linux'):
+            _set(socket.IPPROTO_TCP, TCP_USER_TIMEOUT, options['user_timeout'] * 1000)
+
+    if options.get('nodelay'):
+        _set(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if options.get('send_buffer'):
+        _set(socket.SOL_SOCKET, socket.SO_SNDBUF, options['send_buffer'])
+    if options.get('recv_buffer'):
+        _set(socket.SOL_SOCKET, socket.SO_RCVBUF, options['recv_buffer'])
+
+
 class FileDataTypeMixIn(pyamf.util.pure.DataTypeMixIn):
     """
     Provides a wrapper for a file object that enables reading and writing of raw
     data types for the file.
+
+    The bytes read and written are counted, for the RTMP acknowledgements.
     """
     def __init__(self, fileobject):
         self.fileobject = fileobject
+        self.bytes_read = 0
+        self.bytes_written = 0
         pyamf.util.pure.DataTypeMixIn.__init__(self)
 
     def read(self, length):
-        return self.fileobject.read(length)
+        data = self.fileobject.read(length)
+        self.bytes_read += len(data)
+        return data
 
     def write(self, data):
+        self.bytes_written += len(data)
         self.fileobject.write(data)
 
     def flush(self):
@@ -51,9 +124,11 @@ class RtmpClient:
         self.page_url = kwargs.get('page_url', u'')
         self.swf_url = kwargs.get('swf_url', u'')
         self.proxy = kwargs.get('proxy', '')
-        self.is_win = kwargs.get('is_win', False)
+        self.socket_options = kwargs.get('socket_options', DEFAULT_SOCKET_OPTIONS)
         self.handle = kwargs.get('handle', True)
         self.flash_version = kwargs.get('flash_version', 'WIN 22.0.0.209')
+        # Traces the headers and messages of this connection, see rtmplib.trace
+        self.recorder = kwargs.get('recorder')
         self.shared_objects = []
         self.socket = None
         self.stream = None
@@ -62,6 +137,23 @@ class RtmpClient:
         self.reader = None
 
         self.stream_id = 0
+        # The time of the last packet read, set when the connection is opened.
+        self.last_read_time = None
+        # Called with the round trip time in milliseconds of ping_request.
+        self.on_ping_response = kwargs.get('on_ping_response')
+        # The acknowledgement window set by the server, and the bytes read when last acknowledged.
+        self.window_ack_size = None
+        self._acked_bytes = 0
+        # The window acknowledgement size last sent to the server.
+        self._sent_window_ack_size = None
+        # The amount of our bytes the server last acknowledged.
+        self.peer_acked_bytes = 0
+        # createStream transaction id -> function called with the stream id, see createstream.
+        self._stream_requests = dict()
+        # stream id -> function called with the audio, video and data messages of the stream.
+        self.media_listeners = dict()
+        # Messages are written from several threads, a message must be written whole.
+        self._write_lock = threading.RLock()
         self._transaction_id = 2
 
     @staticmethod
@@ -107,9 +199,11 @@ class RtmpClient:
         s2 = packet.Handshake()
         s2.decode(self.stream)
 
-    def _connect_rtmp(self, connect_params):
+    def connect_rtmp(self, connect_params):
         """ Initiate a NetConnection with a Flash Media Server.
 
+        The connection must be open, see open()
+
         :param connect_params: A list or dict containing application specific connect parameters.
         :type connect_params: dict
         """
@@ -139,8 +233,7 @@ class RtmpClient:
         else:
             msg['command'].extend(connect_params)
 
-        self.writer.write(msg)
-        self.writer.flush()
+        self._send(msg)
 
     def amf(self):
         """ Read the next amf packet from the stream.
@@ -151,9 +244,10 @@ class RtmpClient:
         """
         try:
             amf_data = self.reader.next()
+            self.last_read_time = time.time()
+            self._acknowledge()
             if self.handle:
-                if self.handle_packet(amf_data):
-                    log.debug('handled amf data: %s' % amf_data)
+                self.handle_packet(amf_data)
             return amf_data
         except Exception as e:
             raise AmfDataReadError(e)
@@ -172,25 +266,48 @@ class RtmpClient:
                 'event_type': rtmp_type.UC_PING_RESPONSE,
                 'event_data': amf_data['event_data'],
             }
-            self.writer.write(resp)
-            self.writer.flush()
+            self._send(resp)
             return True
 
         elif amf_data['msg'] == rtmp_type.DT_USER_CONTROL and amf_data['event_type'] == rtmp_type.UC_PING_RESPONSE:
             ping_response = struct.unpack('>I', amf_data['event_data'])[0]
             log.debug('ping response from server %s' % ping_response)
+            if self.on_ping_response is not None:
+                # The timestamp is in milliseconds, wrapped to 32 bits.
+                rtt = (int(time.time() * 1000) - ping_response) & 0xFFFFFFFF
+                self.on_ping_response(rtt)
             return True
 
         elif amf_data['msg'] == rtmp_type.DT_WINDOW_ACK_SIZE:
-            assert amf_data['window_ack_size'] == 2500000, amf_data
-            ack_msg = {'msg': rtmp_type.DT_WINDOW_ACK_SIZE, 'window_ack_size': amf_data['window_ack_size']}
-            self.writer.write(ack_msg)
-            self.writer.flush()
+            log.debug('window acknowledgement size: %s' % amf_data['window_ack_size'])
+            self.window_ack_size = amf_data['window_ack_size']
+            self._send_window_ack_size(amf_data['window_ack_size'])
             return True
 
         elif amf_data['msg'] == rtmp_type.DT_SET_PEER_BANDWIDTH:
-            assert amf_data['window_ack_size'] == 2500000, amf_data
-            assert amf_data['limit_type'] == 2, amf_data
+            # Limit type 0 is hard, 1 is soft and 2 is dynamic.
+            log.debug('peer bandwidth: %s, limit type: %s' % (amf_data['window_ack_size'], amf_data['limit_type']))
+            if amf_data['window_ack_size'] != self._sent_window_ack_size:
+                self._send_window_ack_size(amf_data['window_ack_size'])
+            return True
+
+        elif amf_data['msg'] in (rtmp_type.DT_AUDIO_MESSAGE, rtmp_type.DT_VIDEO_MESSAGE,
+                                 rtmp_type.DT_DATA_MESSAGE, rtmp_type.DT_AGGREGATE_MESSAGE):
+            listener = self.media_listeners.get(amf_data['stream_id'])
+            if listener is not None:
+                listener(amf_data)
+                return True
+            return False
+
+        elif amf_data['msg'] == rtmp_type.DT_SHARED_OBJECT or amf_data['msg'] == rtmp_type.DT_AMF3_SHARED_OBJECT:
+            for so in self.shared_objects:
+                if so.name == amf_data['obj_name']:
+                    so.apply(amf_data)
+                    return True
+            return False
+
+        elif amf_data['msg'] == rtmp_type.DT_ACKNOWLEDGEMENT:
+            self.peer_acked_bytes = amf_data['sequence_number']
             return True
 
         elif amf_data['msg'] == rtmp_type.DT_USER_CONTROL and amf_data['event_type'] == rtmp_type.UC_STREAM_BEGIN:
@@ -209,6 +326,9 @@ class RtmpClient:
     def is_create_stream_response(self, amf_data):
         """ Check amf data to determine if it is a createStream response.
 
+        The response to a createstream call with a callback is passed
+        to the callback, and is not considered a response here.
+
         :param amf_data: amf data from the remote server.
         :type amf_data: dict
         :return: True if the amf data was considered a response to a createStream message, else False.
@@ -216,6 +336,11 @@ class RtmpClient:
         """
         if amf_data['msg'] == rtmp_type.DT_COMMAND and len(amf_data['command']) is 4:
             if amf_data['command'][0] == '_result' and type(amf_data['command'][3]) is int:
+                callback = self._stream_requests.pop(amf_data['command'][1], None)
+                if callback is not None:
+                    log.info('create stream response for a extra stream, stream id : %s' % amf_data['command'][3])
+                    callback(amf_data['command'][3])
+                    return False
                 log.info('create stream response received, stream id : %s' % amf_data['command'][3])
                 self.stream_id = amf_data['command'][3]
                 self.writer.stream_id = self.stream_id
@@ -229,6 +354,15 @@ class RtmpClient:
         :param connect_params: A list or dict containing application specific connect parameters
         :type connect_params: list | dict
         """
+        self.open()
+        self.connect_rtmp(connect_params)
+
+    def open(self):
+        """ Open the socket connection and perform the handshake.
+
+        This does not depend on the connect parameters, so it can be done
+        while the application specific connect parameters are still being gathered.
+        """
         if self.proxy:
             parts = self.proxy.split(':')
             ip = parts[0]
@@ -240,20 +374,17 @@ class RtmpClient:
         else:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
+        # Set before connecting, the buffer sizes affect the window negotiated on connect.
+        set_socket_options(self.socket, self.socket_options)
         self.socket.connect((self.ip, self.port))
         self.file = self.socket.makefile()
         self.stream = FileDataTypeMixIn(self.file)
 
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        if self.is_win:
-            self.socket.ioctl(socket.SIO_KEEPALIVE_VALS, (1, 10000, 3000))
-
         self.handshake()
 
-        self.reader = reader.RtmpReader(self.stream)
-        self.writer = writer.RtmpWriter(self.stream)
-
-        self._connect_rtmp(connect_params)
+        self.reader = reader.RtmpReader(self.stream, self.recorder)
+        self.writer = writer.RtmpWriter(self.stream, self.recorder)
+        self.last_read_time = time.time()
 
     def shutdown(self):
         """ Closes the socket connection. """
@@ -264,11 +395,83 @@ class RtmpClient:
             log.error('socket error %s' % se)
 
     def shared_object_use(self, so):
-        """ Use a shared object and add it to the managed list of SOs. """
+        """ Use a shared object and add it to the managed list of SOs.
+
+        The shared object messages read for it are applied to it.
+
+        :param so: The shared object.
+        :type so: shared_object.SharedObject
+        """
         if so in self.shared_objects:
             return
-        so.use(self.reader, self.writer)
+        so.client = self
         self.shared_objects.append(so)
+        self.shared_object_send(so, [{'type': rtmp_type.SO_USE, 'data': ''}])
+
+    def shared_object_release(self, so):
+        """ Stop using a shared object.
+
+        :param so: The shared object.
+        :type so: shared_object.SharedObject
+        """
+        if so not in self.shared_objects:
+            return
+        self.shared_objects.remove(so)
+        so.is_used = False
+        self.shared_object_send(so, [{'type': rtmp_type.SO_RELEASE, 'data': ''}])
+
+    def shared_object_send(self, so, events):
+        """ Send shared object events.
+
+        :param so: The shared object.
+        :type so: shared_object.SharedObject
+        :param events: The events, dicts with a type and data.
+        :type events: list
+        """
+        msg = {
+            'msg': rtmp_type.DT_SHARED_OBJECT,
+            'obj_name': so.name,
+            'curr_version': so.version,
+            'flags': so.flags,
+            'events': events
+        }
+        self._send(msg)
+
+    @property
+    def bytes_in(self):
+        """ The amount of bytes read from the connection. """
+        if self.stream is None:
+            return 0
+        return self.stream.bytes_read
+
+    @property
+    def bytes_out(self):
+        """ The amount of bytes written to the connection. """
+        if self.stream is None:
+            return 0
+        return self.stream.bytes_written
+
+    def _acknowledge(self):
+        """ Acknowledge the bytes read, each time a window acknowledgement size worth has been read. """
+        if self.window_ack_size and self.stream.bytes_read - self._acked_bytes >= self.window_ack_size:
+            self._acked_bytes = self.stream.bytes_read
+            # The sequence number wraps at 32 bits.
+            self._send({'msg': rtmp_type.DT_ACKNOWLEDGEMENT, 'sequence_number': self._acked_bytes & 0xFFFFFFFF})
+
+    def _send_window_ack_size(self, window_ack_size):
+        """ Tell the server after how many bytes we expect it to acknowledge. """
+        self._sent_window_ack_size = window_ack_size
+        self._send({'msg': rtmp_type.DT_WINDOW_ACK_SIZE, 'window_ack_size': window_ack_size})
+
+    def _send(self, msg):
+        """ Write and flush a message.
+
+        :param msg: The message.
+        :type msg: dict
+        """
+        with self._write_lock:
+            self.writer.write(msg)
+            self.writer.flush()
 
     def _get_next_transaction_id(self):
         """ Get the next transaction ID. """
@@ -301,46 +504,101 @@ class RtmpClient:
         }
         msg['command'].extend(parameters)
 
-        self.writer.write(msg)
-        self.writer.flush()
+        self._send(msg)
 
     def ping_request(self):
-        """ Send a PING request. """
+        """ Send a PING request.
+
+        The server echoes the timestamp, so the round trip time
+        is passed to on_ping_response when the response is read.
+        """
         msg = {
             'msg': rtmp_type.DT_USER_CONTROL,
             'event_type': rtmp_type.UC_PING_REQUEST,
-            'event_data': struct.pack('>I', int(time.time()))
+            'event_data': struct.pack('>I', int(time.time() * 1000) & 0xFFFFFFFF)
         }
         log.debug('sending ping request to server: %s' % msg)
-        self.writer.write(msg)
-        self.writer.flush()
+        self._send(msg)
+
+    def createstream(self, callback=None):
+        """ Send createStream message.
 
-    def createstream(self):
-        """ Send createStream message. """
+        :param callback: Called with the id of the created stream, for
+        a extra stream (e.g to play a broadcast on). If None, the response
+        sets stream_id, see is_create_stream_response.
+        """
+        transaction_id = self._get_next_transaction_id()
+        if callback is not None:
+            self._stream_requests[transaction_id] = callback
         msg = {
             'msg': rtmp_type.DT_COMMAND,
-            'command': ['createStream', self._get_next_transaction_id(), None]
+            'command': ['createStream', transaction_id, None]
         }
-        self.writer.write(msg)
-        self.writer.flush()
+        self._send(msg)
 
-    def closestream(self):
-        """ Send closeStream message. """
+    def closestream(self, stream_id=None):
+        """ Send closeStream message.
+
+        :param stream_id: The stream to close, or None for our stream.
+        :type stream_id: int | None
+        """
         msg = {
             'msg': rtmp_type.DT_COMMAND,
             'command': ['closeStream', 0, None]
         }
-        self.writer.write(msg)
-        self.writer.flush()
+        if stream_id is not None:
+            msg['stream_id'] = stream_id
+        self._send(msg)
 
-    def deletestream(self):
-        """ Send deleteStream message. """
+    def deletestream(self, stream_id=None):
+        """ Send deleteStream message.
+
+        :param stream_id: The stream to delete, or None for our stream.
+        :type stream_id: int | None
+        """
         msg = {
             'msg': rtmp_type.DT_COMMAND,
             'command': ['deleteStream', 0, None]
         }
-        self.writer.write(msg)
-        self.writer.flush()
+        if stream_id is not None:
+            msg['command'].append(stream_id)
+            msg['stream_id'] = stream_id
+        self._send(msg)
+
+    def play(self, stream_name, stream_id):
+        """ Send play message, the audio and video of the stream go to media_listeners.
+
+        :param stream_name: The name of the stream to play.
+        :type stream_name: str | int
+        :param stream_id: The stream to play it on, see createstream.
+        :type stream_id: int
+        """
+        msg = {
+            'msg': rtmp_type.DT_COMMAND,
+            'command': ['play', 0, None, str(stream_name)],
+            'stream_id': stream_id
+        }
+        self._send(msg)
+
+    def set_chunk_size(self, chunk_size):
+        """ Set the size of the chunks we send.
+
+        :param chunk_size: The chunk size in bytes.
+        :type chunk_size: int
+        """
+        self._send({'msg': rtmp_type.DT_SET_CHUNK_SIZE, 'chunk_size': chunk_size})
+
+    def send_media(self, data_type, data, timestamp):
+        """ Send a audio or video message on the published stream.
+
+        :param data_type: rtmp_type.DT_AUDIO_MESSAGE or rtmp_type.DT_VIDEO_MESSAGE
+        :type data_type: int
+        :param data: The FLV tag data.
+        :type data: str | buffer
+        :param timestamp: The stream timestamp in milliseconds.
+        :type timestamp: int
+        """
+        self._send({'msg': data_type, 'body': data, 'timestamp': timestamp})
 
     def publish(self, publishing_name, publishing_type='live'):
         """ Send publish message.
@@ -354,5 +612,4 @@ class RtmpClient:
             'msg': rtmp_type.DT_COMMAND,
             'command': ['publish', 0, None, str(publishing_name), publishing_type]
         }
-        self.writer.write(msg)
-        self.writer.flush()
+        self._send(msg)
@@ -0,0 +1,149 @@
+""" A local copy of a remote shared object, kept up to date from the shared object events. """
+import logging
+import struct
+import threading
+
+from . import rtmp_type
+
+log = logging.getLogger(__name__)
+
+
+class SharedObject(object):
+    """
+    A remote shared object.
+
+    The events of the shared object messages are applied to the local copy
+    as they are read, so a change costs only the keys it changes. Listeners
+    can be added per key, or for all keys, and are called with the key,
+    the old value and the new value. A removed key has the new value None.
+    """
+    def __init__(self, name, persistent=False):
+        """ Create a instance of the SharedObject class.
+
+        :param name: The name of the shared object.
+        :type name: str
+        :param persistent: True for a persistent shared object.
+        :type persistent: bool
+        """
+        self.name = name
+        self.persistent = persistent
+        # The flags of the shared object messages, the persistence flag is 2.
+        self.flags = struct.pack('>II', 2 if persistent else 0, 0)
+        self.data = dict()
+        # The curr_version of the last message applied.
+        self.version = 0
+        self.is_used = False
+        # The client it is used on, see RtmpClient.shared_object_use
+        self.client = None
+        # key -> list of listeners, the None key holds the listeners for all keys.
+        self._listeners = dict()
+        # Called with the parameters of SO_SEND_MESSAGE events.
+        self._message_listeners = []
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return '<SharedObject %s version=%s keys=%s>' % (self.name, self.version, len(self.data))
+
+    def get(self, key, default=None):
+        """ The value of a key.
+
+        :param key: The key.
+        :type key: str
+        :param default: Returned if the key is not set.
+        """
+        with self._lock:
+            return self.data.get(key, default)
+
+    def add_listener(self, callback, key=None):
+        """ Call a function when a key changes.
+
+        :param callback: Called with the key, the old value and the new value.
+        :param key: The key, or None for all keys.
+        :type key: str | None
+        """
+        with self._lock:
+            self._listeners.setdefault(key, []).append(callback)
+
+    def remove_listener(self, callback, key=None):
+        """ Stop calling a function when a key changes.
+
+        :param callback: The function given to add_listener.
+        :param key: The key given to add_listener.
+        :type key: str | None
+        """
+        with self._lock:
+            listeners = self._listeners.get(key)
+            if listeners is not None and callback in listeners:
+                listeners.remove(callback)
+                if not listeners:
+                    del self._listeners[key]
+
+    def add_message_listener(self, callback):
+        """ Call a function with the parameters of the messages sent on the shared object.
+
+        :param callback: Called with a list of parameters.
+        """
+        with self._lock:
+            self._message_listeners.append(callback)
+
+    def request_change(self, changes):
+        """ Ask the server to change keys, the local copy changes when the server sends the change.
+
+        :param changes: key -> value
+        :type changes: dict
+        """
+        self.client.shared_object_send(self, [{'type': rtmp_type.SO_REQUEST_CHANGE, 'data': changes}])
+
+    def apply(self, message):
+        """ Apply the events of a shared object message to the local copy.
+
+        :param message: A DT_SHARED_OBJECT or DT_AMF3_SHARED_OBJECT message.
+        :type message: dict
+        """
+        # (key, old value, new value) of the changes, the listeners are called once the message is applied.
+        changes = []
+        messages = []
+        with self._lock:
+            if message['curr_version'] < self.version:
+                log.debug('shared object %s version went from %s to %s' %
+                          (self.name, self.version, message['curr_version']))
+            self.version = message['curr_version']
+            for event in message['events']:
+                event_type = event['type']
+                if event_type == rtmp_type.SO_CHANGE:
+                    for key, value in event['data'].iteritems():
+                        changes.append((key, self.data.get(key), value))
+                        self.data[key] = value
+
+                elif event_type == rtmp_type.SO_REMOVE:
+                    if event['data'] in self.data:
+                        changes.append((event['data'], self.data.pop(event['data']), None))
+
+                elif event_type == rtmp_type.SO_CLEAR:
+                    # The server sends the whole shared object after clearing it.
+                    for key, value in self.data.iteritems():
+                        changes.append((key, value, None))
+                    self.data.clear()
+
+                elif event_type == rtmp_type.SO_USE_SUCCESS:
+                    self.is_used = True
+
+                elif event_type == rtmp_type.SO_SEND_MESSAGE:
+                    messages.append(event['data'])
+
+                elif event_type == rtmp_type.SO_STATUS:
+                    log.warning('shared object %s status: %s' % (self.name, event['data']))
+
+            calls = []
+            for key, old, new in changes:
+                for callback in self._listeners.get(key, []) + self._listeners.get(None, []):
+                    calls.append((callback, (key, old, new)))
+            for params in messages:
+                for callback in self._message_listeners:
+                    calls.append((callback, (params,)))
+
+        for callback, args in calls:
+            try:
+                callback(*args)
+            except Exception as e:
+                log.error('shared object %s listener error: %s' % (self.name, e), exc_info=True)
@@ -0,0 +1,105 @@
+"""
+Tracing of the RTMP hot path, and a flight recorder keeping the last headers and messages.
+
+Each connection has its own Recorder, given to its reader and writer. Without
+one the hot path only checks for None, so nothing is formatted or kept while
+tracing is off. The flight recorder keeps references in a ring buffer, they
+are only formatted when the ring is dumped to a file.
+"""
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+
+log = logging.getLogger(__name__)
+
+# The recorders dumped on a uncaught exception.
+_recorders = weakref.WeakSet()
+_excepthook = None
+# Recorders of several connections may share a dump file.
+_dump_lock = threading.Lock()
+
+
+class Recorder(object):
+    """ Traces the headers and messages of a connection. """
+    def __init__(self, size=0, log_packets=False, dump_path=None):
+        """ Create a instance of the Recorder class.
+
+        :param size: The amount of headers and messages the flight recorder keeps, 0 for no flight recorder.
+        :type size: int
+        :param log_packets: Log every header and message at debug level.
+        :type log_packets: bool
+        :param dump_path: The file the flight recorder is dumped to.
+        :type dump_path: str | None
+        """
+        self.log_packets = log_packets
+        self.dump_path = dump_path
+        self._ring = collections.deque(maxlen=size) if size > 0 else None
+        if self._ring is not None:
+            _install_excepthook()
+            _recorders.add(self)
+
+    def record(self, kind, obj):
+        """ Trace a header or message.
+
+        :param kind: What the object is, e.g 'header recv' or 'send'.
+        :type kind: str
+        :param obj: The header or message, it is kept as is.
+        """
+        if self._ring is not None:
+            self._ring.append((time.time(), kind, obj))
+        if self.log_packets:
+            log.debug('%s %r', kind, obj)
+
+    def dump(self, reason):
+        """ Write the flight recorder to the dump file, and empty it.
+
+        :param reason: Why the flight recorder is dumped, written above the entries.
+        :type reason: str
+        :return: True if dumped, False if there is no flight recorder, dump file or entries.
+        :rtype: bool
+        """
+        ring = self._ring
+        if ring is None or self.dump_path is None or not ring:
+            return False
+        entries = list(ring)
+        ring.clear()
+        with _dump_lock:
+            try:
+                directory = os.path.dirname(self.dump_path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                with open(self.dump_path, 'a') as f:
+                    f.write('=== %s flight recorder, %s entries: %s ===\n' %
+                            (time.strftime('%Y-%m-%d %H:%M:%S'), len(entries), reason))
+                    for ts, kind, obj in entries:
+                        f.write('%s.%03d %s %s\n' % (time.strftime('%H:%M:%S', time.localtime(ts)),
+                                                     ts * 1000 % 1000, kind, _format(obj)))
+            except (IOError, OSError) as e:
+                log.error('flight recorder dump failed: %s' % e)
+                return False
+        log.info('flight recorder dumped to %s: %s' % (self.dump_path, reason))
+        return True
+
+
+def _format(obj):
+    """ Format a entry, message bodies are shown as their length. """
+    if isinstance(obj, dict) and 'body' in obj:
+        obj = dict(obj, body='<%s bytes>' % len(obj['body']))
+    return repr(obj)
+
+
+def _install_excepthook():
+    global _excepthook
+    if _excepthook is None:
+        _excepthook = sys.excepthook
+        sys.excepthook = _dump_on_exception
+
+
+def _dump_on_exception(exc_type, exc_value, exc_tb):
+    for recorder in list(_recorders):
+        recorder.dump('uncaught %s: %s' % (exc_type.__name__, exc_value))
+    _excepthook(exc_type, exc_value, exc_tb)
@@ -14,9 +14,14 @@ class RtmpWriter:
     # default chunk size
     chunk_size = 128
 
-    def __init__(self, stream):
-        """ Initialize the RTMP writer and set it to write into the specified stream. """
+    def __init__(self, stream, recorder=None):
+        """ Initialize the RTMP writer and set it to write into the specified stream.
+
+        :param recorder: Traces the headers and messages written, None for no tracing.
+        :type recorder: rtmplib.trace.Recorder | None
+        """
         self.stream = stream
+        self.recorder = recorder
 
         self.stream_id = 0
 
@@ -25,8 +30,9 @@ class RtmpWriter:
         self.stream.flush()
 
     def write(self, message):
-        log.debug('send %r', message)
         """ Encode and write the specified message into the stream. """
+        if self.recorder is not None:
+            self.recorder.record('send', message)
         datatype = message['msg']
         body_stream = pyamf.util.BufferedByteStream()
         encoder = amf0.Encoder(body_stream)
@@ -40,6 +46,25 @@ class RtmpWriter:
             body_stream.write_ulong(message['window_ack_size'])
             self.send_msg(datatype, body_stream.getvalue())
 
+        elif datatype == rtmp_type.DT_ACKNOWLEDGEMENT:
+            body_stream.write_ulong(message['sequence_number'])
+            self.send_msg(datatype, body_stream.getvalue())
+
+        elif datatype == rtmp_type.DT_SET_CHUNK_SIZE:
+            body_stream.write_ulong(message['chunk_size'])
+            self.send_msg(datatype, body_stream.getvalue())
+            # The new size applies to the chunks after this message.
+            self.chunk_size = message['chunk_size']
+
+        elif datatype == rtmp_type.DT_AUDIO_MESSAGE:
+            # The body is written as is, it may be a buffer.
+            self.send_msg(datatype, message['body'], chunk_id=4, stream_id=self.stream_id,
+                          timestamp=message['timestamp'])
+
+        elif datatype == rtmp_type.DT_VIDEO_MESSAGE:
+            self.send_msg(datatype, message['body'], chunk_id=6, stream_id=self.stream_id,
+                          timestamp=message['timestamp'])
+
         elif datatype == rtmp_type.DT_SET_PEER_BANDWIDTH:
             body_stream.write_ulong(message['window_ack_size'])
             body_stream.write_uchar(message['limit_type'])
@@ -49,17 +74,19 @@ class RtmpWriter:
             for command in message['command']:
                 encoder.writeElement(command)
 
+            # Stream commands go on our stream, unless the message names another stream.
+            stream_id = message.get('stream_id', self.stream_id)
             if 'closeStream' in message['command']:
-                self.send_msg(datatype, body_stream.getvalue(), stream_id=self.stream_id)
+                self.send_msg(datatype, body_stream.getvalue(), stream_id=stream_id)
 
             elif 'deleteStream' in message['command']:
-                self.send_msg(datatype, body_stream.getvalue(), stream_id=self.stream_id)
+                self.send_msg(datatype, body_stream.getvalue(), stream_id=stream_id)
 
             elif 'publish' in message['command']:
-                self.send_msg(datatype, body_stream.getvalue(), stream_id=self.stream_id)
+                self.send_msg(datatype, body_stream.getvalue(), stream_id=stream_id)
 
             elif 'play' in message['command']:
-                self.send_msg(datatype, body_stream.getvalue(), chunk_id=8, stream_id=self.stream_id)
+                self.send_msg(datatype, body_stream.getvalue(), chunk_id=8, stream_id=stream_id)
 
             else:
                 self.send_msg(datatype, body_stream.getvalue())
@@ -90,7 +117,10 @@ class RtmpWriter:
         if event_type == rtmp_type.SO_USE:
             assert event['data'] == '', event['data']
 
-        elif event_type == rtmp_type.SO_CHANGE:
+        elif event_type == rtmp_type.SO_RELEASE:
+            assert event['data'] == '', event['data']
+
+        elif event_type == rtmp_type.SO_CHANGE or event_type == rtmp_type.SO_REQUEST_CHANGE:
             for attrib_name in event['data']:
                 attrib_value = event['data'][attrib_name]
                 encoder.serialiseString(attrib_name)
@@ -129,6 +159,9 @@ class RtmpWriter:
             data_type=data_type,
             body_length=len(body),
             timestamp=timestamp)
+        # The continuation chunks repeat this header, it is traced once.
+        if self.recorder is not None:
+            self.recorder.record('header send', _header)
         header.encode(self.stream, _header)
 
         for i in xrange(0, len(body), self.chunk_size):
@@ -0,0 +1,43 @@
+import random
+import unittest
+
+from util import backoff
+
+
+class BackoffTest(unittest.TestCase):
+    def setUp(self):
+        # Every delay is its upper bound.
+        self._uniform = random.uniform
+        random.uniform = lambda low, high: high
+
+    def tearDown(self):
+        random.uniform = self._uniform
+
+    def test_bounds(self):
+        delays = backoff.Backoff(base=10, cap=100, first_delay=1)
+        self.assertEqual([delays.next_delay() for _ in range(7)], [1, 10, 20, 40, 80, 100, 100])
+
+    def test_cap_after_many_attempts(self):
+        delays = backoff.Backoff(base=10, cap=100, first_delay=1)
+        for _ in range(1000):
+            delay = delays.next_delay()
+        self.assertEqual(delay, 100)
+
+    def test_reset(self):
+        delays = backoff.Backoff(base=10, cap=100, first_delay=1)
+        for _ in range(5):
+            delays.next_delay()
+        delays.reset()
+        self.assertEqual(delays.attempts, 0)
+        self.assertEqual(delays.next_delay(), 1)
+
+    def test_jitter_within_bound(self):
+        random.uniform = self._uniform
+        delays = backoff.Backoff(base=10, cap=100, first_delay=1)
+        self.assertTrue(0 <= delays.next_delay() <= 1)
+        for _ in range(20):
+            self.assertTrue(0 <= delays.next_delay() <= 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
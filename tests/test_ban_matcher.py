@@ -0,0 +1,49 @@
+import unittest
+
+from util.ban_matcher import BanMatcher
+
+
+class BanMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = BanMatcher(['bob', '*spam*', '*ham', 'alice'])
+
+    def test_match(self):
+        self.assertEqual(self.matcher.match('bob'), 'bob')
+        self.assertEqual(self.matcher.match('xxspamxx'), 'spam')
+        self.assertEqual(self.matcher.match('graham'), 'ham')
+        self.assertIsNone(self.matcher.match('bobby'))
+        self.assertEqual(self.matcher.match_words(['hi', 'alice']), 'alice')
+
+    def test_add_remove(self):
+        self.assertTrue(self.matcher.add('*egg'))
+        self.assertFalse(self.matcher.add('*egg'))
+        self.assertEqual(self.matcher.search('eggs'), 'egg')
+        self.assertTrue(self.matcher.remove('*spam*'))
+        self.assertFalse(self.matcher.remove('*spam*'))
+        self.assertIsNone(self.matcher.search('spam'))
+        self.assertEqual(self.matcher.search('ham'), 'ham')
+
+    def test_overlapping_patterns(self):
+        matcher = BanMatcher(['*she', '*hers'])
+        self.assertEqual(matcher.search('ushers'), 'she')
+        matcher.remove('*she')
+        self.assertEqual(matcher.search('ushers'), 'hers')
+
+    def test_update_swaps_state(self):
+        goto = self.matcher._goto
+        self.matcher.search('warm up the automaton')
+        self.matcher.update(['carol', '*egg'], ['bob', '*ham'])
+        self.assertEqual(self.matcher.items, ['*spam*', 'alice', 'carol', '*egg'])
+        self.assertEqual(len(goto), 8)
+        self.assertIsNone(self.matcher.match('bob'))
+        self.assertIsNone(self.matcher.search('graham'))
+        self.assertEqual(self.matcher.match('eggs'), 'egg')
+        self.assertEqual(self.matcher.match('carol'), 'carol')
+
+    def test_empty_pattern_matches_nothing(self):
+        matcher = BanMatcher(['*'])
+        self.assertIsNone(matcher.search('anything'))
+
+
+if __name__ == '__main__':
+    unittest.main()
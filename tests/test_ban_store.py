@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from util import ban_store
+from util.ban_matcher import BanMatcher
+
+
+class ReplayTest(unittest.TestCase):
+    def test_replay(self):
+        items = ban_store._replay(['a', 'b', 'c'], ['-a', '+d', '-d', '+d', '+a', '-b', '+c'])
+        self.assertEqual(items, ['a', 'c', 'd'])
+
+
+class BanStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + os.sep
+        self.first = self._store()
+        self.second = self._store()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _store(self):
+        store = ban_store.BanStore(self.path, 'bans.txt', BanMatcher())
+        store.load()
+        return store
+
+    def test_reload(self):
+        self.first.add('bob')
+        self.first.add('alice')
+        self.first.remove('bob')
+        self.assertTrue(self.second.reload())
+        self.assertEqual(self.second.matcher.items, ['alice'])
+        self.assertEqual(self._store().matcher.items, ['alice'])
+
+    def test_compact_keeps_lines_appended_by_others(self):
+        self.second.add('other')
+        self.first.add('mine')
+        self.first.compact()
+        self.assertEqual(sorted(self.first.matcher.items), ['mine', 'other'])
+        self.assertEqual(sorted(self._store().matcher.items), ['mine', 'other'])
+
+    def test_clear(self):
+        self.first.add('bob')
+        self.second.reload()
+        self.second.clear()
+        self.first.reload()
+        self.assertEqual(self.first.matcher.items, [])
+        self.assertEqual(self._store().matcher.items, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import threading
+import time
+import unittest
+
+from util import cache
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache.Cache('test', max_size=2, ttl=0.2, negative_ttl=0.05)
+        self.fetched = []
+
+    def _fetch(self, key):
+        self.fetched.append(key)
+        return None if key == 'missing' else key.upper()
+
+    def test_ttl_expiry(self):
+        self.assertEqual(self.cache.get_or_fetch('a', self._fetch, 'a'), 'A')
+        self.assertEqual(self.cache.get_or_fetch('a', self._fetch, 'a'), 'A')
+        self.assertEqual(self.fetched, ['a'])
+        time.sleep(0.25)
+        self.assertNotIn('a', self.cache)
+        self.assertEqual(self.cache.get_or_fetch('a', self._fetch, 'a'), 'A')
+        self.assertEqual(self.fetched, ['a', 'a'])
+
+    def test_negative_ttl(self):
+        self.cache.put('a', 'A')
+        self.assertIsNone(self.cache.get_or_fetch('missing', self._fetch, 'missing'))
+        self.assertIn('missing', self.cache)
+        time.sleep(0.1)
+        # The None entry expired, the other entry did not.
+        self.assertNotIn('missing', self.cache)
+        self.assertEqual(self.cache.get('a'), 'A')
+
+    def test_least_recently_used_dropped(self):
+        self.cache.put('a', 'A')
+        self.cache.put('b', 'B')
+        self.cache.get('a')
+        self.cache.put('c', 'C')
+        self.assertEqual(len(self.cache), 2)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(self.cache.get('a'), 'A')
+
+    def test_single_flight(self):
+        release = threading.Event()
+        results = []
+
+        def slow_fetch(key):
+            self.fetched.append(key)
+            release.wait(2)
+            return key.upper()
+
+        def caller():
+            results.append(self.cache.get_or_fetch('a', slow_fetch, 'a'))
+        threads = [threading.Thread(target=caller) for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join(2)
+        self.assertEqual(self.fetched, ['a'])
+        self.assertEqual(results, ['A'] * 5)
+
+    def test_fetch_error_not_cached(self):
+        def failing_fetch():
+            raise ValueError('lookup failed')
+        self.assertRaises(ValueError, self.cache.get_or_fetch, 'a', failing_fetch)
+        self.assertEqual(self.cache.get_or_fetch('a', self._fetch, 'a'), 'A')
+
+
+if __name__ == '__main__':
+    unittest.main()
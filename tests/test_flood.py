@@ -0,0 +1,47 @@
+import unittest
+
+from util import flood
+
+
+class FloodDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = flood.FloodDetector(max_msgs=3, window=5, max_duplicates=3, max_history=4, max_users=2)
+
+    def test_message_rate_is_a_flood(self):
+        for i in range(3):
+            self.assertIsNone(self.detector.check('bob', 'msg %s' % i, now=100 + i))
+        self.assertEqual(self.detector.check('bob', 'msg 3', now=103), flood.FLOOD)
+        # The history is reset after a detection.
+        self.assertIsNone(self.detector.check('bob', 'msg 4', now=103))
+
+    def test_time_ring_rolls_over(self):
+        # Every message replaces the oldest time, which is always outside the window.
+        for i in range(20):
+            self.assertIsNone(self.detector.check('bob', 'msg %s' % i, now=100 + i * 2))
+
+    def test_duplicates(self):
+        self.assertIsNone(self.detector.check('bob', 'hello', now=100))
+        self.assertIsNone(self.detector.check('bob', 'HELLO  ', now=110))
+        self.assertEqual(self.detector.check('bob', 'Hello', now=120), flood.DUPLICATE)
+
+    def test_hash_ring_rolls_over(self):
+        # Repeats further apart than the history are forgotten as they leave the ring.
+        for i in range(20):
+            msg = 'hello' if i % 4 == 0 else 'msg %s' % i
+            self.assertIsNone(self.detector.check('bob', msg, now=100 + i * 10))
+
+    def test_least_recently_active_user_dropped(self):
+        self.detector.check('bob', 'hello', now=100)
+        self.detector.check('alice', 'hello', now=101)
+        self.detector.check('bob', 'hello', now=102)
+        self.detector.check('eve', 'hello', now=103)
+        self.assertEqual(len(self.detector), 2)
+        # alice was dropped, so her history starts over.
+        self.assertIsNone(self.detector.check('alice', 'hello', now=104))
+        self.assertIsNone(self.detector.check('alice', 'hello', now=105))
+        # bob sent a third hello, but his history was dropped when alice came back.
+        self.assertIsNone(self.detector.check('bob', 'hello', now=106))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rtmplib import flv
+
+
+class FlvRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.path, 'test.flv')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    @staticmethod
+    def _close(writer):
+        writer.close()
+        # The queued tags are written by the writer thread.
+        writer._thread.join(5)
+
+    def test_round_trip(self):
+        tags = [(flv.TAG_SCRIPT, 0, 'metadata'),
+                (flv.TAG_VIDEO, 0, '\x17' + 'k' * 300),
+                (flv.TAG_AUDIO, 20, 'a' * 50),
+                # A timestamp using the extended byte.
+                (flv.TAG_VIDEO, 0x1234567, '\x27' + 'i' * 10)]
+        writer = flv.FlvWriter(self.file_path)
+        for tag_type, timestamp, data in tags:
+            writer.write(tag_type, timestamp, data)
+        self._close(writer)
+
+        with flv.FlvReader(self.file_path) as reader:
+            self.assertTrue(reader.has_audio)
+            self.assertTrue(reader.has_video)
+            read = [(tag.tag_type, tag.timestamp, str(tag.data)) for tag in reader]
+        self.assertEqual(read, tags)
+
+    def test_truncated_tag_is_skipped(self):
+        writer = flv.FlvWriter(self.file_path)
+        writer.write(flv.TAG_AUDIO, 0, 'a' * 10)
+        writer.write(flv.TAG_AUDIO, 20, 'b' * 10)
+        self._close(writer)
+        with open(self.file_path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.file_path) - 8)
+        with flv.FlvReader(self.file_path) as reader:
+            self.assertEqual([str(tag.data) for tag in reader], ['a' * 10])
+
+    def test_not_a_flv_file(self):
+        with open(self.file_path, 'wb') as f:
+            f.write('not a flv file')
+        self.assertRaises(flv.FlvError, flv.FlvReader, self.file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+import time
+import unittest
+
+from util import outbound
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = outbound.TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        delay = bucket.take()
+        self.assertTrue(0 < delay <= 0.1, delay)
+        time.sleep(delay)
+        self.assertEqual(bucket.take(), 0)
+
+
+class OutboundQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.done = threading.Event()
+        self.queue = outbound.OutboundQueue(self._send, rate=20, burst=1)
+
+    def _send(self, process_name, parameters):
+        self.sent.append(process_name)
+        if process_name == 'last':
+            self.done.set()
+
+    def test_priority_order(self):
+        # No tokens, so the messages wait in the queue.
+        self.queue.bucket._tokens = 0
+        self.queue.put(outbound.CHAT, 'last')
+        self.queue.put(outbound.SYSTEM, 'system')
+        self.queue.put(outbound.MODERATION, 'kick', ['bob'])
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual(self.sent, ['kick', 'system', 'last'])
+
+    def test_coalesce(self):
+        self.queue.bucket._tokens = 0
+        self.assertTrue(self.queue.put(outbound.CHAT, 'privmsg', ['hi']))
+        self.assertFalse(self.queue.put(outbound.CHAT, 'privmsg', ['hi']))
+        self.assertTrue(self.queue.put(outbound.MODERATION, 'forgive', ['1'], coalesce=False))
+        self.assertTrue(self.queue.put(outbound.MODERATION, 'forgive', ['1'], coalesce=False))
+        self.assertEqual(len(self.queue), 3)
+        self.queue.clear()
+
+    def test_full_queue_drops_chat(self):
+        self.queue.max_size = 1
+        self.queue.bucket._tokens = 0
+        self.assertTrue(self.queue.put(outbound.CHAT, 'privmsg', ['1']))
+        self.assertFalse(self.queue.put(outbound.CHAT, 'privmsg', ['2']))
+        self.assertTrue(self.queue.put(outbound.MODERATION, 'kick', ['bob']))
+        self.queue.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from page import privacy
+
+PAGE = '''
+<meta name="csrf-token" content="abc123">
+<form>
+<input type="checkbox" name="public_directory" value="1" checked>
+<input type='checkbox' name='push2talk' value='1'>
+<INPUT TYPE=checkbox NAME=greenroom VALUE=1 CHECKED>
+<input type="text" name="roomPassword" value="">
+<input type="text" name="roomPassword" value="second">
+</form>
+'''
+
+
+class ParsePageTest(unittest.TestCase):
+    def test_parse_page(self):
+        token, checked, values = privacy._parse_page(PAGE)
+        self.assertEqual(token, 'abc123')
+        self.assertEqual(checked, set(['public_directory', 'greenroom']))
+        # The first input of a name is used.
+        self.assertEqual(values, {'public_directory': '1', 'push2talk': '1', 'greenroom': '1', 'roomPassword': ''})
+
+    def test_empty_page(self):
+        self.assertEqual(privacy._parse_page(''), ('', set(), {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from util import raid
+
+
+class NickShapeTest(unittest.TestCase):
+    def test_shape(self):
+        self.assertEqual(raid.nick_shape('raider-12'), 'a-0')
+        self.assertEqual(raid.nick_shape('spammer-99'), 'a-0')
+        self.assertEqual(raid.nick_shape('bob'), 'a')
+
+
+class RaidDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = raid.RaidDetector(max_joins=10, window=10, max_similar=5, calm_time=30)
+
+    def test_guest_traffic_is_not_a_raid(self):
+        for i in range(10):
+            self.assertFalse(self.detector.join('guest-%s' % (123450 + i), now=100 + i * 0.5))
+        self.assertFalse(self.detector.is_raid(now=105))
+
+    def test_similar_nicks_are_a_raid(self):
+        for i in range(4):
+            self.assertFalse(self.detector.join('raider-%s' % i, now=100 + i))
+        self.assertTrue(self.detector.join('raider-4', now=104))
+        self.assertTrue(self.detector.is_raid(now=105))
+        # Raid mode is only started once.
+        self.assertFalse(self.detector.join('raider-5', now=105))
+
+    def test_join_rate_is_a_raid(self):
+        for i in range(10):
+            self.assertFalse(self.detector.join('guest-%s' % i, now=100 + i * 0.1))
+        self.assertTrue(self.detector.join('guest-99', now=101))
+
+    def test_old_joins_leave_the_window(self):
+        for i in range(4):
+            self.detector.join('raider-%s' % i, now=100 + i)
+        self.assertFalse(self.detector.join('raider-4', now=120))
+
+    def test_raid_mode_ends_after_calm_time(self):
+        for i in range(5):
+            self.detector.join('raider-%s' % i, now=100)
+        self.assertTrue(self.detector.is_raid(now=129))
+        self.assertFalse(self.detector.is_raid(now=131))
+
+
+if __name__ == '__main__':
+    unittest.main()
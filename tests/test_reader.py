@@ -0,0 +1,83 @@
+import struct
+import unittest
+
+import pyamf.util
+
+from rtmplib import reader, rtmp_type
+
+
+def chunk_header(fmt, channel_id, timestamp=0, body_length=0, data_type=0, stream_id=0):
+    """ Encode a chunk header for a channel id below 64. """
+    data = chr(fmt << 6 | channel_id)
+    if fmt < 3:
+        data += struct.pack('>I', timestamp)[1:]
+    if fmt < 2:
+        data += struct.pack('>I', body_length)[1:] + chr(data_type)
+    if fmt < 1:
+        data += struct.pack('<I', stream_id)
+    return data
+
+
+def read_all(data):
+    return list(reader.RtmpReader(pyamf.util.BufferedByteStream(data)))
+
+
+class ChunkReassemblyTest(unittest.TestCase):
+    def test_interleaved_chunk_streams(self):
+        video = 'v' * 200
+        audio = 'a' * 150
+        data = (chunk_header(0, 6, 1000, len(video), rtmp_type.DT_VIDEO_MESSAGE, 1) + video[:128] +
+                chunk_header(0, 4, 1010, len(audio), rtmp_type.DT_AUDIO_MESSAGE, 1) + audio[:128] +
+                chunk_header(3, 6) + video[128:] +
+                chunk_header(3, 4) + audio[128:])
+        messages = read_all(data)
+        self.assertEqual([(m['msg'], m['timestamp'], m['body']) for m in messages],
+                         [(rtmp_type.DT_VIDEO_MESSAGE, 1000, video), (rtmp_type.DT_AUDIO_MESSAGE, 1010, audio)])
+        self.assertEqual(messages[0]['stream_id'], 1)
+
+    def test_timestamp_deltas(self):
+        data = (chunk_header(0, 6, 1000, 10, rtmp_type.DT_VIDEO_MESSAGE, 1) + 'a' * 10 +
+                # Type 1, a new length and a delta.
+                chunk_header(1, 6, 40, 5, rtmp_type.DT_VIDEO_MESSAGE) + 'b' * 5 +
+                # Type 2, only a delta.
+                chunk_header(2, 6, 30) + 'c' * 5 +
+                # Type 3 starting a message, the previous delta is used again.
+                chunk_header(3, 6) + 'd' * 5)
+        messages = read_all(data)
+        self.assertEqual([(m['timestamp'], m['body']) for m in messages],
+                         [(1000, 'a' * 10), (1040, 'b' * 5), (1070, 'c' * 5), (1100, 'd' * 5)])
+        self.assertEqual(set(m['stream_id'] for m in messages), set([1]))
+
+    def test_abort(self):
+        data = (chunk_header(0, 6, 0, 200, rtmp_type.DT_VIDEO_MESSAGE, 1) + 'x' * 128 +
+                chunk_header(0, 2, 0, 4, rtmp_type.DT_ABORT) + struct.pack('>I', 6) +
+                chunk_header(0, 6, 50, 3, rtmp_type.DT_VIDEO_MESSAGE, 1) + 'new')
+        messages = read_all(data)
+        self.assertEqual([m['body'] for m in messages], ['new'])
+
+
+class AggregateMessagesTest(unittest.TestCase):
+    @staticmethod
+    def _sub_message(data_type, timestamp, body):
+        size = struct.pack('>I', len(body))[1:]
+        ts = struct.pack('>I', timestamp)
+        return (chr(data_type) + size + ts[1:] + ts[0] + '\x00\x00\x01' + body +
+                struct.pack('>I', 11 + len(body)))
+
+    def test_split(self):
+        body = (self._sub_message(rtmp_type.DT_AUDIO_MESSAGE, 500, 'audio') +
+                self._sub_message(rtmp_type.DT_VIDEO_MESSAGE, 540, 'video'))
+        messages = read_all(chunk_header(0, 5, 2000, len(body), rtmp_type.DT_AGGREGATE_MESSAGE, 1) + body)
+        self.assertEqual(len(messages), 1)
+        # The timestamps are relative to the aggregate message.
+        self.assertEqual([(m['msg'], m['timestamp'], str(m['body'])) for m in messages[0]['messages']],
+                         [(rtmp_type.DT_AUDIO_MESSAGE, 2000, 'audio'), (rtmp_type.DT_VIDEO_MESSAGE, 2040, 'video')])
+
+    def test_truncated(self):
+        body = self._sub_message(rtmp_type.DT_AUDIO_MESSAGE, 0, 'audio')
+        messages = reader.AggregateMessages(body + body[:-6], 1, 0)
+        self.assertEqual([str(m['body']) for m in messages], ['audio'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import StringIO
+import unittest
+
+from rtmplib import rtmp, rtmp_type
+
+
+class FakeReader(object):
+    """ Reads a given amount of bytes from the stream per message. """
+    def __init__(self, stream, messages):
+        self.stream = stream
+        self.messages = list(messages)
+
+    def next(self):
+        size, message = self.messages.pop(0)
+        self.stream.read(size)
+        return message
+
+
+class FakeWriter(object):
+    def __init__(self):
+        self.messages = []
+
+    def write(self, message):
+        self.messages.append(message)
+
+    def flush(self):
+        pass
+
+
+def audio():
+    return {'msg': rtmp_type.DT_AUDIO_MESSAGE, 'stream_id': 1}
+
+
+class AcknowledgementTest(unittest.TestCase):
+    def setUp(self):
+        self.client = rtmp.RtmpClient('127.0.0.1', 1935, 'rtmp://127.0.0.1/app', 'app')
+        self.client.stream = rtmp.FileDataTypeMixIn(StringIO.StringIO('\x00' * 10000))
+        self.client.writer = FakeWriter()
+
+    def _read(self, *messages):
+        self.client.reader = FakeReader(self.client.stream, messages)
+        for _ in messages:
+            self.client.amf()
+
+    def _acks(self):
+        return [message['sequence_number'] for message in self.client.writer.messages
+                if message['msg'] == rtmp_type.DT_ACKNOWLEDGEMENT]
+
+    def test_no_acknowledgement_without_window(self):
+        self._read((3000, audio()), (3000, audio()))
+        self.assertEqual(self._acks(), [])
+
+    def test_acknowledge_each_window(self):
+        window = {'msg': rtmp_type.DT_WINDOW_ACK_SIZE, 'window_ack_size': 1000}
+        self._read((100, window), (500, audio()), (500, audio()), (900, audio()), (200, audio()), (300, audio()))
+        self.assertEqual(self._acks(), [1100, 2200])
+        # The window is sent back to the server.
+        self.assertEqual(self.client.writer.messages[0], window)
+
+    def test_sequence_number_wraps(self):
+        self.client.window_ack_size = 1000
+        self.client.stream.bytes_read = 0xFFFFFFFF
+        self._read((1000, audio()))
+        self.assertEqual(self._acks(), [(0xFFFFFFFF + 1000) & 0xFFFFFFFF])
+
+    def test_peer_acknowledgement(self):
+        self._read((16, {'msg': rtmp_type.DT_ACKNOWLEDGEMENT, 'sequence_number': 4096}))
+        self.assertEqual(self.client.peer_acked_bytes, 4096)
+
+    def test_peer_bandwidth_window_sent_once(self):
+        bandwidth = {'msg': rtmp_type.DT_SET_PEER_BANDWIDTH, 'window_ack_size': 2500000, 'limit_type': 2}
+        self._read((16, bandwidth), (16, bandwidth))
+        self.assertEqual([message['window_ack_size'] for message in self.client.writer.messages], [2500000])
+
+
+if __name__ == '__main__':
+    unittest.main()
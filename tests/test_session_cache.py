@@ -0,0 +1,97 @@
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+from util import session_cache
+
+# Few iterations, the tests are about the construction not the key stretching.
+ITERATIONS = 10
+
+
+class CryptoTest(unittest.TestCase):
+    def test_round_trip(self):
+        data = session_cache.encrypt('secret', 'some plaintext', ITERATIONS)
+        self.assertNotIn('some plaintext', data)
+        self.assertEqual(session_cache.decrypt('secret', data, ITERATIONS), 'some plaintext')
+
+    def test_nonce_changes_per_encrypt(self):
+        salt = os.urandom(session_cache.SALT_SIZE)
+        first = session_cache.encrypt('secret', 'plaintext', ITERATIONS, salt)
+        second = session_cache.encrypt('secret', 'plaintext', ITERATIONS, salt)
+        self.assertNotEqual(first, second)
+
+    def test_tampered_data_rejected(self):
+        data = session_cache.encrypt('secret', 'some plaintext', ITERATIONS)
+        header_size = len(session_cache.MAGIC) + session_cache.SALT_SIZE + session_cache.NONCE_SIZE
+        for index in (header_size, len(data) - 1):
+            tampered = data[:index] + chr(ord(data[index]) ^ 1) + data[index + 1:]
+            self.assertRaises(session_cache.SessionCacheError,
+                              session_cache.decrypt, 'secret', tampered, ITERATIONS)
+
+    def test_wrong_secret_rejected(self):
+        data = session_cache.encrypt('secret', 'some plaintext', ITERATIONS)
+        self.assertRaises(session_cache.SessionCacheError, session_cache.decrypt, 'other', data, ITERATIONS)
+
+    def test_not_a_cache_file(self):
+        self.assertRaises(session_cache.SessionCacheError, session_cache.decrypt, 'secret', 'TCS1', ITERATIONS)
+
+
+class SessionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + os.sep
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _cache(self, secret='secret'):
+        return session_cache.SessionCache(self.path, 'session.cache', secret, ITERATIONS)
+
+    def test_put_get(self):
+        self._cache().put('key', {'a': 1}, 60)
+        self.assertEqual(self._cache().get('key'), {'a': 1})
+        self.assertEqual(stat.S_IMODE(os.stat(self.path + 'session.cache').st_mode), session_cache.FILE_MODE)
+
+    def test_expiry(self):
+        cache = self._cache()
+        cache.put('short', 'value', 0.05)
+        cache.put('long', 'value', 60)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('short'))
+        self.assertIsNone(self._cache().get('short'))
+        self.assertEqual(self._cache().get('long'), 'value')
+
+    def test_delete(self):
+        cache = self._cache()
+        cache.put('key', 'value', 60)
+        self.assertTrue(cache.delete('key'))
+        self.assertFalse(cache.delete('key'))
+        self.assertIsNone(self._cache().get('key'))
+
+    def test_wrong_secret_is_empty(self):
+        self._cache().put('key', 'value', 60)
+        self.assertIsNone(self._cache('other').get('key'))
+
+    def test_instances_merge(self):
+        first = self._cache()
+        second = self._cache()
+        first.get('key')
+        second.get('key')
+        first.put('first', 1, 60)
+        second.put('second', 2, 60)
+        second.delete('first')
+        first.put('third', 3, 60)
+        cache = self._cache()
+        self.assertIsNone(cache.get('first'))
+        self.assertEqual((cache.get('second'), cache.get('third')), (2, 3))
+
+    def test_key_file(self):
+        secret = session_cache.load_or_create_secret(self.path, 'session.key')
+        self.assertEqual(session_cache.load_or_create_secret(self.path, 'session.key'), secret)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path + 'session.key').st_mode), session_cache.FILE_MODE)
+
+
+if __name__ == '__main__':
+    unittest.main()
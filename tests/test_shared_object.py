@@ -0,0 +1,51 @@
+import unittest
+
+from rtmplib import rtmp_type
+from rtmplib.shared_object import SharedObject
+
+
+def message(version, *events):
+    return {'curr_version': version, 'events': [{'type': event_type, 'data': data} for event_type, data in events]}
+
+
+class SharedObjectApplyTest(unittest.TestCase):
+    def setUp(self):
+        self.so = SharedObject('room')
+        self.changes = []
+        self.so.add_listener(lambda *change: self.changes.append(change))
+
+    def test_change_and_remove(self):
+        self.so.apply(message(1, (rtmp_type.SO_USE_SUCCESS, ''), (rtmp_type.SO_CHANGE, {'a': 1, 'b': 2})))
+        self.assertTrue(self.so.is_used)
+        self.so.apply(message(2, (rtmp_type.SO_CHANGE, {'a': 3}), (rtmp_type.SO_REMOVE, 'b'),
+                              (rtmp_type.SO_REMOVE, 'missing')))
+        self.assertEqual(self.so.data, {'a': 3})
+        self.assertEqual(self.so.version, 2)
+        self.assertEqual(sorted(self.changes[:2]), [('a', None, 1), ('b', None, 2)])
+        self.assertEqual(self.changes[2:], [('a', 1, 3), ('b', 2, None)])
+
+    def test_clear(self):
+        self.so.apply(message(1, (rtmp_type.SO_CHANGE, {'a': 1})))
+        self.so.apply(message(2, (rtmp_type.SO_CLEAR, ''), (rtmp_type.SO_CHANGE, {'b': 2})))
+        self.assertEqual(self.so.data, {'b': 2})
+        self.assertEqual(self.changes[1:], [('a', 1, None), ('b', None, 2)])
+
+    def test_key_listeners_and_messages(self):
+        calls = []
+        messages = []
+        self.so.add_listener(lambda key, old, new: calls.append(new), key='a')
+        self.so.add_message_listener(messages.append)
+        self.so.apply(message(1, (rtmp_type.SO_CHANGE, {'a': 1, 'b': 2}), (rtmp_type.SO_SEND_MESSAGE, ['hi'])))
+        self.assertEqual(calls, [1])
+        self.assertEqual(messages, [['hi']])
+
+    def test_listener_error_does_not_stop_others(self):
+        def fail(key, old, new):
+            raise ValueError(key)
+        self.so.add_listener(fail, key='a')
+        self.so.apply(message(1, (rtmp_type.SO_CHANGE, {'a': 1})))
+        self.assertEqual(self.changes, [('a', None, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
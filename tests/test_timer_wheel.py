@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+
+from util import timer_wheel
+
+
+class TimerWheelTest(unittest.TestCase):
+    def setUp(self):
+        # A small wheel, so timers move down through every level.
+        self.wheel = timer_wheel.TimerWheel(tick=0.01, bits=2, levels=3)
+        self.ran = []
+        self.done = threading.Event()
+
+    def _run(self, name, last=False):
+        self.ran.append(name)
+        if last:
+            self.done.set()
+
+    def test_timers_run_in_order(self):
+        self.wheel.schedule(0.3, self._run, ('third', True), inline=True)
+        self.wheel.schedule(0.02, self._run, ('first',), inline=True)
+        self.wheel.schedule(0.15, self._run, ('second',), inline=True)
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual(self.ran, ['first', 'second', 'third'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_timer_does_not_run_early(self):
+        start = time.time()
+        self.wheel.schedule(0.2, self._run, ('timer', True), inline=True)
+        self.assertTrue(self.done.wait(2))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    def test_cancel(self):
+        timer = self.wheel.schedule(0.05, self._run, ('cancelled',), inline=True)
+        self.wheel.schedule(0.1, self._run, ('kept', True), inline=True)
+        self.assertTrue(timer.cancel())
+        self.assertFalse(timer.cancel())
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual(self.ran, ['kept'])
+
+    def test_cancel_owner(self):
+        owner = object()
+        self.wheel.schedule(0.05, self._run, ('a',), owner=owner, inline=True)
+        self.wheel.schedule(5, self._run, ('b',), owner=owner, inline=True)
+        self.wheel.schedule(0.1, self._run, ('other', True), inline=True)
+        self.assertEqual(len(self.wheel.pending(owner)), 2)
+        self.assertEqual(self.wheel.cancel_owner(owner), 2)
+        self.assertTrue(self.done.wait(2))
+        self.assertEqual(self.ran, ['other'])
+        self.assertEqual(self.wheel.pending(owner), [])
+
+    def test_periodic(self):
+        def tick():
+            self.ran.append('tick')
+            if len(self.ran) == 3:
+                timer.cancel()
+                self.done.set()
+        timer = self.wheel.schedule_periodic(0.03, tick, inline=True)
+        self.assertTrue(self.done.wait(2))
+        time.sleep(0.1)
+        self.assertEqual(len(self.ran), 3)
+
+    def test_cancel_while_due(self):
+        # Both timers are due on the same tick, the first to run cancels the other.
+        def run(name):
+            self.ran.append(name)
+            timers[name == 'a'].cancel()
+        timers = [self.wheel.schedule(0.05, run, (name,), inline=True) for name in ('a', 'b')]
+        time.sleep(0.3)
+        self.assertEqual(len(self.ran), 1)
+
+    def test_pending_soonest_first(self):
+        late = self.wheel.schedule(60, self._run, ('late',), name='late')
+        soon = self.wheel.schedule(30, self._run, ('soon',), name='soon')
+        self.assertEqual(self.wheel.pending(), [soon, late])
+        self.wheel.cancel_owner(None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from user import Users
+
+
+class UsersSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.users = Users()
+        self.bob = self.users.add({'nick': 'bob', 'id': 1})
+        self.bob.user_level = 2
+        self.users.add({'nick': 'guest-1', 'id': 2})
+
+    def test_snapshot_keeps_state(self):
+        self.users.begin_snapshot()
+        self.assertIs(self.users.add({'nick': 'bob', 'id': 1, 'mod': True}), self.bob)
+        removed = self.users.end_snapshot()
+        self.assertEqual([_user.nick for _user in removed], ['guest-1'])
+        self.assertEqual(self.bob.user_level, 2)
+        self.assertTrue(self.bob.is_mod)
+
+    def test_reused_nick_is_replaced(self):
+        self.users.begin_snapshot()
+        _user = self.users.add({'nick': 'bob', 'id': 3})
+        self.users.end_snapshot()
+        self.assertIsNot(_user, self.bob)
+        self.assertEqual(_user.user_level, 5)
+
+    def test_nick_change_during_snapshot(self):
+        self.users.begin_snapshot()
+        self.users.add({'nick': 'bob', 'id': 1})
+        self.assertTrue(self.users.change('bob', 'robert', self.bob))
+        self.users.end_snapshot()
+        self.assertIs(self.users.search('robert'), self.bob)
+
+    def test_cancel_snapshot(self):
+        self.users.begin_snapshot()
+        self.users.cancel_snapshot()
+        self.assertEqual(self.users.end_snapshot(), [])
+        self.assertEqual(len(self.users.all), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
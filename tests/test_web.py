@@ -0,0 +1,80 @@
+import time
+import unittest
+
+import requests
+
+from util import web
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = 'content'
+        self.cookies = {}
+        self.headers = {}
+
+    def json(self):
+        return {}
+
+
+class FakeSession(object):
+    """ Answers requests from a list of status codes and exceptions. """
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.methods = []
+        self.cookies = {}
+
+    def request(self, method, url, **kwargs):
+        self.methods.append(method)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(answer)
+
+
+class HttpClientTest(unittest.TestCase):
+    def setUp(self):
+        self.client = web.HttpClient('test', max_retries=2, backoff=0.5)
+        self.sleeps = []
+        self._sleep = time.sleep
+        time.sleep = self.sleeps.append
+
+    def tearDown(self):
+        time.sleep = self._sleep
+
+    def _answer(self, *answers):
+        self.client.session = FakeSession(answers)
+        return self.client.session
+
+    def test_get_retried_with_backoff(self):
+        session = self._answer(requests.ConnectionError('refused'), 503, 200)
+        self.assertEqual(self.client.get('http://example.com/')['status_code'], 200)
+        self.assertEqual(session.methods, ['GET'] * 3)
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+
+    def test_get_gives_up_after_max_retries(self):
+        session = self._answer(503, 502, 504)
+        self.assertEqual(self.client.get('http://example.com/')['status_code'], 504)
+        self.assertEqual(len(session.methods), 3)
+
+        session = self._answer(*[requests.Timeout('timed out')] * 3)
+        self.assertIsNone(self.client.get('http://example.com/')['status_code'])
+        self.assertEqual(len(session.methods), 3)
+
+    def test_get_not_retried_on_success_or_client_error(self):
+        session = self._answer(404)
+        self.assertEqual(self.client.get('http://example.com/')['status_code'], 404)
+        self.assertEqual(len(session.methods), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_post_not_retried(self):
+        self._answer(503)
+        self.assertEqual(self.client.post('http://example.com/', {'a': 1})['status_code'], 503)
+        session = self._answer(requests.ConnectionError('refused'))
+        self.assertIsNone(self.client.post('http://example.com/', {'a': 1})['status_code'])
+        self.assertEqual(session.methods, ['POST'])
+        self.assertEqual(self.sleeps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,15 +5,43 @@ import threading
 import pinylib
 from apis import other, locals_
 from page import privacy
+from util import ban_matcher, ban_store, config_overlay, file_watcher, flood, raid
 
 __version__ = '1.0.2'
 log = logging.getLogger(__name__)
 
+# The config keys the flood detector is created with, it is created again when the config overlay changes them.
+FLOOD_SIZE_KEYS = frozenset(['B_FLOOD_MAX_MSGS', 'B_FLOOD_WINDOW', 'B_FLOOD_MAX_DUPLICATES', 'B_FLOOD_HISTORY',
+                             'B_FLOOD_MAX_USERS'])
+
 
 class TinychatBot(pinylib.TinychatRTMPClient):
     privacy_settings = None
     is_broadcasting = False
 
+    def __init__(self, *args, **kwargs):
+        super(TinychatBot, self).__init__(*args, **kwargs)
+        # Ban matchers shared by the join/nick/message checks and the list commands.
+        self.nick_bans = ban_matcher.BanMatcher()
+        self.account_bans = ban_matcher.BanMatcher()
+        self.string_bans = ban_matcher.BanMatcher()
+        self.nick_ban_store = ban_store.BanStore(self.config_path(), pinylib.CONFIG.B_NICK_BANS_FILE_NAME,
+                                                 self.nick_bans, pinylib.CONFIG.B_BAN_COMPACT_OPS)
+        self.account_ban_store = ban_store.BanStore(self.config_path(), pinylib.CONFIG.B_ACCOUNT_BANS_FILE_NAME,
+                                                    self.account_bans, pinylib.CONFIG.B_BAN_COMPACT_OPS)
+        self.string_ban_store = ban_store.BanStore(self.config_path(), pinylib.CONFIG.B_STRING_BANS_FILE_NAME,
+                                                   self.string_bans, pinylib.CONFIG.B_BAN_COMPACT_OPS)
+        self.config_overlay = config_overlay.ConfigOverlay(pinylib.CONFIG)
+        self.file_watcher = file_watcher.FileWatcher(pinylib.CONFIG.B_WATCH_INTERVAL)
+        # The files are watched once, the watcher is started again after a reconnect.
+        self._files_watched = False
+        self.flood_detector = self.new_flood_detector()
+        self.raid_detector = raid.RaidDetector(max_joins=pinylib.CONFIG.B_RAID_MAX_JOINS,
+                                               window=pinylib.CONFIG.B_RAID_WINDOW,
+                                               max_similar=pinylib.CONFIG.B_RAID_MAX_SIMILAR,
+                                               calm_time=pinylib.CONFIG.B_RAID_CALM_TIME)
+        self.raid_queue = raid.ActionQueue(rate=pinylib.CONFIG.B_RAID_ACTION_RATE)
+
     def on_join(self, join_info):
         """ Application message received when a user joins the room.
         :param join_info: Information about the user joining.
@@ -22,10 +50,12 @@ class TinychatBot(pinylib.TinychatRTMPClient):
         log.info('user join info: %s' % join_info)
         _user = self.users.add(join_info)
         if _user is not None:
+            if self.check_raid(_user):
+                return
             if _user.account:
                 tc_info = pinylib.apis.tinychat.user_info(_user.account)
                 if tc_info is not None:
-                    _user.tinychat_id = tc_info
+                    _user.tinychat_id = tc_info['tinychat_id']
                     _user.last_login = tc_info['last_active']
                 if _user.is_owner:
                     _user.user_level = 1
@@ -39,7 +69,7 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                     self.console_write(pinylib.COLOR['bright_yellow'], '%s:%d has account: %s' %
                                        (_user.nick, _user.id, _user.account))
 
-                    if _user.account in pinylib.CONFIG.B_ACCOUNT_BANS:
+                    if self.account_bans.is_exact(_user.account):
                         if self.is_client_mod:
                             self.send_ban_msg(_user.nick, _user.id)
                             if pinylib.CONFIG.B_FORGIVE_AUTO_BANS:
@@ -66,6 +96,8 @@ class TinychatBot(pinylib.TinychatRTMPClient):
         if self.is_client_mod:
             self.send_banlist_msg()
             self.load_list(nicks=True, accounts=True, strings=True)
+            # The ban lists are only enforced when the bot is a mod.
+            self.start_file_watcher()
         if self.is_client_owner and self.param.roomtype != 'default':
             threading.Thread(target=self.get_privacy_settings).start()
 
@@ -152,6 +184,10 @@ class TinychatBot(pinylib.TinychatRTMPClient):
         :param decoded_msg: The decoded msg(text).
         :type decoded_msg: str
         """
+        if self.check_flood(decoded_msg):
+            self.active_user.last_msg = decoded_msg
+            return
+
         prefix = pinylib.CONFIG.B_PREFIX
         if decoded_msg.startswith(prefix):
             parts = decoded_msg.split(' ')
@@ -178,32 +214,32 @@ class TinychatBot(pinylib.TinychatRTMPClient):
 
                 # Tinychat API commands.
                 elif cmd == prefix + 'spy':
-                    threading.Thread(target=self.do_spy, args=(cmd_arg,)).start()
+                    self.do_spy(cmd_arg)
 
                 elif cmd == prefix + 'spyuser':
-                    threading.Thread(target=self.do_account_spy, args=(cmd_arg,)).start()
+                    self.do_account_spy(cmd_arg)
 
                 elif cmd == prefix + 'room':
-                    threading.Thread(target=self.do_room_info, args=(cmd_arg,)).start()
+                    self.do_room_info(cmd_arg)
 
                 # Other API commands.
                 elif cmd == prefix + 'urban':
-                    threading.Thread(target=self.do_search_urban_dictionary, args=(cmd_arg,)).start()
+                    self.do_search_urban_dictionary(cmd_arg)
 
                 elif cmd == prefix + 'ip':
-                    threading.Thread(target=self.do_whois_ip, args=(cmd_arg,)).start()
+                    self.do_whois_ip(cmd_arg)
 
                 elif cmd == prefix + 'time':
-                    threading.Thread(target=self.do_time, args=(cmd_arg,)).start()
+                    self.do_time(cmd_arg)
 
                 elif cmd == prefix + 'translate':
-                    threading.Thread(target=self.do_translate, args=(cmd_arg,)).start()
+                    self.do_translate(cmd_arg)
 
                 elif cmd == prefix + 'advice':
-                    threading.Thread(target=self.do_advice).start()
+                    self.do_advice()
 
                 elif cmd == prefix + 'chuck':
-                    threading.Thread(target=self.do_chuck_norris).start()
+                    self.do_chuck_norris()
 
                 elif cmd == prefix + '8ball':
                     self.do_8ball(cmd_arg)
@@ -291,6 +327,8 @@ class TinychatBot(pinylib.TinychatRTMPClient):
 
     def do_kill(self):
         """ Kills the bot. """
+        self.file_watcher.stop()
+        self.raid_queue.clear()
         self.disconnect()
         if self.is_green_connected:
             self.disconnect(greenroom=True)
@@ -344,9 +382,15 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             self.connection.createstream()
             self.is_broadcasting = True
 
+    def on_publish_start(self):
+        """ Play the cam playlist, if there is one, once the bot's stream is published. """
+        if pinylib.CONFIG.B_CAM_PLAYLIST:
+            self.start_publishing(pinylib.CONFIG.B_CAM_PLAYLIST, loop=pinylib.CONFIG.B_CAM_PLAYLIST_LOOP)
+
     def do_cam_down(self):
         """ Makes the bot cam down. """
         if self.is_broadcasting:
+            self.stop_publishing()
             self.connection.closestream()
             self.is_broadcasting = False
 
@@ -415,10 +459,10 @@ class TinychatBot(pinylib.TinychatRTMPClient):
         """ Clears the chat box. """
         if self.is_client_mod:
             for x in range(0, 10):
-                self.send_owner_run_msg(' ')
+                self.send_owner_run_msg(' ', coalesce=False)
         else:
             clear = '133,133,133,133,133,133,133,133,133,133,133,133,133,133,133'
-            self.connection.call('privmsg', [clear, u'#262626,en'])
+            self.queue_call(pinylib.outbound.CHAT, 'privmsg', [clear, u'#262626,en'])
 
     def do_nick(self, new_nick):
         """ Set a new nick for the bot.
@@ -469,9 +513,8 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                                 if i <= pinylib.CONFIG.B_MAX_MATCH_BANS - 1:
                                     self.send_ban_msg(user.nick, user.id)
                                     a = pinylib.string_util.random.uniform(0.0, 1.0)
-                                    pinylib.time.sleep(a)
-                                    self.send_forgive_msg(user.id)
-                                    pinylib.time.sleep(0.5)
+                                    pinylib.timer_wheel.schedule(a, self.send_forgive_msg, (user.id,), owner=self,
+                                                                 name='forgive %s' % user.nick, inline=True)
                 else:
                     _user = self.users.search(user_name)
                     if _user is None:
@@ -501,9 +544,8 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                         for i, user in enumerate(_users):
                             if user.nick != self.nickname and user.user_level > self.active_user.user_level:
                                 if i <= pinylib.CONFIG.B_MAX_MATCH_BANS - 1:
+                                    # The outbound queue paces the bans.
                                     self.send_ban_msg(user.nick, user.id)
-                                    a = pinylib.string_util.random.uniform(0.0, 1.5)
-                                    pinylib.time.sleep(a)
                 else:
                     _user = self.users.search(user_name)
                     if _user is None:
@@ -522,13 +564,11 @@ class TinychatBot(pinylib.TinychatRTMPClient):
         if self.is_client_mod:
             if len(bad_nick) is 0:
                 self.send_bot_msg('Missing username.')
-            elif bad_nick in pinylib.CONFIG.B_NICK_BANS:
+            elif bad_nick in self.nick_bans:
                 self.send_private_msg('*%s* is already in list.' % bad_nick, self.active_user.nick)
             else:
-                pinylib.file_handler.file_writer(self.config_path(),
-                                                 pinylib.CONFIG.B_NICK_BANS_FILE_NAME, bad_nick)
+                self.nick_ban_store.add(bad_nick)
                 self.send_private_msg('*%s* was added to file.' % bad_nick, self.active_user.nick)
-                self.load_list(nicks=True)
 
     def do_remove_bad_nick(self, bad_nick):
         """ Removes nick from the nick bans file.
@@ -540,12 +580,10 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if len(bad_nick) is 0:
                 self.send_private_msg('Missing username', self.active_user.nick)
             else:
-                if bad_nick in pinylib.CONFIG.B_NICK_BANS:
-                    rem = pinylib.file_handler.remove_from_file(self.config_path(),
-                                                                pinylib.CONFIG.B_NICK_BANS_FILE_NAME, bad_nick)
+                if bad_nick in self.nick_bans:
+                    rem = self.nick_ban_store.remove(bad_nick)
                     if rem:
                         self.send_private_msg('*%s* was removed.' % bad_nick, self.active_user.nick)
-                        self.load_list(nicks=True)
 
     def do_bad_string(self, bad_string):
         """ Adds a string to the string bans file.
@@ -558,13 +596,11 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                 self.send_private_msg('Ban string can\'t be blank.', self.active_user.nick)
             elif len(bad_string) < 3:
                 self.send_private_msg('Ban string to short: ' + str(len(bad_string)), self.active_user.nick)
-            elif bad_string in pinylib.CONFIG.B_STRING_BANS:
+            elif bad_string in self.string_bans:
                 self.send_private_msg('*%s* is already in list.' % bad_string, self.active_user.nick)
             else:
-                pinylib.file_handler.file_writer(self.config_path(),
-                                                 pinylib.CONFIG.B_STRING_BANS_FILE_NAME, bad_string)
+                self.string_ban_store.add(bad_string)
                 self.send_private_msg('*%s* was added to file.' % bad_string, self.active_user.nick)
-                self.load_list(strings=True)
 
     def do_remove_bad_string(self, bad_string):
         """ Removes a string from the string bans file.
@@ -576,12 +612,10 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if len(bad_string) is 0:
                 self.send_private_msg('Missing word string.', self.active_user.nick)
             else:
-                if bad_string in pinylib.CONFIG.B_STRING_BANS:
-                    rem = pinylib.file_handler.remove_from_file(self.config_path(),
-                                                                pinylib.CONFIG.B_STRING_BANS_FILE_NAME, bad_string)
+                if bad_string in self.string_bans:
+                    rem = self.string_ban_store.remove(bad_string)
                     if rem:
                         self.send_private_msg('*%s* was removed.' % bad_string, self.active_user.nick)
-                        self.load_list(strings=True)
 
     def do_bad_account(self, bad_account_name):
         """ Adds an account name to the account bans file.
@@ -594,13 +628,11 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                 self.send_private_msg('Account can\'t be blank.', self.active_user.nick)
             elif len(bad_account_name) < 3:
                 self.send_private_msg('Account to short: ' + str(len(bad_account_name)), self.active_user.nick)
-            elif bad_account_name in pinylib.CONFIG.B_ACCOUNT_BANS:
+            elif bad_account_name in self.account_bans:
                 self.send_private_msg('%s is already in list.' % bad_account_name, self.active_user.nick)
             else:
-                pinylib.file_handler.file_writer(self.config_path(),
-                                                 pinylib.CONFIG.B_ACCOUNT_BANS_FILE_NAME, bad_account_name)
+                self.account_ban_store.add(bad_account_name)
                 self.send_private_msg('*%s* was added to file.' % bad_account_name, self.active_user.nick)
-                self.load_list(accounts=True)
 
     def do_remove_bad_account(self, bad_account):
         """ Removes an account from the account bans file.
@@ -612,12 +644,10 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if len(bad_account) is 0:
                 self.send_private_msg('Missing account.', self.active_user.nick)
             else:
-                if bad_account in pinylib.CONFIG.B_ACCOUNT_BANS:
-                    rem = pinylib.file_handler.remove_from_file(self.config_path(),
-                                                                pinylib.CONFIG.B_ACCOUNT_BANS_FILE_NAME, bad_account)
+                if bad_account in self.account_bans:
+                    rem = self.account_ban_store.remove(bad_account)
                     if rem:
                         self.send_private_msg('*%s* was removed.' % bad_account, self.active_user.nick)
-                        self.load_list(accounts=True)
 
     def do_list_info(self, list_type):
         """ Shows info of different lists/files.
@@ -630,24 +660,24 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                 self.send_private_msg('Missing list type.', self.active_user.nick)
             else:
                 if list_type.lower() == 'nicks':
-                    if len(pinylib.CONFIG.B_NICK_BANS) is 0:
+                    if len(self.nick_bans) is 0:
                         self.send_private_msg('No items in this list.', self.active_user.nick)
                     else:
-                        self.send_private_msg('%s *nicks bans in list.*' % len(pinylib.CONFIG.B_NICK_BANS),
+                        self.send_private_msg('%s *nicks bans in list.*' % len(self.nick_bans),
                                               self.active_user.nick)
 
                 elif list_type.lower() == 'words':
-                    if len(pinylib.CONFIG.B_STRING_BANS) is 0:
+                    if len(self.string_bans) is 0:
                         self.send_private_msg('No items in this list.', self.active_user.nick)
                     else:
-                        self.send_private_msg('%s *string bans in list.*' % pinylib.CONFIG.B_STRING_BANS,
+                        self.send_private_msg('%s *string bans in list.*' % len(self.string_bans),
                                               self.active_user.nick)
 
                 elif list_type.lower() == 'accounts':
-                    if len(pinylib.CONFIG.B_ACCOUNT_BANS) is 0:
+                    if len(self.account_bans) is 0:
                         self.send_private_msg('No items in this list.', self.active_user.nick)
                     else:
-                        self.send_private_msg('%s *account bans in list.*' % pinylib.CONFIG.B_ACCOUNT_BANS,
+                        self.send_private_msg('%s *account bans in list.*' % len(self.account_bans),
                                               self.active_user.nick)
 
                 elif list_type.lower() == 'mods':
@@ -725,6 +755,51 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                 else:
                     self.send_private_msg('No user named: %s' % user_name, self.active_user.nick)
 
+    def do_record(self, user_name):
+        """ Record the broadcast of a user, or list the broadcasts being recorded.
+
+        :param user_name: The nick name of the broadcasting user.
+        :type user_name: str
+        """
+        if len(user_name) is 0:
+            if self.stream_recorder is None or not self.stream_recorder.recordings:
+                self.send_private_msg('Not recording.', self.active_user.nick)
+            else:
+                for recording in self.stream_recorder.recordings.values():
+                    _user = self.users.search_by_id(recording.stream_name)
+                    nick = _user.nick if _user is not None else recording.stream_name
+                    self.send_private_msg('*Recording:* %s %s' % (nick, recording), self.active_user.nick)
+        else:
+            _user = self.users.search(user_name)
+            if _user is None:
+                self.send_private_msg('No user named: %s' % user_name, self.active_user.nick)
+            else:
+                try:
+                    if self.start_recording(_user.id) is None:
+                        self.send_private_msg('*%s* is already being recorded.' % user_name, self.active_user.nick)
+                    else:
+                        self.send_private_msg('*Recording:* %s' % user_name, self.active_user.nick)
+                except IOError as e:
+                    log.error('recording %s failed: %s' % (user_name, e))
+                    self.send_private_msg('Recording failed: %s' % e, self.active_user.nick)
+
+    def do_stop_record(self, user_name):
+        """ Stop recording the broadcast of a user.
+
+        :param user_name: The nick name of the user.
+        :type user_name: str
+        """
+        _user = self.users.search(user_name)
+        if _user is None:
+            self.send_private_msg('No user named: %s' % user_name, self.active_user.nick)
+        else:
+            recording = self.stop_recording(_user.id)
+            if recording is None:
+                self.send_private_msg('*%s* is not being recorded.' % user_name, self.active_user.nick)
+            else:
+                self.send_private_msg('*Stopped recording:* %s (%s)' % (user_name, recording.file_path),
+                                      self.active_user.nick)
+
     # == Tinychat API Command Methods. ==
     def do_spy(self, roomname):
         """ Shows info for a given room.
@@ -736,18 +811,24 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if len(roomname) is 0:
                 self.send_undercover_msg(self.active_user.nick, 'Missing room name.')
             else:
-                spy_info = pinylib.apis.tinychat.spy_info(roomname)
-                if spy_info is None:
-                    self.send_undercover_msg(self.active_user.nick, 'Failed to retrieve information.')
-                elif 'error' in spy_info:
-                    self.send_undercover_msg(self.active_user.nick, spy_info['error'])
-                else:
-                    self.send_bot_msg('*Mods:* %s, *Broadcasters:* %s, *Users:* %s' %
-                                      (spy_info['mod_count'], spy_info['broadcaster_count'],
-                                       spy_info['total_count']))
-                    if self.has_level(3):
-                        users = ', '.join(spy_info['users'])
-                        self.send_undercover_msg(self.active_user.nick, '*' + users + '*')
+                nick = self.active_user.nick
+                show_users = self.has_level(3)
+
+                def reply(spy_info):
+                    if spy_info is None:
+                        self.send_undercover_msg(nick, 'Failed to retrieve information.')
+                    elif 'error' in spy_info:
+                        self.send_undercover_msg(nick, spy_info['error'])
+                    else:
+                        self.send_bot_msg('*Mods:* %s, *Broadcasters:* %s, *Users:* %s' %
+                                          (spy_info['mod_count'], spy_info['broadcaster_count'],
+                                           spy_info['total_count']))
+                        if show_users:
+                            users = ', '.join(spy_info['users'])
+                            self.send_undercover_msg(nick, '*' + users + '*')
+
+                self.when_done(pinylib.apis.tinychat.spy_info_async(roomname, group=self,
+                                                                    timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     def do_account_spy(self, account):
         """
@@ -758,16 +839,21 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if len(account) is 0:
                 self.send_undercover_msg(self.active_user.nick, 'Missing username to search for.')
             else:
-                tc_usr = pinylib.apis.tinychat.user_info(account)
-                if tc_usr is None:
-                    self.send_undercover_msg(self.active_user.nick, 'Could not find tinychat info for: ' + account)
-                else:
-                    self.send_bot_msg('*Account:* ' + '*' + account + '*')
-                    self.send_bot_msg('*Website:* ' + tc_usr['website'])
-                    self.send_bot_msg('*Bio:* ' + tc_usr['biography'])
-                    self.send_bot_msg('*Location:* ' + tc_usr['location'])
-                    self.send_bot_msg('*Last login:* ' + tc_usr['last_active'])
-                    self.send_bot_msg('*Room ID:* ' + tc_usr['tinychat_id'])
+                nick = self.active_user.nick
+
+                def reply(tc_usr):
+                    if tc_usr is None:
+                        self.send_undercover_msg(nick, 'Could not find tinychat info for: ' + account)
+                    else:
+                        self.send_bot_msg('*Account:* ' + '*' + account + '*')
+                        self.send_bot_msg('*Website:* ' + tc_usr['website'])
+                        self.send_bot_msg('*Bio:* ' + tc_usr['biography'])
+                        self.send_bot_msg('*Location:* ' + tc_usr['location'])
+                        self.send_bot_msg('*Last login:* ' + tc_usr['last_active'])
+                        self.send_bot_msg('*Room ID:* ' + tc_usr['tinychat_id'])
+
+                self.when_done(pinylib.apis.tinychat.user_info_async(account, group=self,
+                                                                     timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     def do_room_info(self, room):
         """
@@ -778,11 +864,16 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if len(room) is 0:
                 self.send_undercover_msg(self.active_user.nick, 'Missing room to search for.')
             else:
-                tc_usr = pinylib.apis.tinychat.room_info(room)
-                if tc_usr is None:
-                    self.send_undercover_msg(self.active_user.nick, 'Could not find tinychat info for: ' + room)
-                else:
-                    self.send_bot_msg('*Room ID:* ' + tc_usr['tinychat_id'])
+                nick = self.active_user.nick
+
+                def reply(tc_usr):
+                    if tc_usr is None:
+                        self.send_undercover_msg(nick, 'Could not find tinychat info for: ' + room)
+                    else:
+                        self.send_bot_msg('*Room ID:* ' + tc_usr['tinychat_id'])
+
+                self.when_done(pinylib.apis.tinychat.room_info_async(room, group=self,
+                                                                     timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     # == Other API Command Methods. ==
     def do_search_urban_dictionary(self, search_str):
@@ -795,16 +886,19 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if len(search_str) is 0:
                 self.send_bot_msg('Please specify something to look up.')
             else:
-                urban = other.urbandictionary_search(search_str)
-                if urban is None:
-                    self.send_bot_msg('Could not find a definition for: ' + search_str)
-                else:
-                    if len(urban) > 85:
-                        chunks = pinylib.string_util.chunk_string(urban, 85)
-                        for i in range(0, 3):
-                            self.send_bot_msg(chunks[i])
+                def reply(urban):
+                    if urban is None:
+                        self.send_bot_msg('Could not find a definition for: ' + search_str)
                     else:
-                        self.send_bot_msg(urban)
+                        if len(urban) > 85:
+                            chunks = pinylib.string_util.chunk_string(urban, 85)
+                            for i in range(0, 3):
+                                self.send_bot_msg(chunks[i])
+                        else:
+                            self.send_bot_msg(urban)
+
+                self.when_done(other.urbandictionary_search_async(search_str, group=self,
+                                                                  timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     def do_whois_ip(self, ip_str):
         """ Shows whois info for a given ip address or domain.
@@ -815,42 +909,52 @@ class TinychatBot(pinylib.TinychatRTMPClient):
         if len(ip_str) is 0:
             self.send_bot_msg('Please provide an IP address.')
         else:
-            whois = other.whois(ip_str)
-            if whois is None:
-                self.send_bot_msg('No info found for: %s' % ip_str)
-            else:
-                self.send_bot_msg(whois)
+            def reply(whois):
+                if whois is None:
+                    self.send_bot_msg('No info found for: %s' % ip_str)
+                else:
+                    self.send_bot_msg(whois)
+
+            self.when_done(other.whois_async(ip_str, group=self, timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     def do_advice(self):
         """ Shows a random response from api.adviceslip.com """
-        advised = other.advice()
-        if advised is not None:
-            self.send_bot_msg(advised)
+        def reply(advised):
+            if advised is not None:
+                self.send_bot_msg(advised)
+
+        self.when_done(other.advice_async(group=self, timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     def do_time(self, location):
         """ Shows the time in a location using Time.is. """
-        times = str(other.time_is(location))
         if len(location) is 0:
             self.send_bot_msg(' Please enter a location to fetch the time.')
         else:
-            if times is None:
-                self.send_bot_msg(' We could not fetch the time in "' + str(location) + '".')
-            else:
-                self.send_bot_msg('The time in *' + str(location) + '* is: *' + str(times) + "*")
+            def reply(times):
+                if times is None:
+                    self.send_bot_msg(' We could not fetch the time in "' + str(location) + '".')
+                else:
+                    self.send_bot_msg('The time in *' + str(location) + '* is: *' + str(times) + "*")
+
+            self.when_done(other.time_is_async(location, group=self, timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     def do_translate(self, cmd_arg):
         if len(cmd_arg) is 0:
             self.send_bot_msg("Please enter a query to be translated to English, Example: translate jeg er fantastisk")
         else:
-            translated_reply = other.translate(query=cmd_arg)
-            self.send_bot_msg("In English: " + "*" + translated_reply + "*")
+            def reply(translated_reply):
+                self.send_bot_msg("In English: " + "*" + translated_reply + "*")
+
+            self.when_done(other.translate_async(cmd_arg, group=self, timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     # == Just For Fun Command Methods. ==
     def do_chuck_norris(self):
         """ Shows a chuck norris joke/quote. """
-        chuck = other.chuck_norris()
-        if chuck is not None:
-            self.send_bot_msg(chuck)
+        def reply(chuck):
+            if chuck is not None:
+                self.send_bot_msg(chuck)
+
+        self.when_done(other.chuck_norris_async(group=self, timeout=pinylib.CONFIG.API_TIMEOUT), reply)
 
     def do_8ball(self, question):
         """ Shows magic eight ball answer to a yes/no question.
@@ -979,12 +1083,18 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                 elif pm_cmd == 'cam':
                     threading.Thread(target=self.do_cam_approve).start()
 
+                elif pm_cmd == 'rec':
+                    self.do_record(pm_arg)
+
+                elif pm_cmd == 'stoprec':
+                    self.do_stop_record(pm_arg)
+
                 # Anti-spam
                 elif pm_cmd == 'kick':
-                    threading.Thread(target=self.do_kick, args=(pm_arg,)).start()
+                    self.do_kick(pm_arg)
 
                 elif pm_cmd == 'ban':
-                    threading.Thread(target=self.do_ban, args=(pm_arg,)).start()
+                    self.do_ban(pm_arg)
 
                 elif pm_cmd == 'badnick':
                     self.do_bad_nick(pm_arg)
@@ -1043,13 +1153,14 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if not password:
                 self.privacy_settings.set_room_password()
                 self.send_bot_msg('*The room password was removed.*')
-                pinylib.time.sleep(1)
-                self.send_private_msg('The room password was removed.', self.active_user.nick)
+                pinylib.timer_wheel.schedule(1, self.send_private_msg,
+                                             ('The room password was removed.', self.active_user.nick),
+                                             owner=self, inline=True)
             elif len(password) > 1:
                 self.privacy_settings.set_room_password(password)
                 self.send_private_msg('*The room password is now:* ' + password, self.active_user.nick)
-                pinylib.time.sleep(1)
-                self.send_bot_msg('*The room is now password protected.*')
+                pinylib.timer_wheel.schedule(1, self.send_bot_msg, ('*The room is now password protected.*',),
+                                             owner=self, inline=True)
 
     def do_set_broadcast_pass(self, password):
         """ Set a broadcast password for the room.
@@ -1061,13 +1172,15 @@ class TinychatBot(pinylib.TinychatRTMPClient):
             if not password:
                 self.privacy_settings.set_broadcast_password()
                 self.send_private_msg('*The broadcast password was removed.*', self.active_user.nick)
-                pinylib.time.sleep(1)
-                self.send_private_msg('The broadcast password was removed.', self.active_user.nick)
+                pinylib.timer_wheel.schedule(1, self.send_private_msg,
+                                             ('The broadcast password was removed.', self.active_user.nick),
+                                             owner=self, inline=True)
             elif len(password) > 1:
                 self.privacy_settings.set_broadcast_password(password)
                 self.send_private_msg('*The broadcast password is now:* ' + password, self.active_user.nick)
-                pinylib.time.sleep(1)
-                self.send_private_msg('*Broadcast password is enabled.*', self.active_user.nick)
+                pinylib.timer_wheel.schedule(1, self.send_private_msg,
+                                             ('*Broadcast password is enabled.*', self.active_user.nick),
+                                             owner=self, inline=True)
 
     def do_key(self, new_key):
         """ Shows or sets a new secret key.
@@ -1090,18 +1203,15 @@ class TinychatBot(pinylib.TinychatRTMPClient):
 
     def do_clear_bad_nicks(self):
         """ Clears the bad nicks file. """
-        pinylib.CONFIG.B_NICK_BANS[:] = []
-        pinylib.file_handler.delete_file_content(self.config_path(), pinylib.CONFIG.B_NICK_BANS_FILE_NAME)
+        self.nick_ban_store.clear()
 
     def do_clear_bad_strings(self):
         """ Clears the bad strings file. """
-        pinylib.CONFIG.B_STRING_BANS[:] = []
-        pinylib.file_handler.delete_file_content(self.config_path(), pinylib.CONFIG.B_STRING_BANS_FILE_NAME)
+        self.string_ban_store.clear()
 
     def do_clear_bad_accounts(self):
         """ Clears the bad accounts file. """
-        pinylib.CONFIG.B_ACCOUNT_BANS[:] = []
-        pinylib.file_handler.delete_file_content(self.config_path(), pinylib.CONFIG.B_ACCOUNT_BANS_FILE_NAME)
+        self.account_ban_store.clear()
 
     # == Public PM Command Methods. ==
     def do_opme(self, key):
@@ -1156,7 +1266,7 @@ class TinychatBot(pinylib.TinychatRTMPClient):
     def get_privacy_settings(self):
         """ Parse the privacy settings page. """
         log.info('Parsing %s\'s privacy page. Proxy %s' % (self.account, self._proxy))
-        self.privacy_settings = privacy.Privacy(self._proxy)
+        self.privacy_settings = privacy.Privacy(self._proxy, client=self.http_client)
         self.privacy_settings.parse_privacy_settings()
 
     def config_path(self):
@@ -1172,14 +1282,48 @@ class TinychatBot(pinylib.TinychatRTMPClient):
         :param strings: bool, True load ban strings file.
         """
         if nicks:
-            pinylib.CONFIG.B_NICK_BANS = pinylib.file_handler.file_reader(self.config_path(),
-                                                                          pinylib.CONFIG.B_NICK_BANS_FILE_NAME)
+            self.nick_ban_store.load()
         if accounts:
-            pinylib.CONFIG.B_ACCOUNT_BANS = pinylib.file_handler.file_reader(self.config_path(),
-                                                                             pinylib.CONFIG.B_ACCOUNT_BANS_FILE_NAME)
+            self.account_ban_store.load()
         if strings:
-            pinylib.CONFIG.B_STRING_BANS = pinylib.file_handler.file_reader(self.config_path(),
-                                                                            pinylib.CONFIG.B_STRING_BANS_FILE_NAME)
+            self.string_ban_store.load()
+
+    def load_config_overlay(self):
+        """ Apply the room's config overlay file on top of config.py """
+        changed = self.config_overlay.load(self.config_path(), pinylib.CONFIG.B_CONFIG_OVERLAY_FILE_NAME)
+        if changed:
+            self.console_write(pinylib.COLOR['bright_magenta'], 'Config overlay changed: %s' % ', '.join(changed))
+            if set(changed) & FLOOD_SIZE_KEYS:
+                # The sizes are only read when the detector is created, the message histories start over.
+                self.flood_detector = self.new_flood_detector()
+
+    @staticmethod
+    def new_flood_detector():
+        """ Create a flood detector from the B_FLOOD_* config values.
+
+        :rtype: util.flood.FloodDetector
+        """
+        return flood.FloodDetector(max_msgs=pinylib.CONFIG.B_FLOOD_MAX_MSGS,
+                                   window=pinylib.CONFIG.B_FLOOD_WINDOW,
+                                   max_duplicates=pinylib.CONFIG.B_FLOOD_MAX_DUPLICATES,
+                                   max_history=pinylib.CONFIG.B_FLOOD_HISTORY,
+                                   max_users=pinylib.CONFIG.B_FLOOD_MAX_USERS)
+
+    def start_file_watcher(self):
+        """ Watch the ban files and the config overlay for changes made outside of the bot.
+
+        Changes are applied to the running bot without reconnecting.
+        """
+        if pinylib.CONFIG.B_WATCH_INTERVAL > 0 and not self.file_watcher.is_running:
+            if not self._files_watched:
+                for store in (self.nick_ban_store, self.account_ban_store, self.string_ban_store):
+                    self.file_watcher.watch(store.file_path + store.file_name, store.reload)
+                    self.file_watcher.watch(store.file_path + store.journal_name, store.reload)
+                self.file_watcher.watch(self.config_path() + pinylib.CONFIG.B_CONFIG_OVERLAY_FILE_NAME,
+                                        self.load_config_overlay)
+                self._files_watched = True
+            self.load_config_overlay()
+            self.file_watcher.start()
 
     def has_level(self, level):
         """ Checks the active user for correct user level.
@@ -1219,19 +1363,77 @@ class TinychatBot(pinylib.TinychatRTMPClient):
         :param msg: The chat message.
         :type msg: str
         """
-        was_banned = False
-        chat_words = msg.split(' ')
-        for bad in pinylib.CONFIG.B_STRING_BANS:
-            if bad.startswith('*'):
-                _ = bad.replace('*', '')
-                if _ in msg:
-                    self.send_ban_msg(self.active_user.nick, self.active_user.id)
-                    was_banned = True
-            elif bad in chat_words:
-                self.send_ban_msg(self.active_user.nick, self.active_user.id)
-                was_banned = True
-        if was_banned and pinylib.CONFIG.B_FORGIVE_AUTO_BANS:
+        bad = self.string_bans.search(msg)
+        if bad is None:
+            bad = self.string_bans.match_words(msg.split(' '))
+        if bad is not None:
+            self.send_ban_msg(self.active_user.nick, self.active_user.id)
+            if pinylib.CONFIG.B_FORGIVE_AUTO_BANS:
+                self.send_forgive_msg(self.active_user.id)
+
+    def check_flood(self, msg):
+        """ Checks the active user for message flooding and repeated messages.
+
+        :param msg: The chat message.
+        :type msg: str
+        :return: True if the user was flooding, else False.
+        :rtype: bool
+        """
+        if not pinylib.CONFIG.B_FLOOD_ENABLED:
+            return False
+        if self.active_user.user_level < 5 or self.active_user.id == self._client_id:
+            return False
+
+        result = self.flood_detector.check(self.active_user.id, msg)
+        if result is None:
+            return False
+
+        reason = 'flooding' if result == flood.FLOOD else 'repeating messages'
+        self.console_write(pinylib.COLOR['bright_red'], '%s:%s is %s.' %
+                           (self.active_user.nick, self.active_user.id, reason))
+        action = pinylib.CONFIG.B_FLOOD_ACTION
+        if action == 'ban' and self.is_client_mod:
+            self.send_ban_msg(self.active_user.nick, self.active_user.id)
+            self.send_bot_msg('*Auto-Banned:* (%s)' % reason)
+        elif action == 'kick' and self.is_client_mod:
+            self.send_ban_msg(self.active_user.nick, self.active_user.id)
             self.send_forgive_msg(self.active_user.id)
+            self.send_bot_msg('*Auto-Kicked:* (%s)' % reason)
+        else:
+            self.send_bot_msg('*%s* please stop %s.' % (self.active_user.nick, reason))
+        return True
+
+    def check_raid(self, _user):
+        """ Records a join with the raid detector, and queues a action against the user during a raid.
+
+        During a raid, guests are not evaluated one by one, instead a ban or kick
+        is queued and sent at a rate the server accepts.
+
+        :param _user: The User object of the joining user.
+        :type _user: User
+        :return: True if a action was queued for the user, else False.
+        :rtype: bool
+        """
+        if not pinylib.CONFIG.B_RAID_ENABLED or _user.id == self._client_id:
+            return False
+
+        if self.raid_detector.join(_user.nick):
+            self.console_write(pinylib.COLOR['bright_red'], 'Raid detected, %s joins are queued.' %
+                               pinylib.CONFIG.B_RAID_ACTION)
+            if self.is_client_mod:
+                self.send_bot_msg('*Raid detected:* guests joining now will be %s.' %
+                                  ('banned' if pinylib.CONFIG.B_RAID_ACTION == 'ban' else 'kicked'))
+
+        if self.is_client_mod and self.raid_detector.is_raid() and not _user.account and not _user.is_mod:
+            self.raid_queue.put(_user.id, self._raid_action, _user.nick, _user.id)
+            return True
+        return False
+
+    def _raid_action(self, nick, uid):
+        """ The queued action taken against a user joining during a raid. """
+        self.send_ban_msg(nick, uid)
+        if pinylib.CONFIG.B_RAID_ACTION != 'ban':
+            self.send_forgive_msg(uid)
 
     def check_nick(self, old, user_info):
         """ Check a users nick.
@@ -1253,16 +1455,13 @@ class TinychatBot(pinylib.TinychatRTMPClient):
                         self.send_ban_msg(user_info.nick, user_info.id)
                         self.send_bot_msg('*Auto-Banned:* (wanker detected)')
                         return True
-                if len(pinylib.CONFIG.B_NICK_BANS) > 0:
-                    for bad_nick in pinylib.CONFIG.B_NICK_BANS:
-                        if bad_nick.startswith('*'):
-                            a = bad_nick.replace('*', '')
-                            if a in user_info.nick:
-                                self.send_ban_msg(user_info.nick, user_info.id)
-                                self.send_bot_msg('*Auto-Banned:* (*bad nick)')
-                                return True
-                        elif user_info.nick in pinylib.CONFIG.B_NICK_BANS:
-                            self.send_ban_msg(user_info.nick, user_info.id)
-                            self.send_bot_msg('*Auto-Banned:* (bad nick)')
-                            return True
+                if len(self.nick_bans) > 0:
+                    if self.nick_bans.is_exact(user_info.nick):
+                        self.send_ban_msg(user_info.nick, user_info.id)
+                        self.send_bot_msg('*Auto-Banned:* (bad nick)')
+                        return True
+                    if self.nick_bans.search(user_info.nick) is not None:
+                        self.send_ban_msg(user_info.nick, user_info.id)
+                        self.send_bot_msg('*Auto-Banned:* (*bad nick)')
+                        return True
                 return False
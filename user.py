@@ -4,6 +4,17 @@ import time
 class User:
     """ class representing a users information. """
     def __init__(self, **kwargs):
+        self.update(**kwargs)
+        self.join_time = time.time()
+        self.tinychat_id = None
+        self.last_login = None
+        self.user_level = 5
+        self.is_waiting = False
+        # Extras.
+        self.last_msg = None
+
+    def update(self, **kwargs):
+        """ Set the user info sent by the server, the rest of the user state is kept. """
         self.lf = kwargs.get('lf')
         self.account = kwargs.get('account', '')
         self.is_owner = kwargs.get('own', False)
@@ -15,13 +26,6 @@ class User:
         self.id = kwargs.get('id', -1)
         self.stype = kwargs.get('stype', 0)
         self.is_mod = kwargs.get('mod', False)
-        self.join_time = time.time()
-        self.tinychat_id = None
-        self.last_login = None
-        self.user_level = 5
-        self.is_waiting = False
-        # Extras.
-        self.last_msg = None
 
 
 class Users:
@@ -34,6 +38,8 @@ class Users:
     def __init__(self):
         # Create a dictionary to store each user key value in.
         self._users = dict()
+        # The nicks added since begin_snapshot, None when not reconciling.
+        self._snapshot = None
 
     @property
     def all(self):
@@ -101,17 +107,51 @@ class Users:
         """ Delete all the users. """
         self._users.clear()
 
+    def begin_snapshot(self):
+        """ Start reconciling the users with a new snapshot of the room, e.g after a reconnect.
+
+        Users added during the snapshot that already exist with the same id
+        are updated, keeping the rest of their state (tinychat_id, user_level, last_msg and so on).
+        Users that are not added before end_snapshot are removed.
+        """
+        self._snapshot = set()
+
+    def cancel_snapshot(self):
+        """ Stop reconciling without removing any users, e.g when the connection is lost before the snapshot ended. """
+        self._snapshot = None
+
+    def end_snapshot(self):
+        """ Remove the users that were not added since begin_snapshot.
+
+        :return: The removed User objects.
+        :rtype: list
+        """
+        if self._snapshot is None:
+            return []
+        removed = [self._users.pop(nick) for nick in list(self._users) if nick not in self._snapshot]
+        self._snapshot = None
+        return removed
+
     def add(self, user_info):
         """ Add a user to the users dict.
 
+        A existing user with the same nick but a different id is replaced,
+        the nick now belongs to someone else.
+
         :param user_info Tinychat user info.
         :type user_info: dict
         :return User info object
         :rtype: User
         """
-        if user_info['nick'] not in self.all:
-            self._users[user_info['nick']] = User(**user_info)
-        return self.all[user_info['nick']]
+        nick = user_info['nick']
+        _user = self._users.get(nick)
+        if _user is None or _user.id != user_info.get('id', -1):
+            _user = self._users[nick] = User(**user_info)
+        elif self._snapshot is not None:
+            _user.update(**user_info)
+        if self._snapshot is not None:
+            self._snapshot.add(nick)
+        return _user
 
     def change(self, old_nick, new_nick, user_info):
         """ Change a user nickname.
@@ -128,6 +168,8 @@ class Users:
         if self.delete(old_nick):
             if new_nick not in self.all:
                 self._users[new_nick] = user_info
+                if self._snapshot is not None:
+                    self._snapshot.add(new_nick)
                 return True
             return False
         return False
@@ -0,0 +1,45 @@
+""" Reconnect delays with capped exponential backoff and jitter. """
+import random
+
+
+class Backoff(object):
+    """
+    Capped exponential backoff with full jitter.
+
+    The first retry waits at most first_delay seconds, so a short blip is
+    recovered from quickly. After that the delay is a random value between 0
+    and base * 2^n, capped at cap seconds. The random part keeps many clients
+    that were disconnected at the same time from coming back in lockstep.
+    """
+    def __init__(self, base=10, cap=900, first_delay=1):
+        """ Create a instance of the Backoff class.
+
+        :param base: The delay bound for the second attempt in seconds, doubled for each attempt after that.
+        :type base: int | float
+        :param cap: The maximum delay in seconds.
+        :type cap: int | float
+        :param first_delay: The maximum delay for the first attempt in seconds.
+        :type first_delay: int | float
+        """
+        self.base = base
+        self.cap = cap
+        self.first_delay = first_delay
+        self.attempts = 0
+
+    def next_delay(self):
+        """ The delay before the next attempt.
+
+        :return: The delay in seconds.
+        :rtype: float
+        """
+        if self.attempts == 0:
+            bound = self.first_delay
+        else:
+            # Limit the exponent, the bound is capped long before this anyway.
+            bound = min(self.cap, self.base * 2 ** min(self.attempts - 1, 32))
+        self.attempts += 1
+        return random.uniform(0, bound)
+
+    def reset(self):
+        """ Start over, after a successful attempt. """
+        self.attempts = 0
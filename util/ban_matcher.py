@@ -0,0 +1,278 @@
+""" A matcher for nick, account and string bans. """
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+
+class BanMatcher(object):
+    """
+    Holds a ban list and matches text against it.
+
+    Exact bans are kept in a set. Wildcard bans (bans starting with a *)
+    are compiled in to a Aho-Corasick automaton, so a text can be checked
+    against every wildcard ban in a single pass, no matter how many bans there are.
+
+    The matcher is updated incrementally, adding a ban only extends the trie,
+    removing a ban only deactivates its pattern. The failure links are rebuild
+    lazily the next time a text is searched.
+    """
+    def __init__(self, items=None):
+        """ Create a instance of the BanMatcher class.
+
+        :param items: The initial ban list.
+        :type items: list | None
+        """
+        self._lock = threading.RLock()
+        self._items = []
+        self._item_set = set()
+        self._exact = set()
+        # pattern -> set of ban items using that pattern.
+        self._wildcards = dict()
+        self._reset_automaton()
+        if items is not None:
+            self.load(items)
+
+    def __contains__(self, item):
+        return item in self._item_set
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def items(self):
+        """ All the bans in the order they were added.
+
+        :return: A copy of the ban list.
+        :rtype: list
+        """
+        with self._lock:
+            return list(self._items)
+
+    @staticmethod
+    def is_wildcard(item):
+        """ Check if a ban item is a wildcard ban.
+
+        :param item: The ban item.
+        :type item: str
+        :rtype: bool
+        """
+        return item.startswith('*')
+
+    def load(self, items):
+        """ Replace all bans with a new ban list.
+
+        :param items: The new ban list.
+        :type items: list
+        """
+        with self._lock:
+            exact = set()
+            self._items = []
+            self._item_set.clear()
+            self._wildcards.clear()
+            self._reset_automaton()
+            for item in items:
+                self._add(item, exact)
+            self._exact = exact
+
+    def add(self, item):
+        """ Add a ban.
+
+        :param item: The ban to add.
+        :type item: str
+        :return: True if added, False if the ban already existed.
+        :rtype: bool
+        """
+        with self._lock:
+            return self._add(item, self._exact)
+
+    def remove(self, item):
+        """ Remove a ban.
+
+        :param item: The ban to remove.
+        :type item: str
+        :return: True if removed, False if there was no such ban.
+        :rtype: bool
+        """
+        with self._lock:
+            return self._remove(item, self._exact)
+
+    def clear(self):
+        """ Remove all bans. """
+        self.load([])
+
+    def update(self, added, removed):
+        """ Apply a delta of added and removed bans as a single change.
+
+        A new matcher is built from the resulting ban list and its state is
+        swapped in, the current sets and automaton are never changed,
+        so readers never see a half applied delta.
+
+        :param added: The bans to add.
+        :type added: list
+        :param removed: The bans to remove.
+        :type removed: list
+        """
+        with self._lock:
+            removed = set(removed)
+            matcher = BanMatcher([item for item in self._items if item not in removed] + list(added))
+            self._swap(matcher)
+
+    def _swap(self, matcher):
+        """ Take over the state of another matcher, the exact set is swapped last. """
+        state = dict(matcher.__dict__)
+        del state['_lock']
+        exact = state.pop('_exact')
+        self.__dict__.update(state)
+        self._exact = exact
+
+    def _add(self, item, exact):
+        if not item or item in self._item_set:
+            return False
+        self._items.append(item)
+        self._item_set.add(item)
+        if self.is_wildcard(item):
+            pattern = item.replace('*', '')
+            # An empty pattern would match every text.
+            if pattern:
+                if pattern not in self._wildcards:
+                    self._wildcards[pattern] = set()
+                    self._insert(pattern)
+                self._wildcards[pattern].add(item)
+        else:
+            exact.add(item)
+        return True
+
+    def _remove(self, item, exact):
+        if item not in self._item_set:
+            return False
+        self._items.remove(item)
+        self._item_set.discard(item)
+        if self.is_wildcard(item):
+            pattern = item.replace('*', '')
+            if pattern in self._wildcards:
+                self._wildcards[pattern].discard(item)
+                if not self._wildcards[pattern]:
+                    del self._wildcards[pattern]
+                    self._dead_patterns += 1
+                    if self._dead_patterns > len(self._wildcards):
+                        self._rebuild_trie()
+        else:
+            exact.discard(item)
+        return True
+
+    def is_exact(self, text):
+        """ Check if a text is a exact ban.
+
+        :param text: The text to check, e.g a nick or account name.
+        :type text: str
+        :rtype: bool
+        """
+        return text in self._exact
+
+    def search(self, text):
+        """ Search a text for any wildcard ban pattern.
+
+        :param text: The text to search.
+        :type text: str
+        :return: The first matching pattern found, or None.
+        :rtype: str | None
+        """
+        if not self._wildcards:
+            return None
+        with self._lock:
+            if self._dirty:
+                self._build_links()
+            goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+            node = 0
+            for char in text:
+                while node and char not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(char, 0)
+                hit = node if out[node] is not None else dict_link[node]
+                while hit:
+                    if out[hit] in self._wildcards:
+                        return out[hit]
+                    hit = dict_link[hit]
+            return None
+
+    def match(self, text):
+        """ Match a text against both exact and wildcard bans.
+
+        :param text: The text to match.
+        :type text: str
+        :return: The matching exact ban or wildcard pattern, or None.
+        :rtype: str | None
+        """
+        if text in self._exact:
+            return text
+        return self.search(text)
+
+    def match_words(self, words):
+        """ Check if any of the words is a exact ban.
+
+        :param words: The words to check.
+        :type words: list
+        :return: The first banned word, or None.
+        :rtype: str | None
+        """
+        for word in words:
+            if word in self._exact:
+                return word
+        return None
+
+    # Automaton helpers.
+    def _reset_automaton(self):
+        self._goto = [dict()]
+        self._out = [None]
+        self._fail = [0]
+        self._dict_link = [0]
+        self._dead_patterns = 0
+        self._dirty = False
+
+    def _insert(self, pattern):
+        """ Insert a pattern in to the trie. """
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append(dict())
+                self._out.append(None)
+                self._goto[node][char] = nxt
+            node = nxt
+        self._out[node] = pattern
+        self._dirty = True
+
+    def _rebuild_trie(self):
+        """ Drop the nodes of removed patterns by rebuilding the trie from the active patterns. """
+        log.debug('rebuilding ban trie, dead patterns: %s', self._dead_patterns)
+        self._reset_automaton()
+        for pattern in self._wildcards:
+            self._insert(pattern)
+
+    def _build_links(self):
+        """ Compute the failure and dictionary links breadth first. """
+        goto, out = self._goto, self._out
+        fail = [0] * len(goto)
+        dict_link = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].iteritems():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                target = goto[state].get(char, 0)
+                if target == child:
+                    target = 0
+                fail[child] = target
+                dict_link[child] = target if out[target] is not None else dict_link[target]
+        self._fail = fail
+        self._dict_link = dict_link
+        self._dirty = False
@@ -0,0 +1,260 @@
+""" Persistent storage for ban lists. """
+import logging
+import os
+import threading
+
+import file_handler
+
+log = logging.getLogger(__name__)
+
+# The journal file extension, appended to the ban list file name.
+JOURNAL_EXT = '.journal'
+# The extension of the file locked while changing the ban files, appended to the journal file name.
+LOCK_EXT = '.lock'
+
+OP_ADD = '+'
+OP_REMOVE = '-'
+
+
+def _replay(items, lines):
+    """ Apply journal lines to a ban list.
+
+    :param items: The ban list to apply the lines to, it is changed in place.
+    :type items: list
+    :param lines: Journal lines.
+    :type lines: list
+    :return: The ban list.
+    :rtype: list
+    """
+    seen = set(items)
+    # Removals are applied in one pass at the end, a re-added item keeps its place.
+    removed = set()
+    for line in lines:
+        op, item = line[:1], line[1:]
+        if op == OP_ADD and item:
+            if item in removed:
+                removed.discard(item)
+            elif item not in seen:
+                seen.add(item)
+                items.append(item)
+        elif op == OP_REMOVE and item in seen and item not in removed:
+            removed.add(item)
+    if removed:
+        items[:] = [item for item in items if item not in removed]
+    return items
+
+
+class BanStore(object):
+    """
+    A ban list stored as a snapshot file and a append-only journal.
+
+    The snapshot is the plain ban list text file (one ban per line) as used
+    by earlier versions, so existing ban files are loaded as they are.
+    Every add/remove is appended to the journal as a single line, and once
+    the journal grows large enough it is folded back in to the snapshot,
+    which is replaced with a atomic rename.
+
+    The in-memory state is kept by the BanMatcher given to the store.
+    """
+    def __init__(self, file_path, file_name, matcher, compact_ops=200):
+        """ Create a instance of the BanStore class.
+
+        :param file_path: The path to the ban files.
+        :type file_path: str
+        :param file_name: The file name of the ban list (snapshot).
+        :type file_name: str
+        :param matcher: The matcher holding the bans in memory.
+        :type matcher: util.ban_matcher.BanMatcher
+        :param compact_ops: Compact the journal after this many operations.
+        :type compact_ops: int
+        """
+        self.file_path = file_path
+        self.file_name = file_name
+        self.journal_name = file_name + JOURNAL_EXT
+        self.lock_name = self.journal_name + LOCK_EXT
+        self.matcher = matcher
+        self.compact_ops = compact_ops
+        self._journal_ops = 0
+        # What has been read from disk so far.
+        self._snapshot_stat = None
+        self._journal_offset = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, item):
+        return item in self.matcher
+
+    def __len__(self):
+        return len(self.matcher)
+
+    def read(self):
+        """ Read the snapshot and replay the journal in one pass over each file.
+
+        :return: The ban list.
+        :rtype: list
+        """
+        self._snapshot_stat = self._stat(self.file_name)
+        snapshot = file_handler.file_reader(self.file_path, self.file_name)
+        items = _replay([], [OP_ADD + line for line in snapshot])
+        lines, self._journal_offset = self._read_journal(0)
+        self._journal_ops = len(lines)
+        return _replay(items, lines)
+
+    def load(self):
+        """ Load the ban list from disk in to the matcher. """
+        with self._lock:
+            items = self.read()
+            self.matcher.load(items)
+        log.info('loaded %s bans from %s (%s journal operations)',
+                 len(items), self.file_name, self._journal_ops)
+
+    def reload(self):
+        """ Pick up changes made to the ban files by others and apply them to the matcher.
+
+        Lines appended to the journal are read from where the last read ended.
+        If the snapshot was replaced or the journal was truncated,
+        both files are read again. Either way only the difference is applied to the matcher.
+
+        :return: True if the ban list changed, else False.
+        :rtype: bool
+        """
+        with self._lock:
+            return self._reload()
+
+    def add(self, item):
+        """ Add a ban and append it to the journal.
+
+        :param item: The ban to add.
+        :type item: str
+        :return: True if added, False if the ban already existed.
+        :rtype: bool
+        """
+        with self._lock:
+            if not self.matcher.add(item):
+                return False
+            self._append([OP_ADD + item])
+            return True
+
+    def remove(self, item):
+        """ Remove a ban and append the removal to the journal.
+
+        :param item: The ban to remove.
+        :type item: str
+        :return: True if removed, False if there was no such ban.
+        :rtype: bool
+        """
+        with self._lock:
+            if not self.matcher.remove(item):
+                return False
+            self._append([OP_REMOVE + item])
+            return True
+
+    def clear(self):
+        """ Remove all bans.
+
+        The removals are journaled, so bans others added after them are kept
+        even if the journal can not be compacted right away.
+        """
+        with self._lock:
+            self._reload()
+            items = self.matcher.items
+            self.matcher.clear()
+            if items:
+                self._append([OP_REMOVE + item for item in items])
+            self._compact()
+
+    def compact(self):
+        """ Fold the journal in to the snapshot. """
+        with self._lock:
+            self._compact()
+
+    def _reload(self):
+        journal_size = self._journal_size()
+        if self._stat(self.file_name) != self._snapshot_stat or journal_size < self._journal_offset:
+            items = self.read()
+        else:
+            lines, self._journal_offset = self._read_journal(self._journal_offset)
+            if not lines:
+                return False
+            self._journal_ops += len(lines)
+            items = _replay(self.matcher.items, lines)
+
+        current = set(self.matcher.items)
+        wanted = set(items)
+        added = [item for item in items if item not in current]
+        removed = [item for item in current if item not in wanted]
+        if added or removed:
+            self.matcher.update(added, removed)
+            log.info('reloaded %s, added: %s, removed: %s', self.file_name, len(added), len(removed))
+            return True
+        return False
+
+    def _journal_size(self):
+        stat = self._stat(self.journal_name)
+        return stat[2] if stat is not None else 0
+
+    def _stat(self, file_name):
+        try:
+            st = os.stat(self.file_path + file_name)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime, st.st_size
+
+    def _read_journal(self, offset):
+        """ Read complete journal lines from a offset.
+
+        :return: The lines and the offset after the last complete line.
+        :rtype: tuple
+        """
+        try:
+            with open(self.file_path + self.journal_name, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except IOError:
+            return [], 0
+        # Leave a partially written last line for the next read.
+        end = data.rfind('\n') + 1
+        return data[:end].splitlines(), offset + end
+
+    def _append(self, lines):
+        data = '\n'.join(lines) + '\n'
+        # Other bots may append at any time, but not while the journal is compacted.
+        with file_handler.file_lock(self.file_path, self.lock_name):
+            with open(self.file_path + self.journal_name, 'ab') as f:
+                f.write(data)
+                f.flush()
+                # The end of our own write.
+                end = f.tell()
+        if end - len(data) == self._journal_offset:
+            # Nobody else wrote to the journal, skip our own lines on the next reload.
+            self._journal_offset = end
+        self._journal_ops += len(lines)
+        if self._journal_ops >= self.compact_ops and self._journal_ops > len(self.matcher):
+            self._compact()
+
+    def _compact(self):
+        """ Fold the journal in to the snapshot.
+
+        The journal is shared with other bots using the same ban files, so
+        the ban files are locked while compacting, and lines others appended
+        since the last read are applied before the snapshot is written.
+        The journal is only truncated if nothing was appended by a bot not taking the lock,
+        otherwise compaction is left for a later operation.
+
+        :return: True if compacted, else False.
+        :rtype: bool
+        """
+        with file_handler.file_lock(self.file_path, self.lock_name):
+            self._reload()
+            if self._journal_size() != self._journal_offset:
+                log.debug('%s was appended to while compacting, compaction skipped', self.journal_name)
+                return False
+            # Replaying the journal on top of the new snapshot gives the same result,
+            # so a crash between the rename and the truncate loses nothing.
+            file_handler.atomic_write(self.file_path, self.file_name, self.matcher.items)
+            if os.path.isfile(self.file_path + self.journal_name):
+                file_handler.delete_file_content(self.file_path, self.journal_name)
+        log.debug('compacted %s, journal operations: %s', self.file_name, self._journal_ops)
+        self._snapshot_stat = self._stat(self.file_name)
+        self._journal_offset = 0
+        self._journal_ops = 0
+        return True
@@ -0,0 +1,162 @@
+""" A thread safe TTL/LRU cache with request coalescing. """
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class _Call(object):
+    """ A fetch in progress, other threads asking for the same key wait for it. """
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Cache(object):
+    """
+    A cache for the results of slow lookups, e.g web API requests.
+
+    Entries expire after ttl seconds, and the least recently used entry
+    is dropped when the cache is full. A lookup that found nothing (None)
+    is cached too, but only for negative_ttl seconds.
+
+    get_or_fetch makes sure only one fetch per key is in flight,
+    threads asking for a key that is being fetched wait for that result.
+    Exceptions raised by a fetch are passed on to all the waiting threads, and are not cached.
+    """
+    def __init__(self, name, max_size=1000, ttl=300, negative_ttl=60):
+        """ Create a instance of the Cache class.
+
+        :param name: The name of the cache, used for the metric names.
+        :type name: str
+        :param max_size: The maximum amount of entries.
+        :type max_size: int
+        :param ttl: Seconds a entry is valid.
+        :type ttl: int | float
+        :param negative_ttl: Seconds a None entry is valid.
+        :type negative_ttl: int | float
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # key -> (expires, value)
+        self._entries = OrderedDict()
+        # key -> _Call
+        self._pending = dict()
+        self._lock = threading.Lock()
+        self._hits = metrics.counter('cache.%s.hits' % name)
+        self._negative_hits = metrics.counter('cache.%s.negative_hits' % name)
+        self._misses = metrics.counter('cache.%s.misses' % name)
+        self._coalesced = metrics.counter('cache.%s.coalesced' % name)
+        self._size = metrics.gauge('cache.%s.size' % name)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key, time.time()) is not None
+
+    def get(self, key, default=None):
+        """ Get a valid entry without fetching it.
+
+        :param key: The key.
+        :param default: Returned when there is no valid entry.
+        """
+        with self._lock:
+            entry = self._lookup(key, time.time())
+        if entry is None:
+            return default
+        return entry[1]
+
+    def put(self, key, value):
+        """ Add or replace a entry.
+
+        :param key: The key.
+        :param value: The value, None is cached for negative_ttl seconds.
+        """
+        ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+            self._entries[key] = (time.time() + ttl, value)
+            self._size.set(len(self._entries))
+
+    def invalidate(self, key):
+        """ Drop a entry.
+
+        :param key: The key.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._size.set(len(self._entries))
+
+    def clear(self):
+        """ Drop all entries. """
+        with self._lock:
+            self._entries.clear()
+            self._size.set(0)
+
+    def get_or_fetch(self, key, fetch, *args):
+        """ Get a entry, fetching it if there is no valid entry.
+
+        :param key: The key.
+        :param fetch: The function returning the value for the key.
+        :param args: The arguments for the fetch function.
+        :return: The cached or fetched value.
+        """
+        with self._lock:
+            entry = self._lookup(key, time.time())
+            if entry is not None:
+                if entry[1] is None:
+                    self._negative_hits.inc()
+                else:
+                    self._hits.inc()
+                return entry[1]
+            call = self._pending.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._pending[key] = _Call()
+
+        if not is_leader:
+            self._coalesced.inc()
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        self._misses.inc()
+        try:
+            call.value = fetch(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            self.put(key, call.value)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            call.event.set()
+        return call.value
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            self._size.set(len(self._entries))
+            return None
+        # Mark as most recently used.
+        del self._entries[key]
+        self._entries[key] = entry
+        return entry
@@ -0,0 +1,118 @@
+""" Runtime overrides for the values in config.py """
+import ast
+import logging
+import threading
+
+import file_handler
+
+log = logging.getLogger(__name__)
+
+
+def parse(lines):
+    """
+    Parse overlay lines in the format KEY = value.
+
+    The value must be a python literal, e.g True, 30, 'text' or [1, 2].
+    Empty lines and lines starting with # are ignored.
+    :param lines: list of str lines.
+    :return: dict of key/values.
+    """
+    values = dict()
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if '=' not in line:
+            log.warning('invalid config overlay line: %s' % line)
+            continue
+        key, value = line.split('=', 1)
+        try:
+            values[key.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError) as e:
+            log.warning('invalid config overlay value for %s: %s' % (key.strip(), e))
+    return values
+
+
+class ConfigOverlay(object):
+    """
+    Overrides values of the config module at runtime.
+
+    Only keys that already exist in the config can be overridden,
+    and the new value must have the same type as the original.
+    When a key is dropped from the overlay, its original value is restored.
+    """
+    def __init__(self, config):
+        """ Create a instance of the ConfigOverlay class.
+
+        :param config: The config module.
+        :type config: module
+        """
+        self.config = config
+        # key -> the value the key had before it was overridden.
+        self._originals = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def overrides(self):
+        """ The currently overridden keys and their values.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return dict((key, getattr(self.config, key)) for key in self._originals)
+
+    def apply(self, values):
+        """ Apply a set of overrides, replacing the previous set.
+
+        :param values: key/values to override.
+        :type values: dict
+        :return: The keys that changed value.
+        :rtype: list
+        """
+        changed = []
+        with self._lock:
+            for key in list(self._originals):
+                if key not in values:
+                    setattr(self.config, key, self._originals.pop(key))
+                    changed.append(key)
+
+            for key, value in values.iteritems():
+                if not key.isupper() or not hasattr(self.config, key):
+                    log.warning('unknown config key in overlay: %s' % key)
+                    continue
+                original = self._originals.get(key, getattr(self.config, key))
+                if not self._is_same_type(original, value):
+                    log.warning('config overlay value for %s must be of type %s' %
+                                (key, type(original).__name__))
+                    continue
+                if getattr(self.config, key) != value:
+                    self._originals.setdefault(key, original)
+                    setattr(self.config, key, value)
+                    changed.append(key)
+        if changed:
+            log.info('config overlay changed: %s' % ', '.join(changed))
+        return changed
+
+    def load(self, file_path, file_name):
+        """ Apply the overrides found in a overlay file.
+
+        A missing file means no overrides.
+
+        :param file_path: The path to the overlay file.
+        :type file_path: str
+        :param file_name: The name of the overlay file.
+        :type file_name: str
+        :return: The keys that changed value.
+        :rtype: list
+        """
+        return self.apply(parse(file_handler.file_reader(file_path, file_name)))
+
+    @staticmethod
+    def _is_same_type(original, value):
+        if isinstance(original, bool) or isinstance(value, bool):
+            return type(original) is type(value)
+        if isinstance(original, (int, long, float)):
+            return isinstance(value, (int, long, float))
+        if isinstance(original, basestring):
+            return isinstance(value, basestring)
+        return type(original) is type(value)
@@ -0,0 +1,308 @@
+""" A thread pool running functions in the background, returning futures. """
+import Queue
+import logging
+import threading
+
+import timer_wheel
+
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+CANCELLED = 'cancelled'
+FINISHED = 'finished'
+
+# The amount of worker threads of the default executor.
+WORKERS = 32
+
+_default = None
+_default_lock = threading.Lock()
+
+
+class CancelledError(Exception):
+    """ Raised when getting the result of a cancelled future. """
+    pass
+
+
+class TimeoutError(Exception):
+    """ Raised when a future did not finish in time. """
+    pass
+
+
+class Future(object):
+    """
+    The result of a function running in a executor.
+
+    A future can be cancelled before or while it runs. A function that is
+    already running can not be interrupted, but its result is thrown away
+    and the done callbacks are called right away.
+    """
+    def __init__(self, group=None):
+        self.group = group
+        self._state = PENDING
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return '<Future %s>' % self._state
+
+    def cancelled(self):
+        return self._state == CANCELLED
+
+    def running(self):
+        return self._state == RUNNING
+
+    def done(self):
+        return self._state in (CANCELLED, FINISHED)
+
+    def cancel(self):
+        """ Cancel the future.
+
+        :return: True if cancelled, False if it had already finished.
+        :rtype: bool
+        """
+        with self._condition:
+            if self._state == FINISHED:
+                return False
+            if self._state == CANCELLED:
+                return True
+            self._state = CANCELLED
+            self._condition.notify_all()
+        self._run_callbacks()
+        return True
+
+    def result(self, timeout=None):
+        """ Wait for the result.
+
+        :param timeout: Seconds to wait, None to wait forever.
+        :type timeout: int | float | None
+        :return: The return value of the function, or raises the exception the function raised.
+        """
+        with self._condition:
+            if not self.done():
+                self._condition.wait(timeout)
+            if self._state == CANCELLED:
+                raise CancelledError()
+            if self._state != FINISHED:
+                raise TimeoutError()
+            if self._exception is not None:
+                raise self._exception
+            return self._result
+
+    def exception(self, timeout=None):
+        """ Wait for the function and return the exception it raised.
+
+        :param timeout: Seconds to wait, None to wait forever.
+        :type timeout: int | float | None
+        :return: The exception, or None if the function did not raise.
+        """
+        try:
+            self.result(timeout)
+        except (CancelledError, TimeoutError):
+            raise
+        except Exception as e:
+            return e
+        return None
+
+    def add_done_callback(self, fn):
+        """ Call a function with the future when it is done.
+
+        If the future is already done, the function is called right away.
+        :param fn: The function.
+        """
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        self._call(fn)
+
+    def set_running(self):
+        """ Mark the future as running.
+
+        :return: False if the future was cancelled, and the function should not run.
+        :rtype: bool
+        """
+        with self._condition:
+            if self._state == CANCELLED:
+                return False
+            self._state = RUNNING
+            return True
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exception):
+        self._finish(None, exception)
+
+    def _finish(self, result, exception):
+        with self._condition:
+            if self.done():
+                return
+            self._result = result
+            self._exception = exception
+            self._state = FINISHED
+            self._condition.notify_all()
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        with self._condition:
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            self._call(fn)
+
+    def _call(self, fn):
+        try:
+            fn(self)
+        except Exception as e:
+            log.error('future callback error: %s' % e, exc_info=True)
+
+
+class Executor(object):
+    """
+    Runs functions in a fixed amount of worker threads.
+
+    Futures can be tagged with a group (e.g a client), so all the work
+    for a group can be cancelled at once, for instance when it disconnects.
+    A timeout can be given per function, the future then fails with
+    TimeoutError if the function did not finish in time.
+    """
+    def __init__(self, workers=WORKERS):
+        """ Create a instance of the Executor class.
+
+        :param workers: The maximum amount of worker threads.
+        :type workers: int
+        """
+        self.workers = workers
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._busy = 0
+        self._groups = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """ The amount of queued functions. """
+        return self._queue.qsize()
+
+    def submit(self, func, args=(), kwargs=None, group=None, timeout=None):
+        """ Run a function in a worker thread.
+
+        :param func: The function to run.
+        :param args: The positional arguments for the function.
+        :type args: tuple
+        :param kwargs: The keyword arguments for the function.
+        :type kwargs: dict | None
+        :param group: The group the future belongs to, e.g a client, or None.
+        :param timeout: Seconds before the future fails with TimeoutError, or None.
+        :type timeout: int | float | None
+        :return: The future for the result.
+        :rtype: Future
+        """
+        future = Future(group)
+        with self._lock:
+            if group is not None:
+                self._groups.setdefault(group, set()).add(future)
+            if len(self._threads) < self.workers and self._queue.qsize() >= len(self._threads) - self._busy:
+                t = threading.Thread(target=self._work)
+                t.daemon = True
+                self._threads.append(t)
+                t.start()
+        if group is not None:
+            future.add_done_callback(self._remove_from_group)
+        if timeout is not None:
+            timer = timer_wheel.schedule(timeout, _expire, (future,), name='future timeout', inline=True)
+            future.add_done_callback(lambda f: timer.cancel())
+        self._queue.put((future, func, args, kwargs or {}))
+        return future
+
+    def cancel_group(self, group):
+        """ Cancel all the unfinished futures of a group.
+
+        :param group: The group.
+        :return: The amount of cancelled futures.
+        :rtype: int
+        """
+        with self._lock:
+            futures = list(self._groups.pop(group, ()))
+        cancelled = len([future for future in futures if future.cancel()])
+        if cancelled:
+            log.debug('cancelled %s futures of %s', cancelled, group)
+        return cancelled
+
+    def _work(self):
+        while True:
+            future, func, args, kwargs = self._queue.get()
+            if not future.set_running():
+                continue
+            with self._lock:
+                self._busy += 1
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+
+    def _remove_from_group(self, future):
+        with self._lock:
+            futures = self._groups.get(future.group)
+            if futures is not None:
+                futures.discard(future)
+                if not futures:
+                    del self._groups[future.group]
+
+
+def _expire(future):
+    # Does nothing if the future is already done.
+    future.set_exception(TimeoutError())
+
+
+def get_executor():
+    """ The default executor, created on first use.
+
+    :rtype: Executor
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Executor(WORKERS)
+        return _default
+
+
+def submit(func, args=(), kwargs=None, group=None, timeout=None):
+    """ Run a function in the default executor, see Executor.submit
+
+    :rtype: Future
+    """
+    return get_executor().submit(func, args, kwargs, group, timeout)
+
+
+def background(func):
+    """ Make a function running func in the default executor.
+
+    The new function takes the same arguments as func, and the keyword arguments
+    group and timeout of submit. It returns a future for the result of func.
+    Methods can be wrapped in the class body as well,
+    e.g user_info_async = util.executor.background(user_info)
+
+    :param func: The function to run in the background.
+    :return: The new function.
+    """
+    def run_in_background(*args, **kwargs):
+        group = kwargs.pop('group', None)
+        timeout = kwargs.pop('timeout', None)
+        return submit(func, args, kwargs, group=group, timeout=timeout)
+    run_in_background.__name__ = func.__name__ + '_async'
+    run_in_background.__doc__ = 'Runs %s in the background, see util.executor.background' % func.__name__
+    return run_in_background
+
+
+def cancel_group(group):
+    """ Cancel all the unfinished futures of a group in the default executor.
+
+    :return: The amount of cancelled futures.
+    :rtype: int
+    """
+    return get_executor().cancel_group(group)
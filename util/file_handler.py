@@ -1,6 +1,12 @@
 """ Handles operation related to files. """
 import os
 import logging
+import contextlib
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
 
 log = logging.getLogger(__name__)
 
@@ -75,9 +81,74 @@ def remove_from_file(file_path, file_name, remove):
     if len(file_list) > 0:
         if remove in file_list:
             file_list.remove(remove)
-            delete_file_content(file_path, file_name)
-            for line in file_list:
-                file_writer(file_path, file_name, line)
+            atomic_write(file_path, file_name, file_list)
             return True
         return False
     return False
+
+
+@contextlib.contextmanager
+def file_lock(file_path, file_name):
+    """
+    Hold a exclusive lock shared with other processes, e.g bots using the same files.
+
+    The lock is taken on a separate lock file, so the locked files can still be replaced.
+    The lock is not reentrant, do not take it again while holding it.
+    :param file_path: str the path to the lock file.
+    :param file_name: str the name of the lock file.
+    """
+    if not os.path.exists(file_path):
+        os.makedirs(file_path)
+    with open(file_path + file_name, mode='a+') as f:
+        if os.name == 'nt':
+            f.seek(0)
+            while True:
+                try:
+                    # Gives up after 10 attempts a second apart, keep trying.
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except IOError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(file_path, file_name, lines, mode=None):
+    """
+    Replace the content of a file with a list of lines.
+
+    The lines are written to a temporary file first, which is then
+    renamed over the original file, so readers never see a half written file.
+    :param file_path: str the path to the file.
+    :param file_name: str the name of the file.
+    :param lines: list of str lines to write.
+    :param mode: int the permissions of a new file, e.g 0600, None for the default.
+    """
+    if not os.path.exists(file_path):
+        os.makedirs(file_path)
+    tmp_name = file_path + file_name + '.tmp'
+    if mode is None:
+        f = open(tmp_name, mode='w')
+    else:
+        if os.path.isfile(tmp_name):
+            # Left by a crash, it may have other permissions.
+            os.remove(tmp_name)
+        # Created with the permissions, so the content is never readable by others.
+        f = os.fdopen(os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode), 'w')
+    with f:
+        f.writelines(line + '\n' for line in lines)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.name == 'nt' and os.path.isfile(file_path + file_name):
+        # os.rename does not replace a existing file on windows.
+        os.remove(file_path + file_name)
+    os.rename(tmp_name, file_path + file_name)
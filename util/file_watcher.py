@@ -0,0 +1,110 @@
+""" Watches files for changes by polling their modification time. """
+import logging
+import os
+import threading
+
+log = logging.getLogger(__name__)
+
+
+def file_signature(path):
+    """ Get a signature of a file that changes when the file is changed or replaced.
+
+    :param path: The path to the file.
+    :type path: str
+    :return: A tuple of inode, modification time and size, or None if there is no such file.
+    :rtype: tuple | None
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime, st.st_size
+
+
+class FileWatcher(object):
+    """
+    Polls a set of files and calls the registered callbacks when a file changes.
+
+    Polling the file stats works the same on every platform and costs
+    a stat call per file per interval.
+    """
+    def __init__(self, interval=5):
+        """ Create a instance of the FileWatcher class.
+
+        :param interval: Seconds between each poll.
+        :type interval: int | float
+        """
+        self.interval = interval
+        self._watched = dict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        """ True if the poll thread is running. """
+        return self._thread is not None and self._thread.is_alive()
+
+    def watch(self, path, callback):
+        """ Watch a file.
+
+        The file does not have to exist yet, creating it counts as a change.
+
+        :param path: The path to the file.
+        :type path: str
+        :param callback: Called without arguments when the file changes.
+        """
+        with self._lock:
+            if path not in self._watched:
+                self._watched[path] = [file_signature(path), []]
+            self._watched[path][1].append(callback)
+
+    def unwatch(self, path):
+        """ Stop watching a file.
+
+        :param path: The path to the file.
+        :type path: str
+        """
+        with self._lock:
+            self._watched.pop(path, None)
+
+    def check(self):
+        """ Check all watched files once and call the callbacks of the changed files.
+
+        :return: The paths of the changed files.
+        :rtype: list
+        """
+        changed = []
+        with self._lock:
+            for path in self._watched:
+                signature = file_signature(path)
+                if signature != self._watched[path][0]:
+                    self._watched[path][0] = signature
+                    changed.append((path, list(self._watched[path][1])))
+
+        for path, callbacks in changed:
+            log.debug('file changed: %s', path)
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    log.error('file watcher callback error for %s: %s' % (path, e), exc_info=True)
+        return [path for path, _ in changed]
+
+    def start(self):
+        """ Start polling in a daemon thread. """
+        if not self.is_running:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """ Stop polling. """
+        self._stop_event.set()
+
+    def _run(self):
+        log.info('file watcher started, interval: %s' % self.interval)
+        while not self._stop_event.wait(self.interval):
+            self.check()
+        log.info('file watcher stopped.')
@@ -0,0 +1,123 @@
+""" Per user message flood and duplicate message detection. """
+import time
+import zlib
+from collections import OrderedDict
+
+FLOOD = 'flood'
+DUPLICATE = 'duplicate'
+
+
+class _History(object):
+    """ The recent message history of a single user, kept in fixed size ring buffers. """
+    __slots__ = ('times', 'time_pos', 'hashes', 'hash_pos', 'counts')
+
+    def __init__(self, max_msgs, max_history):
+        self.times = [None] * max_msgs
+        self.time_pos = 0
+        self.hashes = [None] * max_history
+        self.hash_pos = 0
+        # message hash -> times it is in the hashes ring.
+        self.counts = dict()
+
+
+class FloodDetector(object):
+    """
+    Detects users sending too many messages, or the same message over and over.
+
+    Each user has a ring buffer with the time of their last max_msgs messages,
+    if the oldest of those is within the window, the user is flooding.
+    A second ring buffer holds hashes of their last messages with a count per hash,
+    so a repeated message is found without comparing it to the history.
+    Both checks are O(1) per message.
+
+    The number of users tracked is capped, the least recently active users are dropped first.
+    """
+    def __init__(self, max_msgs=6, window=5, max_duplicates=3, max_history=10, max_users=1000):
+        """ Create a instance of the FloodDetector class.
+
+        :param max_msgs: The maximum amount of messages allowed within the window.
+        :type max_msgs: int
+        :param window: The window in seconds.
+        :type window: int | float
+        :param max_duplicates: The amount of identical messages in the history considered a flood.
+        :type max_duplicates: int
+        :param max_history: The amount of recent messages per user checked for duplicates.
+        :type max_history: int
+        :param max_users: The maximum amount of users to keep a history for.
+        :type max_users: int
+        """
+        self.max_msgs = max_msgs
+        self.window = window
+        self.max_duplicates = max_duplicates
+        self.max_history = max_history
+        self.max_users = max_users
+        self._users = OrderedDict()
+
+    def __len__(self):
+        return len(self._users)
+
+    @staticmethod
+    def message_hash(msg):
+        """ Hash a message, ignoring case and whitespace differences.
+
+        :param msg: The message.
+        :type msg: str
+        :rtype: int
+        """
+        normalized = u' '.join(msg.lower().split())
+        return zlib.crc32(normalized.encode('utf-8', 'replace'))
+
+    def check(self, key, msg, now=None):
+        """ Record a message from a user and check it.
+
+        The history of the user is reset after a detection,
+        so a action is only triggered once per flood.
+
+        :param key: A key identifying the user, e.g the user id.
+        :param msg: The message.
+        :type msg: str
+        :param now: The time of the message, defaults to now.
+        :type now: float | None
+        :return: FLOOD, DUPLICATE or None.
+        :rtype: str | None
+        """
+        if now is None:
+            now = time.time()
+        history = self._users.pop(key, None)
+        if history is None:
+            history = _History(self.max_msgs, self.max_history)
+            if len(self._users) >= self.max_users:
+                self._users.popitem(last=False)
+        self._users[key] = history
+
+        oldest = history.times[history.time_pos]
+        history.times[history.time_pos] = now
+        history.time_pos = (history.time_pos + 1) % self.max_msgs
+        if oldest is not None and now - oldest < self.window:
+            self.forget(key)
+            return FLOOD
+
+        msg_hash = self.message_hash(msg)
+        evicted = history.hashes[history.hash_pos]
+        if evicted is not None:
+            history.counts[evicted] -= 1
+            if not history.counts[evicted]:
+                del history.counts[evicted]
+        history.hashes[history.hash_pos] = msg_hash
+        history.hash_pos = (history.hash_pos + 1) % self.max_history
+        history.counts[msg_hash] = history.counts.get(msg_hash, 0) + 1
+        if history.counts[msg_hash] >= self.max_duplicates:
+            self.forget(key)
+            return DUPLICATE
+        return None
+
+    def forget(self, key):
+        """ Drop the history of a user.
+
+        :param key: The key identifying the user.
+        """
+        self._users.pop(key, None)
+
+    def clear(self):
+        """ Drop all histories. """
+        self._users.clear()
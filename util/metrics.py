@@ -0,0 +1,140 @@
+""" A process wide registry of simple counters, gauges and histograms. """
+import bisect
+import threading
+
+_lock = threading.Lock()
+_metrics = dict()
+
+
+class Counter(object):
+    """ A value that only goes up. """
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def report(self):
+        return '%s: %s' % (self.name, self.value)
+
+
+class Gauge(object):
+    """ A value that is set to the current state of something. """
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def report(self):
+        return '%s: %s' % (self.name, self.value)
+
+
+class Histogram(object):
+    """ Counts observed values in to buckets, and keeps the count, sum, min and max. """
+    # Default bucket upper bounds, in milliseconds.
+    BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, name, buckets=None):
+        self.name = name
+        self.buckets = tuple(sorted(buckets or self.BUCKETS))
+        # The last bucket holds the values above the highest bound.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, p):
+        """ The upper bound of the bucket holding the p'th percentile.
+
+        :param p: The percentile, 0-100.
+        :type p: int | float
+        :return: The bucket bound, the max value for the last bucket, or None if nothing was observed.
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            rank = self.count * p / 100.0
+            seen = 0
+            for i, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    return self.buckets[i] if i < len(self.buckets) else self.max
+            return self.max
+
+    def report(self):
+        if not self.count:
+            return '%s: count: 0' % self.name
+        return '%s: count: %s, avg: %.1f, min: %s, p50: %s, p99: %s, max: %s' % \
+               (self.name, self.count, float(self.sum) / self.count, self.min,
+                self.percentile(50), self.percentile(99), self.max)
+
+
+def _get(cls, name, *args):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, *args)
+        elif not isinstance(metric, cls):
+            raise TypeError('metric %s is a %s' % (name, type(metric).__name__))
+        return metric
+
+
+def counter(name):
+    """ Get or create a counter.
+
+    :param name: The name of the counter, e.g cache.tcinfo.hits
+    :type name: str
+    :rtype: Counter
+    """
+    return _get(Counter, name)
+
+
+def gauge(name):
+    """ Get or create a gauge.
+
+    :param name: The name of the gauge.
+    :type name: str
+    :rtype: Gauge
+    """
+    return _get(Gauge, name)
+
+
+def histogram(name, buckets=None):
+    """ Get or create a histogram.
+
+    :param name: The name of the histogram.
+    :type name: str
+    :param buckets: Bucket upper bounds, only used when the histogram is created.
+    :type buckets: tuple | None
+    :rtype: Histogram
+    """
+    return _get(Histogram, name, buckets)
+
+
+def report(prefix=''):
+    """ A line of text per metric, sorted by name.
+
+    :param prefix: Only report the metrics with names starting with this.
+    :type prefix: str
+    :rtype: list
+    """
+    with _lock:
+        metrics = [_metrics[name] for name in sorted(_metrics) if name.startswith(prefix)]
+    return [metric.report() for metric in metrics]
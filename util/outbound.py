@@ -0,0 +1,143 @@
+""" A prioritized, rate limited queue for the messages sent to the server. """
+import heapq
+import logging
+import threading
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Priority classes, lower is sent first.
+MODERATION = 0
+SYSTEM = 1
+CHAT = 2
+
+PRIORITY_NAMES = {MODERATION: 'moderation', SYSTEM: 'system', CHAT: 'chat'}
+
+
+class TokenBucket(object):
+    """ Allows a average rate, with bursts of up to burst at once. """
+    def __init__(self, rate, burst):
+        """ Create a instance of the TokenBucket class.
+
+        :param rate: Tokens added per second.
+        :type rate: int | float
+        :param burst: The maximum amount of tokens.
+        :type burst: int
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.time()
+
+    def take(self):
+        """ Take a token if there is one.
+
+        :return: 0 if a token was taken, else the seconds until there is one.
+        :rtype: float
+        """
+        now = time.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+class OutboundQueue(object):
+    """
+    Sends messages from a single writer thread, highest priority first.
+
+    The sending is rate limited by a token bucket, so bursts of chat replies
+    do not get the client throttled, and can not delay moderation messages.
+    A message that is the same as a message that is still queued is dropped,
+    unless it is queued with coalesce set to False.
+    When the queue holds max_size messages, new chat messages are dropped.
+    """
+    def __init__(self, send, rate=3, burst=6, max_size=200):
+        """ Create a instance of the OutboundQueue class.
+
+        :param send: The function sending a message, called with the process name and parameters.
+        :param rate: The average amount of messages per second.
+        :type rate: int | float
+        :param burst: The maximum amount of messages sent at once.
+        :type burst: int
+        :param max_size: The amount of queued messages before chat messages are dropped.
+        :type max_size: int
+        """
+        self.send = send
+        self.bucket = TokenBucket(rate, burst)
+        self.max_size = max_size
+        self._heap = []
+        self._keys = set()
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def put(self, priority, process_name, parameters=None, coalesce=True):
+        """ Queue a message.
+
+        :param priority: MODERATION, SYSTEM or CHAT.
+        :type priority: int
+        :param process_name: The name of the remote method.
+        :type process_name: str
+        :param parameters: The parameters for the remote method.
+        :type parameters: list | None
+        :param coalesce: Drop the message if the same message is still queued.
+        :type coalesce: bool
+        :return: True if queued, False if dropped.
+        :rtype: bool
+        """
+        key = (process_name, tuple(parameters or ()))
+        with self._condition:
+            if coalesce and key in self._keys:
+                metrics.counter('outbound.coalesced').inc()
+                return False
+            if priority == CHAT and len(self._heap) >= self.max_size:
+                metrics.counter('outbound.dropped').inc()
+                log.warning('outbound queue full, dropping: %s' % process_name)
+                return False
+            self._keys.add(key)
+            # The sequence number keeps the order within a priority.
+            self._seq += 1
+            heapq.heappush(self._heap, (priority, self._seq, key, time.time(), process_name, parameters))
+            metrics.gauge('outbound.queued').set(len(self._heap))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._drain)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+            return True
+
+    def clear(self):
+        """ Drop all queued messages, e.g when the connection is lost. """
+        with self._condition:
+            del self._heap[:]
+            self._keys.clear()
+            metrics.gauge('outbound.queued').set(0)
+
+    def _drain(self):
+        while True:
+            with self._condition:
+                if not self._heap:
+                    self._thread = None
+                    return
+                delay = self.bucket.take()
+                if delay:
+                    # Wait for a token, without popping, a message with a higher priority may be queued meanwhile.
+                    self._condition.wait(delay)
+                    continue
+                priority, _, key, ts, process_name, parameters = heapq.heappop(self._heap)
+                self._keys.discard(key)
+                metrics.gauge('outbound.queued').set(len(self._heap))
+            metrics.histogram('outbound.%s.wait_ms' % PRIORITY_NAMES[priority]).observe((time.time() - ts) * 1000)
+            try:
+                self.send(process_name, parameters)
+                metrics.counter('outbound.sent').inc()
+            except Exception as e:
+                log.error('outbound send error for %s: %s' % (process_name, e), exc_info=True)
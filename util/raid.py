@@ -0,0 +1,173 @@
+""" Join storm (raid) detection and a rate limited queue for moderation actions. """
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+# The nick tinychat gives guests, e.g guest-123456
+GUEST_NICK_PATTERN = re.compile(r'^guest-\d+$', re.IGNORECASE)
+
+
+def nick_shape(nick):
+    """ Reduce a nick to its shape, so nicks made by the same generator look alike.
+
+    Runs of letters become 'a', runs of digits become '0', other characters are kept.
+    e.g raider-12 and spammer-99 both become a-0
+
+    :param nick: The nick to reduce.
+    :type nick: str
+    :return: The shape of the nick.
+    :rtype: str
+    """
+    shape = []
+    for char in nick:
+        if char.isalpha():
+            char = 'a'
+        elif char.isdigit():
+            char = '0'
+        if not shape or shape[-1] != char:
+            shape.append(char)
+    return ''.join(shape)
+
+
+class RaidDetector(object):
+    """
+    Tracks the room wide join rate and how similar the nicks of the joining users are.
+
+    A raid is detected when more than max_joins users join within the window,
+    or when max_similar of them share the same nick shape. Default guest nicks
+    all share a shape, so they only count towards the join rate.
+    Raid mode stays on until no raid has been seen for calm_time seconds.
+    """
+    def __init__(self, max_joins=10, window=10, max_similar=5, calm_time=30):
+        """ Create a instance of the RaidDetector class.
+
+        :param max_joins: The maximum amount of joins allowed within the window.
+        :type max_joins: int
+        :param window: The window in seconds.
+        :type window: int | float
+        :param max_similar: The amount of joins with the same nick shape considered a raid.
+        :type max_similar: int
+        :param calm_time: Seconds without a raid before raid mode is turned off.
+        :type calm_time: int | float
+        """
+        self.max_joins = max_joins
+        self.window = window
+        self.max_similar = max_similar
+        self.calm_time = calm_time
+        self._joins = deque()
+        # nick shape -> joins within the window.
+        self._shapes = dict()
+        self._last_raid = None
+        self._lock = threading.Lock()
+
+    def is_raid(self, now=None):
+        """ Check if raid mode is on.
+
+        :param now: The current time, defaults to now.
+        :type now: float | None
+        :rtype: bool
+        """
+        if now is None:
+            now = time.time()
+        return self._last_raid is not None and now - self._last_raid < self.calm_time
+
+    def join(self, nick, now=None):
+        """ Record a join.
+
+        :param nick: The nick of the joining user.
+        :type nick: str
+        :param now: The time of the join, defaults to now.
+        :type now: float | None
+        :return: True if this join started raid mode, else False.
+        :rtype: bool
+        """
+        if now is None:
+            now = time.time()
+        shape = None if GUEST_NICK_PATTERN.match(nick) else nick_shape(nick)
+        with self._lock:
+            while self._joins and now - self._joins[0][0] >= self.window:
+                _, old_shape = self._joins.popleft()
+                if old_shape is not None:
+                    self._shapes[old_shape] -= 1
+                    if not self._shapes[old_shape]:
+                        del self._shapes[old_shape]
+            self._joins.append((now, shape))
+            similar = 0
+            if shape is not None:
+                similar = self._shapes[shape] = self._shapes.get(shape, 0) + 1
+
+            if len(self._joins) > self.max_joins or similar >= self.max_similar:
+                was_raid = self.is_raid(now)
+                self._last_raid = now
+                if not was_raid:
+                    log.warning('raid detected, joins: %s, similar nicks: %s (%s)',
+                                len(self._joins), similar, shape)
+                return not was_raid
+            return False
+
+
+class ActionQueue(object):
+    """
+    Runs moderation actions one at a time from a single thread, at a fixed rate.
+
+    Actions are queued with a key (e.g the user id), a action already
+    queued for the same key is not queued again.
+    """
+    def __init__(self, rate=2):
+        """ Create a instance of the ActionQueue class.
+
+        :param rate: The maximum amount of actions per second.
+        :type rate: int | float
+        """
+        self.rate = rate
+        self._queue = deque()
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, key, func, *args):
+        """ Queue a action.
+
+        :param key: A key identifying the target of the action.
+        :param func: The function to call.
+        :param args: The arguments for the function.
+        :return: True if queued, False if a action for the key was already queued.
+        :rtype: bool
+        """
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            self._queue.append((key, func, args))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._drain)
+                self._thread.daemon = True
+                self._thread.start()
+            return True
+
+    def clear(self):
+        """ Drop all queued actions. """
+        with self._lock:
+            self._queue.clear()
+            self._keys.clear()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._thread = None
+                    return
+                key, func, args = self._queue.popleft()
+                self._keys.discard(key)
+            try:
+                func(*args)
+            except Exception as e:
+                log.error('queued action error for %s: %s' % (key, e), exc_info=True)
+            time.sleep(1.0 / self.rate)
@@ -0,0 +1,274 @@
+""" A small encrypted key/value store on disk, for login cookies and room configs. """
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import file_handler
+
+log = logging.getLogger(__name__)
+
+# Identifies the file format.
+MAGIC = 'TCS1'
+SALT_SIZE = 16
+NONCE_SIZE = 16
+MAC_SIZE = 32
+# The permissions of the key and cache files, only readable by the owner.
+FILE_MODE = 0600
+# The extension of the file locked while changing a cache file, appended to the cache file name.
+LOCK_EXT = '.lock'
+
+# (file path, file name) -> SessionCache, see get_cache.
+_caches = dict()
+_caches_lock = threading.Lock()
+
+
+class SessionCacheError(Exception):
+    """ Raised when a cache file can not be decrypted. """
+    pass
+
+
+def derive_keys(secret, salt, iterations):
+    """ Derive the encryption key and the MAC key from a secret.
+
+    :param secret: The secret.
+    :type secret: str
+    :param salt: The salt.
+    :type salt: str
+    :param iterations: The amount of PBKDF2 iterations.
+    :type iterations: int
+    :return: The encryption key and the MAC key.
+    :rtype: tuple
+    """
+    key = hashlib.pbkdf2_hmac('sha256', secret, salt, iterations, 64)
+    return key[:32], key[32:]
+
+
+def _keystream(key, nonce, length):
+    blocks = []
+    for counter in xrange((length + 31) // 32):
+        blocks.append(hmac.new(key, nonce + struct.pack('>Q', counter), hashlib.sha256).digest())
+    return ''.join(blocks)[:length]
+
+
+def _xor(data, stream):
+    return ''.join(chr(ord(a) ^ ord(b)) for a, b in zip(data, stream))
+
+
+def encrypt(secret, plaintext, iterations=100000, salt=None, derive=derive_keys):
+    """ Encrypt and authenticate data.
+
+    HMAC-SHA256 in counter mode is used as a stream cipher,
+    followed by a HMAC-SHA256 over the salt, nonce and ciphertext.
+
+    :param secret: The secret.
+    :type secret: str
+    :param plaintext: The data to encrypt.
+    :type plaintext: str
+    :param iterations: The amount of PBKDF2 iterations.
+    :type iterations: int
+    :param salt: The salt, a random salt if None. The nonce is always random.
+    :type salt: str | None
+    :param derive: The key derivation function, with the arguments of derive_keys.
+    :return: The encrypted data.
+    :rtype: str
+    """
+    if salt is None:
+        salt = os.urandom(SALT_SIZE)
+    nonce = os.urandom(NONCE_SIZE)
+    enc_key, mac_key = derive(secret, salt, iterations)
+    ciphertext = _xor(plaintext, _keystream(enc_key, nonce, len(plaintext)))
+    body = MAGIC + salt + nonce + ciphertext
+    return body + hmac.new(mac_key, body, hashlib.sha256).digest()
+
+
+def decrypt(secret, data, iterations=100000, derive=derive_keys):
+    """ Check and decrypt data made by encrypt.
+
+    :param secret: The secret.
+    :type secret: str
+    :param data: The encrypted data.
+    :type data: str
+    :param iterations: The amount of PBKDF2 iterations.
+    :type iterations: int
+    :param derive: The key derivation function, with the arguments of derive_keys.
+    :return: The decrypted data.
+    :rtype: str
+    """
+    header_size = len(MAGIC) + SALT_SIZE + NONCE_SIZE
+    if len(data) < header_size + MAC_SIZE or not data.startswith(MAGIC):
+        raise SessionCacheError('not a session cache file.')
+    body, mac = data[:-MAC_SIZE], data[-MAC_SIZE:]
+    salt = body[len(MAGIC):len(MAGIC) + SALT_SIZE]
+    nonce = body[len(MAGIC) + SALT_SIZE:header_size]
+    enc_key, mac_key = derive(secret, salt, iterations)
+    if not hmac.compare_digest(hmac.new(mac_key, body, hashlib.sha256).digest(), mac):
+        raise SessionCacheError('wrong secret or the file was changed.')
+    ciphertext = body[header_size:]
+    return _xor(ciphertext, _keystream(enc_key, nonce, len(ciphertext)))
+
+
+def load_or_create_secret(file_path, file_name):
+    """ Read a random secret from a key file, creating the file if needed.
+
+    :param file_path: The path to the key file.
+    :type file_path: str
+    :param file_name: The name of the key file.
+    :type file_name: str
+    :return: The secret.
+    :rtype: str
+    """
+    lines = file_handler.file_reader(file_path, file_name)
+    if lines and lines[0]:
+        return lines[0]
+    secret = base64.b64encode(os.urandom(32))
+    file_handler.atomic_write(file_path, file_name, [secret], mode=FILE_MODE)
+    return secret
+
+
+def get_cache(file_path, file_name, secret, iterations=100000):
+    """ The SessionCache of a file, shared by all the clients in the process.
+
+    Changes are merged with the file under a lock, so instances in other processes keep each other's entries.
+
+    :param file_path: The path to the cache file.
+    :type file_path: str
+    :param file_name: The name of the cache file.
+    :type file_name: str
+    :param secret: The secret the keys are derived from, used when the instance is created.
+    :type secret: str
+    :param iterations: The amount of PBKDF2 iterations.
+    :type iterations: int
+    :rtype: SessionCache
+    """
+    with _caches_lock:
+        cache = _caches.get((file_path, file_name))
+        if cache is None:
+            cache = _caches[(file_path, file_name)] = SessionCache(file_path, file_name, secret, iterations)
+        return cache
+
+
+class SessionCache(object):
+    """
+    A key/value store with a expiry time per key, kept encrypted on disk.
+
+    The whole store is read once and written in full on each change,
+    it is meant for a handful of entries such as login cookies and room configs.
+    Bots in other processes may share the file, so a change is written under
+    a file lock, merged with the entries read from the file again.
+    A file that can not be decrypted, e.g because the secret changed, is treated as empty.
+    The keys are derived once, the salt of the file is kept for the writes
+    that follow, and only the nonce changes per write.
+    """
+    def __init__(self, file_path, file_name, secret, iterations=100000):
+        """ Create a instance of the SessionCache class.
+
+        :param file_path: The path to the cache file.
+        :type file_path: str
+        :param file_name: The name of the cache file.
+        :type file_name: str
+        :param secret: The secret the keys are derived from.
+        :type secret: str
+        :param iterations: The amount of PBKDF2 iterations.
+        :type iterations: int
+        """
+        self.file_path = file_path
+        self.file_name = file_name
+        self._secret = secret.encode('utf-8') if isinstance(secret, unicode) else secret
+        self.iterations = iterations
+        self._entries = None
+        # The salt and the keys derived for it.
+        self._salt = None
+        self._keys = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Get a value that has not expired.
+
+        :param key: The key.
+        :type key: str
+        :return: The value or None.
+        """
+        with self._lock:
+            entry = self._load().get(key)
+            if entry is None:
+                return None
+            if entry['expires'] <= time.time():
+                del self._entries[key]
+                return None
+            return entry['value']
+
+    def put(self, key, value, ttl):
+        """ Store a value.
+
+        :param key: The key.
+        :type key: str
+        :param value: A json serializable value.
+        :param ttl: Seconds the value is valid.
+        :type ttl: int | float
+        """
+        with self._lock:
+            self._save({key: {'expires': time.time() + ttl, 'value': value}})
+
+    def delete(self, key):
+        """ Remove a value.
+
+        :param key: The key.
+        :type key: str
+        :return: True if removed, False if there was no such key.
+        :rtype: bool
+        """
+        with self._lock:
+            if key not in self._load():
+                return False
+            self._save({key: None})
+            return True
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def _read(self):
+        """ Read the entries that have not expired from the file. """
+        entries = dict()
+        lines = file_handler.file_reader(self.file_path, self.file_name)
+        if lines:
+            try:
+                data = decrypt(self._secret, base64.b64decode(lines[0]), self.iterations, self._derive)
+                entries = json.loads(data)
+            except (SessionCacheError, TypeError, ValueError) as e:
+                log.warning('ignoring session cache %s: %s' % (self.file_name, e))
+        now = time.time()
+        for key in [key for key in entries if entries[key]['expires'] <= now]:
+            del entries[key]
+        return entries
+
+    def _save(self, changes):
+        """ Write changes merged with the entries others wrote to the file since it was read.
+
+        :param changes: key -> entry, or None to remove the key.
+        :type changes: dict
+        """
+        with file_handler.file_lock(self.file_path, self.file_name + LOCK_EXT):
+            entries = self._read()
+            for key, entry in changes.iteritems():
+                if entry is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = entry
+            data = encrypt(self._secret, json.dumps(entries), self.iterations, self._salt, self._derive)
+            file_handler.atomic_write(self.file_path, self.file_name, [base64.b64encode(data)], mode=FILE_MODE)
+        self._entries = entries
+
+    def _derive(self, secret, salt, iterations):
+        """ derive_keys, the keys are only derived again for a new salt. """
+        if salt != self._salt or self._keys is None:
+            self._keys = derive_keys(secret, salt, iterations)
+            self._salt = salt
+        return self._keys
@@ -0,0 +1,337 @@
+""" A hierarchical timer wheel, running the timers of all clients from one thread. """
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Seconds per tick of the default wheel.
+TICK = 0.1
+
+_default = None
+_default_lock = threading.Lock()
+# The executor module, imported on first use since it imports this module for the future timeouts.
+_executor = None
+
+
+class Timer(object):
+    """ A function scheduled on a TimerWheel. """
+    def __init__(self, wheel, due, func, args, kwargs, owner, name, interval, inline):
+        self.wheel = wheel
+        self.due = due
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.owner = owner
+        self.name = name or getattr(func, '__name__', repr(func))
+        self.interval = interval
+        self.inline = inline
+        self.cancelled = False
+        # The tick the timer is due on, and the (level, slot) it is in.
+        self._tick = None
+        self._where = None
+
+    def __repr__(self):
+        return '<Timer %s in %.1fs%s>' % (self.name, self.remaining,
+                                          ' every %ss' % self.interval if self.interval else '')
+
+    @property
+    def remaining(self):
+        """ Seconds until the timer is due. """
+        return max(0.0, self.due - time.time())
+
+    def cancel(self):
+        """ Cancel the timer.
+
+        :return: True if cancelled, False if it was already cancelled or has run.
+        :rtype: bool
+        """
+        return self.wheel.cancel(self)
+
+
+class TimerWheel(object):
+    """
+    Timers in a hierarchy of wheels, so scheduling, cancelling and
+    advancing a tick take constant time no matter how many timers there are.
+
+    The first wheel has a slot per tick, each next wheel has a slot per
+    revolution of the wheel below it. A timer goes in the lowest wheel its
+    delay fits in, and moves down a wheel each time the wheel below it
+    completes a revolution, until it is due in the first wheel.
+
+    Timers are run in util.executor, or in the wheel thread if inline,
+    which is meant for short functions that do not block.
+    Timers belong to a owner (e.g a client), so all the timers of a owner
+    can be listed, or cancelled when it disconnects.
+    """
+    def __init__(self, tick=TICK, bits=6, levels=4):
+        """ Create a instance of the TimerWheel class.
+
+        :param tick: Seconds per tick, the timer resolution.
+        :type tick: float
+        :param bits: The slots per wheel as a power of 2.
+        :type bits: int
+        :param levels: The amount of wheels, delays longer than all the wheels are moved down as they get closer.
+        :type levels: int
+        """
+        self.tick = tick
+        self.bits = bits
+        self.levels = levels
+        self._size = 1 << bits
+        self._mask = self._size - 1
+        self._wheels = [[set() for _ in xrange(self._size)] for _ in xrange(levels)]
+        self._owners = dict()
+        self._count = 0
+        self._start = time.time()
+        # The next tick to process.
+        self._base = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        """ The amount of pending timers. """
+        return self._count
+
+    def schedule(self, delay, func, args=(), kwargs=None, owner=None, name=None, inline=False):
+        """ Run a function after a delay.
+
+        :param delay: Seconds before the function runs.
+        :type delay: int | float
+        :param func: The function.
+        :param args: The positional arguments for the function.
+        :type args: tuple
+        :param kwargs: The keyword arguments for the function.
+        :type kwargs: dict | None
+        :param owner: The owner of the timer, e.g a client, or None.
+        :param name: A name to show when inspecting the timers, defaults to the function name.
+        :type name: str | None
+        :param inline: Run the function in the wheel thread instead of util.executor.
+        :type inline: bool
+        :rtype: Timer
+        """
+        timer = Timer(self, time.time() + delay, func, args, kwargs or {}, owner, name, None, inline)
+        self._add(timer)
+        return timer
+
+    def schedule_periodic(self, interval, func, args=(), kwargs=None, owner=None, name=None,
+                          first_delay=None, inline=False):
+        """ Run a function every interval seconds, until the timer is cancelled.
+
+        :param interval: Seconds between runs.
+        :type interval: int | float
+        :param first_delay: Seconds before the first run, defaults to interval.
+        :type first_delay: int | float | None
+        :rtype: Timer
+        """
+        if first_delay is None:
+            first_delay = interval
+        timer = Timer(self, time.time() + first_delay, func, args, kwargs or {}, owner, name, interval, inline)
+        self._add(timer)
+        return timer
+
+    def cancel(self, timer):
+        """ Cancel a timer.
+
+        :param timer: The timer.
+        :type timer: Timer
+        :return: True if cancelled, False if it was already cancelled or has run.
+        :rtype: bool
+        """
+        with self._condition:
+            if timer.cancelled or timer._where is None:
+                timer.cancelled = True
+                return False
+            timer.cancelled = True
+            self._remove(timer)
+            return True
+
+    def cancel_owner(self, owner):
+        """ Cancel all the timers of a owner.
+
+        :param owner: The owner.
+        :return: The amount of cancelled timers.
+        :rtype: int
+        """
+        with self._condition:
+            timers = list(self._owners.get(owner, ()))
+            for timer in timers:
+                timer.cancelled = True
+                self._remove(timer)
+        if timers:
+            log.debug('cancelled %s timers of %s', len(timers), owner)
+        return len(timers)
+
+    def pending(self, owner=None):
+        """ The pending timers, soonest first.
+
+        :param owner: Only the timers of this owner, or None for all timers.
+        :return: The timers.
+        :rtype: list
+        """
+        with self._condition:
+            if owner is not None:
+                timers = list(self._owners.get(owner, ()))
+            else:
+                timers = [timer for wheel in self._wheels for slot in wheel for timer in slot]
+        return sorted(timers, key=lambda t: t.due)
+
+    def _now_tick(self):
+        return int((time.time() - self._start) / self.tick)
+
+    def _add(self, timer):
+        with self._condition:
+            if self._count == 0:
+                # The wheel thread does not advance while there are no timers.
+                self._base = max(self._base, self._now_tick())
+            # Round up, a timer never runs early.
+            timer._tick = max(self._base, int((timer.due - self._start) / self.tick + 0.999999))
+            self._insert(timer)
+            self._owners.setdefault(timer.owner, set()).add(timer)
+            self._count += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _insert(self, timer):
+        delta = timer._tick - self._base
+        for level in xrange(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                slot = (timer._tick >> (self.bits * level)) & self._mask
+                break
+        else:
+            # Further away than the top wheel reaches, park it in the last slot
+            # of the top wheel, it is placed again when that slot comes around.
+            level = self.levels - 1
+            slot = ((self._base >> (self.bits * level)) - 1) & self._mask
+        self._wheels[level][slot].add(timer)
+        timer._where = (level, slot)
+
+    def _remove(self, timer):
+        if timer._where is not None:
+            level, slot = timer._where
+            self._wheels[level][slot].discard(timer)
+            timer._where = None
+            self._count -= 1
+        owned = self._owners.get(timer.owner)
+        if owned is not None:
+            owned.discard(timer)
+            if not owned:
+                del self._owners[timer.owner]
+
+    def _advance(self):
+        """ Process the next tick, return the timers that are due. """
+        base = self._base
+        level = 1
+        # Each time a wheel completes a revolution, move the timers of the next slot of the wheel above down.
+        while level < self.levels and (base >> (self.bits * (level - 1))) & self._mask == 0:
+            slot = (base >> (self.bits * level)) & self._mask
+            timers = self._wheels[level][slot]
+            self._wheels[level][slot] = set()
+            for timer in timers:
+                self._insert(timer)
+            level += 1
+        due = self._wheels[0][base & self._mask]
+        self._wheels[0][base & self._mask] = set()
+        self._base += 1
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._count == 0:
+                    # Nothing to move down or run, skip ahead to the current tick.
+                    self._base = max(self._base, self._now_tick())
+                    self._condition.wait()
+                    continue
+                due = []
+                now_tick = self._now_tick()
+                while self._base <= now_tick:
+                    for timer in self._advance():
+                        timer._where = None
+                        self._count -= 1
+                        if timer.interval:
+                            timer.due += timer.interval
+                            timer._tick = max(self._base, int((timer.due - self._start) / self.tick + 0.999999))
+                            self._insert(timer)
+                            self._count += 1
+                        else:
+                            self._remove(timer)
+                        due.append(timer)
+                if not due:
+                    self._condition.wait(self._start + self._base * self.tick - time.time())
+            for timer in due:
+                self._call(timer)
+
+    @staticmethod
+    def _call(timer):
+        # Cancelled after it was collected as due.
+        if timer.cancelled:
+            return
+        if timer.inline:
+            try:
+                timer.func(*timer.args, **timer.kwargs)
+            except Exception as e:
+                log.error('timer %s error: %s' % (timer.name, e), exc_info=True)
+        else:
+            future = _get_executor().submit(timer.func, timer.args, timer.kwargs, group=timer.owner)
+            future.add_done_callback(lambda f: _log_error(timer, f))
+
+
+def _log_error(timer, future):
+    if not future.cancelled() and future.exception() is not None:
+        log.error('timer %s error: %s' % (timer.name, future.exception()))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        import executor
+        _executor = executor
+    return _executor
+
+
+def get_wheel():
+    """ The default timer wheel, created on first use.
+
+    :rtype: TimerWheel
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = TimerWheel(TICK)
+        return _default
+
+
+def schedule(delay, func, args=(), kwargs=None, owner=None, name=None, inline=False):
+    """ Run a function after a delay on the default wheel, see TimerWheel.schedule
+
+    :rtype: Timer
+    """
+    return get_wheel().schedule(delay, func, args, kwargs, owner, name, inline)
+
+
+def schedule_periodic(interval, func, args=(), kwargs=None, owner=None, name=None, first_delay=None, inline=False):
+    """ Run a function periodically on the default wheel, see TimerWheel.schedule_periodic
+
+    :rtype: Timer
+    """
+    return get_wheel().schedule_periodic(interval, func, args, kwargs, owner, name, first_delay, inline)
+
+
+def cancel_owner(owner):
+    """ Cancel all the timers of a owner on the default wheel.
+
+    :return: The amount of cancelled timers.
+    :rtype: int
+    """
+    return get_wheel().cancel_owner(owner)
+
+
+def pending(owner=None):
+    """ The pending timers on the default wheel, soonest first.
+
+    :rtype: list
+    """
+    return get_wheel().pending(owner)
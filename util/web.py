@@ -1,162 +1,320 @@
-""" Contains functions to make http GET and http POST with. version 0.0.6 """
+""" Contains functions to make http GET and http POST with. version 0.0.7 """
 import time
 import logging
+import threading
+import urlparse
 import requests
+from requests.adapters import HTTPAdapter
 from requests.utils import quote, unquote
 
+import executor
+import metrics
+
 __all__ = ['quote', 'unquote']
 
 log = logging.getLogger(__name__)
 
+# The header used for all requests, built once.
+DEFAULT_HEADER = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:44.0) Gecko/20100101 Firefox/50.0',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# Response status codes a GET is retried on.
+RETRY_STATUS_CODES = (502, 503, 504)
+
+# The connection pool sizes of new clients, set from the config by pinylib.
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 20
 
-#  A session that all requests will use...apparently not.
-__request_session = requests.session()
+_clients = dict()
+_clients_lock = threading.Lock()
 
 
-def is_cookie_expired(cookie_name):
+class HttpClient(object):
     """
-    Check if a cookie is expired.
+    A http client with its own connection pools and cookie jar.
 
-    :param cookie_name: str the name of the cookie to check.
-    :return: True if expired else False or None if no cookie by that name was found.
+    The connections are pooled per host, and the pools are sized so that
+    many threads can make requests to the same host at once.
+    GET requests are retried with a exponential backoff on connection errors,
+    timeouts and gateway errors, POST requests are never retried.
+
+    The latency of every request is recorded per host in util.metrics.
     """
-    if cookie_name:
-        expires = int
-        timestamp = int(time.time())
-        for cookie in __request_session.cookies:
-            if cookie.name == cookie_name:
-                expires = cookie.expires
+    def __init__(self, name, pool_connections=None, pool_maxsize=None, max_retries=2, backoff=0.5):
+        """ Create a instance of the HttpClient class.
+
+        :param name: The name of the client, e.g a account or room name.
+        :type name: str
+        :param pool_connections: The amount of hosts to keep a connection pool for, defaults to POOL_CONNECTIONS.
+        :type pool_connections: int | None
+        :param pool_maxsize: The maximum amount of connections kept per host, defaults to POOL_MAXSIZE.
+        :type pool_maxsize: int | None
+        :param max_retries: The amount of times a GET is retried.
+        :type max_retries: int
+        :param backoff: Seconds to wait before the first retry, doubled for each retry.
+        :type backoff: int | float
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.session()
+        adapter = HTTPAdapter(pool_connections=pool_connections or POOL_CONNECTIONS,
+                              pool_maxsize=pool_maxsize or POOL_MAXSIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def cookies(self):
+        """ The cookie jar of the client. """
+        return self.session.cookies
+
+    def is_cookie_expired(self, cookie_name):
+        """
+        Check if a cookie is expired.
+
+        :param cookie_name: str the name of the cookie to check.
+        :return: True if expired else False or None if no cookie by that name was found.
+        """
+        if cookie_name:
+            timestamp = int(time.time())
+            for cookie in self.session.cookies:
+                if cookie.name == cookie_name:
+                    expires = cookie.expires
+                    break
             else:
                 return None
-        if timestamp > expires:
-            log.debug('cookie[\'%s\'] is expired. time stamp: %s, expires: %s' %
-                      (cookie_name, timestamp, expires))
+            if expires is not None and timestamp > expires:
+                log.debug('cookie[\'%s\'] is expired. time stamp: %s, expires: %s',
+                          cookie_name, timestamp, expires)
+                return True
+            log.debug('cookie[\'%s\'] is not expired. time stamp: %s, expires: %s',
+                      cookie_name, timestamp, expires)
+            return False
+
+    def delete_cookie(self, cookie_name):
+        """
+        Delete a cookie by name.
+        :param cookie_name: str the cookie name.
+        :return: True if deleted else False
+        """
+        if cookie_name in self.session.cookies:
+            del self.session.cookies[cookie_name]
+            log.debug('deleting cookie: %s session cookies: %s', cookie_name, self.session.cookies)
             return True
-        log.debug('cookie[\'%s\'] is not expired. time stamp: %s, expires: %s' %
-                  (cookie_name, timestamp, expires))
         return False
 
+    def has_cookie(self, cookie_name):
+        """
+        Check a cookie by name to see if it exist.
+        :param cookie_name: str the name of the cookie.
+        :return: object request.session.cookie[cookie_name] or False if no cookie.
+        """
+        if cookie_name in self.session.cookies:
+            log.debug('cookie found: %s', self.session.cookies[cookie_name])
+            return self.session.cookies[cookie_name]
+        log.debug('no cookie named: %s found.', cookie_name)
+        return False
+
+    def export_cookies(self, names):
+        """
+        Export cookies, so they can be stored and imported again later.
+        :param names: list of cookie names.
+        :return: list of dicts, one per cookie found.
+        """
+        return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+                 'path': cookie.path, 'expires': cookie.expires, 'secure': cookie.secure}
+                for cookie in self.session.cookies if cookie.name in names]
+
+    def import_cookies(self, cookies):
+        """
+        Import cookies exported with export_cookies.
+        :param cookies: list of cookie dicts.
+        """
+        for cookie in cookies:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'],
+                                     path=cookie['path'], expires=cookie['expires'], secure=cookie['secure'])
+
+    def request(self, method, url, retries=0, **kwargs):
+        """ Make a request, recording the latency.
+
+        :param method: The http method.
+        :type method: str
+        :param url: The url.
+        :type url: str
+        :param retries: The amount of times to retry on connection errors, timeouts and gateway errors.
+        :type retries: int
+        :param kwargs: Keyword arguments for requests.Session.request
+        :return: The response.
+        :rtype: requests.Response
+        """
+        host = urlparse.urlparse(url).netloc
+        latency = metrics.histogram('http.%s.latency_ms' % host)
+        attempt = 0
+        while True:
+            ts = time.time()
+            try:
+                response = self.session.request(method=method, url=url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                metrics.counter('http.%s.errors' % host).inc()
+                if attempt >= retries:
+                    raise
+            else:
+                latency.observe((time.time() - ts) * 1000)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                    return response
+            metrics.counter('http.%s.retries' % host).inc()
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+            log.debug('retrying %s %s, attempt: %s', method, url, attempt)
+
+    def get(self, url, **kwargs):
+        json = kwargs.get('json', False)
+        proxy = kwargs.get('proxy', '')
+        header = kwargs.get('header')
+        timeout = kwargs.get('timeout', 20)
+        referer = kwargs.get('referer')
+
+        headers = _build_header(header, referer)
+
+        if proxy:
+            proxy = {'http': 'http://' + proxy}
+
+        gr = None
+        json_response = None
+
+        try:
+            gr = self.request('GET', url, retries=self.max_retries, headers=headers,
+                              proxies=proxy, timeout=timeout)
+            if json:
+                json_response = gr.json()
+        except ValueError as ve:
+            log.error('error while decoding %s to json: %s' % (url, ve))
+        except (requests.ConnectionError, requests.RequestException) as re:
+            log.error('http_get error: %s' % re)
+        finally:
+            log.debug('cookies: %s', self.session.cookies)
+            if gr is None:
+                return dict(content=None, json=None,
+                            cookies=None, headers=None, status_code=None)
+            else:
+                return dict(content=gr.text, json=json_response,
+                            cookies=gr.cookies, headers=gr.headers, status_code=gr.status_code)
+
+    def post(self, post_url, post_data, **kwargs):
+        json = kwargs.get('json', False)
+        proxy = kwargs.get('proxy', '')
+        header = kwargs.get('header')
+        timeout = kwargs.get('timeout', 20)
+        referer = kwargs.get('referer')
+        stream = kwargs.get('is_stream', False)
+        redirect = kwargs.get('follow_redirect', False)
+
+        if not post_url:
+            raise ValueError('no post_url provided. post_url=%s' % post_url)
+        elif proxy and type(proxy) is not str:
+            raise TypeError('proxy must be of type str and in the format ip:port. proxy type=%s'
+                            % type(proxy))
+        else:
+            headers = _build_header(header, referer)
+
+            if proxy:
+                proxy = {'http': 'http://' + proxy}
+
+            pr = None
+            json_response = None
 
-def delete_cookie(cookie_name):
+            try:
+                pr = self.request('POST', post_url, data=post_data, headers=headers,
+                                  allow_redirects=redirect, proxies=proxy, timeout=timeout, stream=stream)
+                if json:
+                    json_response = pr.json()
+            except ValueError as ve:
+                log.error('error while decoding %s to json: %s' % (post_url, ve))
+            except (requests.HTTPError, requests.RequestException) as pe:
+                log.error('http_post error %s' % pe)
+            finally:
+                log.debug('cookies: %s', self.session.cookies)
+                if pr is None:
+                    return dict(content=None, json=None,
+                                cookies=None, headers=None, status_code=None)
+                else:
+                    return dict(content=pr.text, json=json_response,
+                                cookies=pr.cookies, headers=pr.headers, status_code=pr.status_code)
+
+
+def _build_header(header, referer):
+    """ The request header, the default header is only copied when something is added to it. """
+    if referer is None and (header is None or type(header) is not dict):
+        return DEFAULT_HEADER
+    _header = DEFAULT_HEADER.copy()
+    if referer is not None:
+        _header['Referer'] = referer
+    if header is not None and type(header) is dict:
+        _header.update(header)
+    return _header
+
+
+def get_client(name=None):
+    """
+    Get the client for a name, creating it if needed.
+
+    Each client has its own cookie jar, so separate clients are used
+    for each account or room, while the api modules use the default client.
+    :param name: str the client name, None for the default client.
+    :return: HttpClient
+    """
+    name = name or 'default'
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = HttpClient(name)
+        return _clients[name]
+
+
+def is_cookie_expired(cookie_name, client=None):
+    """
+    Check if a cookie is expired.
+
+    :param cookie_name: str the name of the cookie to check.
+    :param client: HttpClient the client to check, defaults to the default client.
+    :return: True if expired else False or None if no cookie by that name was found.
+    """
+    return (client or get_client()).is_cookie_expired(cookie_name)
+
+
+def delete_cookie(cookie_name, client=None):
     """
     Delete a cookie by name.
     :param cookie_name: str the cookie name.
+    :param client: HttpClient the client to delete the cookie from, defaults to the default client.
     :return: True if deleted else False
     """
-    if cookie_name in __request_session.cookies:
-        del __request_session.cookies[cookie_name]
-        log.debug('deleting cookie: %s session cookies: %s' % (cookie_name, __request_session.cookies))
-        return True
-    return False
+    return (client or get_client()).delete_cookie(cookie_name)
 
 
-def has_cookie(cookie_name):
+def has_cookie(cookie_name, client=None):
     """
     Check a cookie by name to see if it exist.
     :param cookie_name: str the name of the cookie.
+    :param client: HttpClient the client to check, defaults to the default client.
     :return: object request.session.cookie[cookie_name] or False if no cookie.
      """
-    if cookie_name in __request_session.cookies:
-        log.debug('cookie found: %s' % __request_session.cookies[cookie_name])
-        return __request_session.cookies[cookie_name]
-    log.debug('no cookie named: %s found.' % cookie_name)
-    return False
+    return (client or get_client()).has_cookie(cookie_name)
 
 
 def http_get(url, **kwargs):
-    json = kwargs.get('json', False)
-    proxy = kwargs.get('proxy', '')
-    header = kwargs.get('header')
-    timeout = kwargs.get('timeout', 20)
-    referer = kwargs.get('referer')
-
-    default_header = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:44.0) Gecko/20100101 Firefox/50.0',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate',
-        'Connection': 'keep-alive',
-    }
-
-    if referer is not None:
-        default_header['Referer'] = referer
-
-    if header is not None and type(header) is dict:
-        default_header.update(header)
-
-    if proxy:
-        proxy = {'http': 'http://' + proxy}
-
-    gr = None
-    json_response = None
-
-    try:
-        gr = __request_session.request(method='GET', url=url, headers=default_header, proxies=proxy, timeout=timeout)
-        if json:
-            json_response = gr.json()
-    except ValueError as ve:
-        log.error('error while decoding %s to json: %s' % (url, ve))
-    except (requests.ConnectionError, requests.RequestException) as re:
-        log.error('http_get error: %s' % re)
-    finally:
-        log.debug('cookies: %s' % __request_session.cookies)
-        if gr is None:
-            return dict(content=None, json=None,
-                        cookies=None, headers=None, status_code=None)
-        else:
-            return dict(content=gr.text, json=json_response,
-                        cookies=gr.cookies, headers=gr.headers, status_code=gr.status_code)
+    client = kwargs.pop('client', None) or get_client()
+    return client.get(url, **kwargs)
 
 
 def http_post(post_url, post_data, **kwargs):
-    json = kwargs.get('json', False)
-    proxy = kwargs.get('proxy', '')
-    header = kwargs.get('header')
-    timeout = kwargs.get('timeout', 20)
-    referer = kwargs.get('referer')
-    stream = kwargs.get('is_stream', False)
-    redirect = kwargs.get('follow_redirect', False)
-
-    default_header = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:44.0) Gecko/20100101 Firefox/50.0',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate',
-        'Connection': 'keep-alive',
-    }
+    client = kwargs.pop('client', None) or get_client()
+    return client.post(post_url, post_data, **kwargs)
 
-    if referer is not None:
-        default_header['Referer'] = referer
-
-    if not post_url:
-        raise ValueError('no post_url provided. post_url=%s' % post_url)
-    elif proxy and type(proxy) is not str:
-        raise TypeError('proxy must be of type str and in the format ip:port. proxy type=%s'
-                        % type(proxy))
-    else:
-        if header is not None and type(header) is dict:
-            default_header.update(header)
-
-        if proxy:
-            proxy = {'http': 'http://' + proxy}
 
-        pr = None
-        json_response = None
-
-        try:
-            pr = __request_session.request(method='POST', url=post_url, data=post_data, headers=default_header,
-                                          allow_redirects=redirect, proxies=proxy, timeout=timeout, stream=stream)
-            if json:
-                json_response = pr.json()
-        except ValueError as ve:
-            log.error('error while decoding %s to json: %s' % (post_url, ve))
-        except (requests.HTTPError, requests.RequestException) as pe:
-            log.error('http_post error %s' % pe)
-        finally:
-            log.debug('cookies: %s' % __request_session.cookies)
-            if pr is None:
-                return dict(content=None, json=None,
-                            cookies=None, headers=None, status_code=None)
-            else:
-                return dict(content=pr.text, json=json_response,
-                            cookies=pr.cookies, headers=pr.headers, status_code=pr.status_code)
+http_get_async = executor.background(http_get)
+http_post_async = executor.background(http_post)